@@ -0,0 +1,250 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from db import cache
+from db import metrics
+from db import wide as wide_store
+from export import text_traits
+
+# RCBD statistics for every active number trait of a location at once. The
+# trait values are one plots x traits matrix (NaN where missing) and every
+# step below works on the whole matrix: group sums are one sort + reduceat, the
+# block effects come from the reduced normal equations (blocks x blocks per
+# trait, solved as one batch), so missing plots need no per-trait refit.
+#
+# Model per trait: y = treatment + block + error, blocks (replications by
+# default) fitted first. Sums of squares are sequential: Block unadjusted,
+# Treatment adjusted for blocks; with complete data they are the classical
+# RCBD table.
+SOURCE_TABLES = ["experiment_metadata", "experiment_traits", "observation_data"]
+MAX_RESULTS = 16
+
+_lock = threading.Lock()
+_results = OrderedDict()
+
+
+class _Groups:
+    # Row -> group codes, sorted once so every group sum is a reduceat
+    def __init__(self, codes, size):
+        self.order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[self.order]
+        self.starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        self.present = sorted_codes[self.starts]
+        self.size = size
+
+    def sum(self, x):
+        out = np.zeros((self.size,) + x.shape[1:])
+        out[self.present] = np.add.reduceat(x[self.order], self.starts, axis=0)
+        return out
+
+
+# -- F distribution ----------------------------------------------------
+# p-values without SciPy: regularized incomplete beta by continued fraction
+
+def _betacf(a, b, x, iters=300, eps=1e-14):
+    tiny = 1e-300
+
+    def clamp(v):
+        return np.where(np.abs(v) < tiny, tiny, v)
+
+    c = np.ones_like(x)
+    d = 1 / clamp(1 - (a + b) * x / (a + 1))
+    h = d.copy()
+    for m in range(1, iters + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((a - 1 + m2) * (a + m2))
+        d = 1 / clamp(1 + aa * d)
+        c = clamp(1 + aa / c)
+        h *= d * c
+        aa = -(a + m) * (a + b + m) * x / ((a + m2) * (a + 1 + m2))
+        d = 1 / clamp(1 + aa * d)
+        c = clamp(1 + aa / c)
+        delta = d * c
+        h *= delta
+        if np.all(np.abs(delta - 1) < eps):
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    lgamma = np.vectorize(math.lgamma, otypes=[float])
+    x = np.clip(x, 0.0, 1.0)
+    inner = np.clip(x, 1e-300, 1 - 1e-16)
+    front = np.exp(
+        lgamma(a + b) - lgamma(a) - lgamma(b) + a * np.log(inner) + b * np.log1p(-inner)
+    )
+    direct = x < (a + 1) / (a + b + 2)
+    out = np.where(
+        direct,
+        front * _betacf(a, b, np.where(direct, x, 0.5)) / a,
+        1 - front * _betacf(b, a, np.where(direct, 0.5, 1 - x)) / b,
+    )
+    return np.where(x <= 0, 0.0, np.where(x >= 1, 1.0, out))
+
+
+def f_sf(f, df1, df2):
+    # P(F > f) for F(df1, df2); NaN where the test is undefined
+    f, df1, df2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (f, df1, df2)))
+    ok = np.isfinite(f) & (df1 > 0) & (df2 > 0) & (f >= 0)
+    p = np.full(f.shape, np.nan)
+    if ok.any():
+        d1, d2, fv = df1[ok], df2[ok], f[ok]
+        p[ok] = _betainc(d2 / 2, d1 / 2, d2 / (d2 + d1 * fv))
+    return p
+
+
+# -- engine -------------------------------------------------------------
+
+SUMMARY_COLS = ["plots", "treatments", "blocks", "mean", "cv_pct", "mse",
+                "f_treatment", "p_treatment", "se_mean", "sed"]
+
+
+def _empty(traits, treatment):
+    # No plots (or no traits) to analyse: the same frames, without rows
+    index = pd.Index([], name=treatment)
+    return {
+        "summary": pd.DataFrame(columns=SUMMARY_COLS, index=pd.Index([], name="trait"), dtype=float),
+        "anova": pd.DataFrame(
+            columns=["df", "ss", "ms", "f", "p"], dtype=float,
+            index=pd.MultiIndex.from_arrays([[], []], names=["trait", "source"])
+        ),
+        "means": pd.DataFrame(columns=traits, index=index, dtype=float),
+        "se": pd.DataFrame(columns=traits, index=index, dtype=float),
+    }
+
+
+def rcbd(wide, traits, block="replication", treatment="treatment"):
+    # wide: one row per plot with `block`, `treatment` and trait columns.
+    # Returns {"summary", "anova", "means", "se"}: per-trait summary, the
+    # ANOVA table (trait, source rows), and treatments x traits adjusted
+    # means with their standard errors.
+    wide = wide[wide[block].notna() & wide[treatment].notna()]
+    if wide.empty or not traits:
+        return _empty(traits, treatment)
+    t_codes, t_levels = pd.factorize(wide[treatment], sort=True)
+    b_codes, b_levels = pd.factorize(wide[block], sort=True)
+    nt, nb = len(t_levels), len(b_levels)
+
+    y = wide[traits].to_numpy(dtype=float)
+    seen = ~np.isnan(y)
+    m = seen.astype(float)
+    y0 = np.where(seen, y, 0.0)
+
+    trt = _Groups(t_codes, nt)
+    blk = _Groups(b_codes, nb)
+    cell = _Groups(t_codes * nb + b_codes, nt * nb)
+
+    n = m.sum(axis=0)
+    s = y0.sum(axis=0)
+    n_t, s_t = trt.sum(m), trt.sum(y0)          # treatments x traits
+    n_b, s_b = blk.sum(m), blk.sum(y0)          # blocks x traits
+    counts = cell.sum(m).reshape(nt, nb, -1)    # treatments x blocks x traits
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_t = np.where(n_t > 0, 1 / n_t, 0.0)
+
+        # Reduced normal equations for the block effects, per trait:
+        #   (diag(n_b) - N' diag(1/n_t) N) beta = s_b - N' (s_t / n_t)
+        c = np.einsum("ik,ij->kij", n_b, np.eye(nb)) - np.einsum("tik,tjk,tk->kij", counts, counts, inv_t)
+        q = (s_b - np.einsum("tjk,tk->jk", counts, s_t * inv_t)).T
+        beta = np.einsum("kij,kj->ki", np.linalg.pinv(c), q).T    # blocks x traits
+        tau = (s_t - np.einsum("tjk,jk->tk", counts, beta)) * inv_t
+
+        fitted = tau[t_codes] + beta[b_codes]
+        ss_error = (np.where(seen, y - fitted, 0.0) ** 2).sum(axis=0)
+
+        correction = np.where(n > 0, s * s / n, np.nan)
+        ss_total = (y0 * y0).sum(axis=0) - correction
+        ss_block = np.where(n_b > 0, s_b * s_b / n_b, 0.0).sum(axis=0) - correction
+        ss_trt = ss_total - ss_block - ss_error
+
+        t_used = (n_t > 0).sum(axis=0)
+        b_used = (n_b > 0).sum(axis=0)
+        df_trt = t_used - 1.0
+        df_block = b_used - 1.0
+        df_error = n - t_used - b_used + 1.0
+        df_total = n - 1.0
+
+        ms_trt = ss_trt / df_trt
+        ms_block = ss_block / df_block
+        mse = np.where(df_error > 0, ss_error / df_error, np.nan)
+        f_trt = ms_trt / mse
+        f_block = ms_block / mse
+        p_trt = f_sf(f_trt, df_trt, df_error)
+        p_block = f_sf(f_block, df_block, df_error)
+
+        grand = s / n
+        reps = np.where(n_t > 0, n_t, np.nan)
+        mean_reps = t_used / np.nansum(1 / reps, axis=0)    # harmonic mean
+        means = np.where(n_t > 0, tau + beta.mean(axis=0), np.nan)
+        se = np.sqrt(mse / reps)
+
+        summary = pd.DataFrame({
+            "plots": n.astype(int),
+            "treatments": t_used,
+            "blocks": b_used,
+            "mean": grand,
+            "cv_pct": 100 * np.sqrt(mse) / grand,
+            "mse": mse,
+            "f_treatment": f_trt,
+            "p_treatment": p_trt,
+            "se_mean": np.sqrt(mse / mean_reps),
+            "sed": np.sqrt(2 * mse / mean_reps),
+        }, index=pd.Index(traits, name="trait"))
+
+    sources = {
+        "Block": (df_block, ss_block, ms_block, f_block, p_block),
+        "Treatment": (df_trt, ss_trt, ms_trt, f_trt, p_trt),
+        "Error": (df_error, ss_error, mse, np.full(len(traits), np.nan), np.full(len(traits), np.nan)),
+        "Total": (df_total, ss_total, np.full(len(traits), np.nan), np.full(len(traits), np.nan),
+                  np.full(len(traits), np.nan)),
+    }
+    anova = pd.concat([
+        pd.DataFrame({"trait": traits, "source": name, "df": v[0], "ss": v[1], "ms": v[2],
+                      "f": v[3], "p": v[4]})
+        for name, v in sources.items()
+    ]).set_index(["trait", "source"]).sort_index(level=0, sort_remaining=False)
+
+    index = pd.Index(t_levels, name=treatment)
+    return {
+        "summary": summary,
+        "anova": anova,
+        "means": pd.DataFrame(means, index=index, columns=traits),
+        "se": pd.DataFrame(se, index=index, columns=traits),
+    }
+
+
+def environments(repo, location_id, status):
+    # (year, season) pairs with active plots in this status; analysed one at
+    # a time
+    seasons = repo.seasons(location_id, active_only=True).dropna(subset=["year", "season"])
+    count = seasons["drafts"] if status == "Draft" else seasons["plots"] - seasons["drafts"]
+    return [(int(r.year), r.season) for r in seasons[count > 0].itertuples()]
+
+
+def location_summary(location_id, status, year, season, block="replication"):
+    # Cached per location/status/environment until that location's data
+    # changes (every save invalidates observation_data)
+    key = (location_id, status, year, season, block,
+           cache.data_version(SOURCE_TABLES, location_id))
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    with metrics.span("stats.rcbd"):
+        wide, traits = wide_store.get_wide(location_id, status, active_only=True)
+        wide = wide[(wide["year"] == year) & (wide["season"] == season)]
+        text_cols = text_traits(location_id)
+        traits = [t for t in traits if t not in text_cols]
+        result = rcbd(wide, traits, block=block)
+
+    with _lock:
+        _results[key] = result
+        while len(_results) > MAX_RESULTS:
+            _results.popitem(last=False)
+    return result
@@ -397,20 +397,68 @@
 
 
 
+import json
+import time
 import streamlit as st
 import pandas as pd
-import io
-import bcrypt
-from sqlalchemy import text
-from auth import verify_user
-from db.db import get_engine, get_connection
+import analysis
+import archive
+import validation
+from auth import LoginThrottled, end_sessions, hash_password, verify_user, user_from_token
+from ingest import read_header
+from jobs import ACTIVE as ACTIVE_JOBS, CANCEL_WHILE_QUEUED, get_runner, save_upload
+from export import FORMATS as EXPORT_FORMATS, cached_export, text_traits
+from grid import (
+    FIXED_COLS, existing_lookup, lookup, overlay, build_wide, grid_values, column_config,
+    filter_bar, page_start, pager
+)
+from db.paging import PAGE_SIZE, metadata_page, metadata_count, filter_options, observations_for
+from db import cache
+from db import metrics
+from db import wide as wide_store
+from db.db import pool_stats
+from db.observations import diff_grid
+from db.repo import get_repo
+from db.journal import get_journal
 
 st.set_page_config("Agri Data Entry System", layout="wide", page_icon="🌾")
-engine = get_engine()
+metrics.serve()
+metrics.start_rerun()
+repo = get_repo()
+journal = get_journal()  # field devices: saves go to a local journal first
+
+
+def timing_panel(trace):
+    with st.sidebar.expander(
+        f"⏱ {trace['ms']:.0f} ms, {trace['queries']} queries, {trace['rows']} rows", expanded=True
+    ):
+        spans = pd.DataFrame(trace["spans"], columns=["name", "depth", "ms", "queries", "query_ms", "rows"])
+        spans["name"] = [" " * d + n for d, n in zip(spans["depth"], spans["name"])]
+        st.dataframe(spans.drop(columns="depth"), hide_index=True)
+
+
+def finish():
+    # End of the page: close this rerun's trace (shown to super admins who
+    # switched timings on), then stop the script
+    trace = metrics.end_rerun()
+    if trace and st.session_state.get("show_timings"):
+        timing_panel(trace)
+    st.stop()
+
 
 # ==================================================
 # LOGIN
 # ==================================================
+# A page reload starts a new session; the signed token kept in the URL
+# restores it without asking for the password (and running bcrypt) again.
+if "user" not in st.session_state and "s" in st.query_params:
+    with metrics.span("login.token"):
+        restored = user_from_token(st.query_params["s"])
+    if restored:
+        st.session_state.user = restored
+    else:
+        del st.query_params["s"]
+
 if "user" not in st.session_state:
     st.title("🔐 Login")
 
@@ -418,23 +466,33 @@ if "user" not in st.session_state:
     p = st.text_input("Password", type="password")
 
     if st.button("Login"):
-        user = verify_user(u, p)
-        if user:
-            st.session_state.user = user
-            st.rerun()
+        try:
+            with metrics.span("login"):
+                user = verify_user(u, p, ip=st.context.ip_address)
+        except LoginThrottled as e:
+            st.error(str(e))
         else:
-            st.error("Invalid credentials")
+            if user:
+                st.session_state.user = user
+                st.query_params["s"] = user["token"]
+                st.rerun()
+            else:
+                st.error("Invalid credentials")
 
-    st.stop()
+    finish()
 
 user = st.session_state.user
 ROLE = user["role"]
 LOCATION_ID = user["location_id"]
 
+metrics.tag(user=user["username"], role=ROLE)
+
 st.sidebar.success(f"{user['username']} ({ROLE})")
 
 if st.sidebar.button("Logout"):
+    end_sessions(user)
     st.session_state.clear()
+    st.query_params.clear()
     st.rerun()
 
 # ==================================================
@@ -446,6 +504,10 @@ elif ROLE == "admin":
     mode = "Admin"
 else:
     mode = "User"
+metrics.tag(mode=mode)
+
+if ROLE == "super_admin":
+    st.sidebar.toggle("Show rerun timings", key="show_timings")
 
 # ==================================================
 # SUPER ADMIN
@@ -453,22 +515,19 @@ else:
 if mode == "Super Admin":
     st.title("👑 Super Admin")
 
-    t1, t2 = st.tabs(["📍 Locations", "👥 Users"])
+    t1, t2, t3 = st.tabs(["📍 Locations", "👥 Users", "📈 Monitoring"])
 
-    with t1:
+    with t1, metrics.span("super_admin.locations"):
         name = st.text_input("Location name")
         if st.button("Add location"):
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("INSERT INTO locations (name) VALUES (%s)", (name,))
-            conn.commit()
-            conn.close()
+            repo.add_location(name)
+            cache.invalidate("locations")
             st.success("Location added")
 
-        st.dataframe(pd.read_sql(text("SELECT * FROM locations"), engine))
+        st.dataframe(repo.locations())
 
-    with t2:
-        locs = pd.read_sql(text("SELECT * FROM locations"), engine)
+    with t2, metrics.span("super_admin.users"):
+        locs = repo.locations()
         loc_map = dict(zip(locs["name"], locs["id"]))
 
         u = st.text_input("Username")
@@ -477,24 +536,43 @@ if mode == "Super Admin":
         l = st.selectbox("Location", list(loc_map.keys()))
 
         if st.button("Create user"):
-            hashed = bcrypt.hashpw(p.encode(), bcrypt.gensalt()).decode()
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO users (username,password_hash,role,location_id)
-                VALUES (%s,%s,%s,%s)
-            """, (u, hashed, r, loc_map[l]))
-            conn.commit()
-            conn.close()
+            repo.create_user(u, hash_password(p), r, int(loc_map[l]))
+            cache.invalidate("users")
             st.success("User created")
 
-        st.dataframe(pd.read_sql(text("""
-            SELECT u.username,u.role,l.name location
-            FROM users u
-            LEFT JOIN locations l ON u.location_id=l.id
-        """), engine))
+        st.dataframe(repo.users())
 
-    st.stop()
+    with t3, metrics.span("super_admin.monitoring"):
+        st.subheader("Database pool")
+        st.json(pool_stats())
+
+        st.subheader("Read cache")
+        st.json(cache.cache_stats())
+        if st.button("Clear read cache"):
+            cache.clear()
+            st.rerun()
+
+        st.subheader("Instrumented blocks (since server start)")
+        totals = pd.DataFrame.from_dict(metrics.span_totals(), orient="index")
+        if not totals.empty:
+            totals["avg_ms"] = (totals["seconds"] / totals["count"] * 1000).round(1)
+            st.dataframe(totals.sort_values("seconds", ascending=False))
+
+        st.subheader(f"Recent reruns over {metrics.SLOW_SPAN_MS:g} ms")
+        slow = metrics.recent_reruns(metrics.SLOW_SPAN_MS)
+        if slow:
+            st.dataframe(pd.DataFrame([
+                {**t["tags"], "ms": t["ms"], "queries": t["queries"], "rows": t["rows"],
+                 "slowest block": max(t["spans"], key=lambda s: s["ms"])["name"] if t["spans"] else None}
+                for t in reversed(slow)
+            ]))
+        else:
+            st.caption("None")
+
+        with st.expander("Prometheus text"):
+            st.code(metrics.prometheus_text())
+
+    finish()
 
 
 # ==================================================
@@ -503,6 +581,58 @@ if mode == "Super Admin":
 if mode == "Admin":
     st.title("⚙️ Admin Panel")
 
+    with st.sidebar.expander("Read cache"):
+        st.json(cache.cache_stats())
+
+    runner = get_runner()
+
+    def queue_job(kind, params=None):
+        # Heavy operations run as background jobs; the panel below tracks them
+        job_id = runner.submit(kind, LOCATION_ID, params, user["username"])
+        st.session_state.active_jobs = {*st.session_state.get("active_jobs", set()), job_id}
+        st.rerun()
+
+    def jobs_panel():
+        # Polls while this location has queued/running jobs; when one of them
+        # finishes the whole page reruns so every tab sees the new data.
+        jobs = runner.jobs(LOCATION_ID, limit=10)
+        active = {j["id"] for j in jobs if j["status"] in ACTIVE_JOBS}
+        if st.session_state.get("active_jobs", set()) - active:
+            st.session_state.active_jobs = active
+            st.rerun()
+        st.session_state.active_jobs = active
+
+        with st.expander(f"Jobs ({len(active)} running)" if active else "Jobs", expanded=bool(active)):
+            for j in jobs:
+                label = f"#{j['id']} {j['kind']} by {j['created_by']}: {j['status']}"
+                if j["status"] in ACTIVE_JOBS:
+                    st.progress(j["progress"], f"{label} {j['message'] or ''}")
+                    stoppable = j["status"] == "queued" or j["kind"] not in CANCEL_WHILE_QUEUED
+                    if not stoppable:
+                        st.caption("Deleting has started and can no longer be cancelled")
+                    elif not j["cancel_requested"] and st.button("Cancel", key=f"cancel_job_{j['id']}"):
+                        runner.cancel(j["id"])
+                        st.rerun(scope="fragment")
+                    continue
+
+                st.write(f"{label} — {j['message'] or ''}")
+                result = json.loads(j["result"] or "{}")
+                if j["kind"] == "replace" and j["status"] == "done":
+                    st.caption(
+                        f"{result['plots']} plots, {result['traits']} traits, "
+                        f"{result['observations']} values"
+                    )
+                    if result["problem_count"]:
+                        st.warning(f"{result['problem_count']} cell(s) could not be read and were left empty")
+                        st.dataframe(pd.DataFrame(
+                            result["problems"], columns=["row", "column", "value"]
+                        ).astype({"value": "string"}))
+                elif j["kind"] == "archive" and j["status"] == "done":
+                    st.caption(f"{result['plots']} plots, {result['observations']} values archived")
+
+    polling = bool(st.session_state.get("active_jobs"))
+    st.fragment(jobs_panel, run_every=2 if polling else None)()
+
     tabs = st.tabs([
         "📤 Upload / Replace Excel",
         "🧪 Manage Traits",
@@ -511,324 +641,541 @@ if mode == "Admin":
         "✏️ Edit Data",
         "🔓 Reopen Data",
         "⬇ Download",
+        "📈 Statistics",
+        "🗄 Seasons",
         "💣 Danger Zone"
-    ])
+    ], key="admin_tab", on_change="rerun")
+    # Tabs report which one is open, so only that section runs its queries
 
     # ------------------------------------------------
     # 1️⃣ UPLOAD / REPLACE EXCEL
     # ------------------------------------------------
-    with tabs[0]:
-        file = st.file_uploader("Upload Excel (A–G fixed, H+ traits)", type=["xlsx"])
-
-        if file:
-            df = pd.read_excel(file)
-            traits = df.columns[7:].tolist()
-
-            if st.button("Initialize / Replace Experiment"):
-                conn = get_connection()
-                cur = conn.cursor()
-
-                cur.execute("DELETE FROM observation_data WHERE location_id=%s", (LOCATION_ID,))
-                cur.execute("DELETE FROM experiment_traits WHERE location_id=%s", (LOCATION_ID,))
-                cur.execute("DELETE FROM experiment_metadata WHERE location_id=%s", (LOCATION_ID,))
-
-                exp_id = str(df.iloc[0, 0])
-
-                for _, r in df.iterrows():
-                    cur.execute("""
-                        INSERT INTO experiment_metadata
-                        (exp_id,location,year,season,replication,block,treatment,entry_status,is_active,location_id)
-                        VALUES (%s,%s,%s,%s,%s,%s,%s,'Draft',1,%s)
-                    """, (*tuple(r.iloc[:7]), LOCATION_ID))
+    if tabs[0].open:
+        with tabs[0], metrics.span("admin.upload"):
+            file = st.file_uploader("Upload Excel (A–G fixed, H+ traits)", type=["xlsx"])
 
-                for t in traits:
-                    cur.execute("""
-                        INSERT INTO experiment_traits
-                        (exp_id,trait_name,data_type,unit,is_active,location_id)
-                        VALUES (%s,%s,'number','',1,%s)
-                    """, (exp_id, t, LOCATION_ID))
+            if file:
+                header, total_rows = read_header(file)
+                st.caption(f"{total_rows} rows, {max(len(header) - 7, 0)} trait columns: {', '.join(header[7:])}")
 
-                conn.commit()
-                conn.close()
-                st.success("Experiment replaced for this location")
+                if len(header) < 8:
+                    st.error("Excel must contain A–G plus at least one trait column")
+                elif st.button("Initialize / Replace Experiment"):
+                    queue_job("replace", {"path": save_upload(file), "name": file.name})
 
     # ------------------------------------------------
     # 2️⃣ MANAGE TRAITS
     # ------------------------------------------------
-    with tabs[1]:
-        st.subheader("Add New Trait")
-        new_trait = st.text_input("Trait name")
-        if st.button("Add Trait"):
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO experiment_traits
-                (exp_id,trait_name,data_type,unit,is_active,location_id)
-                VALUES ('MANUAL',%s,'number','',1,%s)
-            """, (new_trait, LOCATION_ID))
-            conn.commit()
-            conn.close()
-            st.success("Trait added")
-
-        traits_df = pd.read_sql(
-            text("SELECT id,trait_name,is_active FROM experiment_traits WHERE location_id=:loc"),
-            engine,
-            params={"loc": LOCATION_ID}
-        )
-
-        for _, r in traits_df.iterrows():
-            col1, col2, col3 = st.columns([4,2,2])
-            col1.write(r["trait_name"])
-            col2.write("Active" if r["is_active"] else "Disabled")
-
-            if col3.button("Toggle", key=f"trait_{r['id']}"):
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute(
-                    "UPDATE experiment_traits SET is_active=1-is_active WHERE id=%s",
-                    (int(r["id"]),)
-                )
-                conn.commit()
-                conn.close()
-                st.rerun()
+    if tabs[1].open:
+        with tabs[1], metrics.span("admin.traits"):
+            st.subheader("Add New Trait")
+            new_trait = st.text_input("Trait name")
+            new_type = st.radio("Values", ["number", "text"], horizontal=True)
+            if st.button("Add Trait"):
+                if repo.add_traits(LOCATION_ID, [new_trait], types={new_trait: new_type}):
+                    cache.invalidate("experiment_traits", location_id=LOCATION_ID)
+                    wide_store.set_trait_active(LOCATION_ID, new_trait, True)
+                    st.success("Trait added")
+                else:
+                    st.warning(f"{new_trait} already exists")
+
+            traits_df = repo.traits(LOCATION_ID)
+
+            for _, r in traits_df.iterrows():
+                col1, col2, col3 = st.columns([4,2,2])
+                col1.write(r["trait_name"] + (" (text)" if r["data_type"] == "text" else ""))
+                col2.write("Active" if r["is_active"] else "Disabled")
+
+                if col3.button("Toggle", key=f"trait_{r['id']}"):
+                    repo.toggle_trait(r["id"], by=user["username"])
+                    cache.invalidate("experiment_traits", location_id=LOCATION_ID)
+                    wide_store.set_trait_active(LOCATION_ID, r["trait_name"], not r["is_active"])
+                    st.rerun()
+
+            st.subheader("Bounds and units")
+            st.caption("Values outside a trait's bounds can't be saved. Leave a bound empty for none.")
+            number_traits = traits_df[traits_df["data_type"] != "text"]
+            bounds_df = st.data_editor(
+                number_traits[["id", "trait_name", "unit", "min_value", "max_value"]],
+                column_config={
+                    "id": None,
+                    "trait_name": st.column_config.Column("Trait", disabled=True),
+                    "unit": st.column_config.TextColumn("Unit", max_chars=50),
+                    "min_value": st.column_config.NumberColumn("Min"),
+                    "max_value": st.column_config.NumberColumn("Max"),
+                },
+                num_rows="fixed",
+                hide_index=True,
+                key="trait_bounds"
+            )
+            if st.button("Save bounds"):
+                crossed = bounds_df[bounds_df["min_value"] > bounds_df["max_value"]]
+                if len(crossed):
+                    st.error("Min is above max for " + ", ".join(crossed["trait_name"]))
+                else:
+                    repo.set_trait_bounds([
+                        (r.id, r.unit, None if pd.isna(r.min_value) else r.min_value,
+                         None if pd.isna(r.max_value) else r.max_value)
+                        for r in bounds_df.itertuples()
+                    ])
+                    cache.invalidate("experiment_traits", location_id=LOCATION_ID)
+                    st.success("Bounds saved")
 
     # ------------------------------------------------
     # 3️⃣ MANAGE TREATMENTS
     # ------------------------------------------------
-    with tabs[2]:
-        st.subheader("Add Treatment (A–G)")
-        cols = st.columns(7)
-        vals = [cols[i].text_input(f"Col {chr(65+i)}") for i in range(7)]
-
-        if st.button("Add Treatment"):
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO experiment_metadata
-                (exp_id,location,year,season,replication,block,treatment,entry_status,is_active,location_id)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,'Draft',1,%s)
-            """, (*vals, LOCATION_ID))
-            conn.commit()
-            conn.close()
-            st.success("Treatment added")
-
-        meta_df = pd.read_sql(
-            text("""
-                SELECT id,treatment,is_active
-                FROM experiment_metadata
-                WHERE location_id=:loc
-            """),
-            engine,
-            params={"loc": LOCATION_ID}
-        )
-
-        for _, r in meta_df.iterrows():
-            c1, c2, c3 = st.columns([4,2,2])
-            c1.write(r["treatment"])
-            c2.write("Active" if r["is_active"] else "Disabled")
-            if c3.button("Toggle", key=f"treat_{r['id']}"):
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute(
-                    "UPDATE experiment_metadata SET is_active=1-is_active WHERE id=%s",
-                    (int(r["id"]),)
-                )
-                conn.commit()
-                conn.close()
-                st.rerun()
+    if tabs[2].open:
+        with tabs[2], metrics.span("admin.treatments"):
+            st.subheader("Add Treatment (A–G)")
+            cols = st.columns(7)
+            vals = [cols[i].text_input(f"Col {chr(65+i)}") for i in range(7)]
+
+            if st.button("Add Treatment"):
+                repo.add_treatment(LOCATION_ID, vals)
+                cache.invalidate("experiment_metadata", location_id=LOCATION_ID)
+                wide_store.drop(LOCATION_ID)
+                st.success("Treatment added")
+
+            meta_df = repo.treatments(LOCATION_ID)
+
+            for _, r in meta_df.iterrows():
+                c1, c2, c3 = st.columns([4,2,2])
+                c1.write(r["treatment"])
+                c2.write("Active" if r["is_active"] else "Disabled")
+                if c3.button("Toggle", key=f"treat_{r['id']}"):
+                    repo.toggle_treatment(r["id"], by=user["username"])
+                    cache.invalidate("experiment_metadata", location_id=LOCATION_ID)
+                    wide_store.set_row_active(LOCATION_ID, int(r["id"]), not r["is_active"])
+                    st.rerun()
 
     # ------------------------------------------------
     # 4️⃣ VIEW DATA (DRAFT / SUBMITTED)
     # ------------------------------------------------
-    with tabs[3]:
-        status = st.radio("Status", ["Draft", "Submitted"])
-        df = pd.read_sql(
-            text("""
-                SELECT * FROM experiment_metadata
-                WHERE entry_status=:st AND location_id=:loc
-            """),
-            engine,
-            params={"st": status, "loc": LOCATION_ID}
-        )
-        st.dataframe(df, use_container_width=True)
+    if tabs[3].open:
+        with tabs[3], metrics.span("admin.view"):
+            status = st.radio("Status", ["Draft", "Submitted"])
+            view_filters = filter_bar("view", filter_options(LOCATION_ID, active_only=False))
+            view_filters["entry_status"] = [status]
+
+            df, has_next = metadata_page(
+                LOCATION_ID, view_filters, page_start("view"), active_only=False
+            )
+            st.caption(f"{metadata_count(LOCATION_ID, view_filters, active_only=False)} rows")
+
+            view_df, _ = wide_store.get_wide(LOCATION_ID, status, ids=df["id"].tolist())
+            st.dataframe(view_df, use_container_width=True)
+            pager("view", df, has_next)
+
+            with st.expander("Consistency check"):
+                if st.button("Compare with a fresh pivot"):
+                    summary, mismatches = wide_store.check_consistency(LOCATION_ID)
+                    st.json(summary)
+                    if not mismatches.empty:
+                        st.dataframe(mismatches.astype({"maintained": "string", "fresh": "string"}))
 
     # ------------------------------------------------
     # 5️⃣ EDIT DATA (ADMIN)
     # ------------------------------------------------
-    with tabs[4]:
-        st.info("Admin can directly edit Draft or Submitted data")
-        st.write("Use User panel logic for editing (same UI).")
+    if tabs[4].open:
+        with tabs[4], metrics.span("admin.edit"):
+            st.info("Admin can directly edit Draft or Submitted data")
+            st.write("Use User panel logic for editing (same UI).")
 
     # ------------------------------------------------
     # 6️⃣ REOPEN DATA
     # ------------------------------------------------
-    with tabs[5]:
-        if st.button("Reopen ALL Submitted Data"):
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                UPDATE experiment_metadata
-                SET entry_status='Draft'
-                WHERE entry_status='Submitted' AND location_id=%s
-            """, (LOCATION_ID,))
-            conn.commit()
-            conn.close()
-            st.success("All data reopened")
+    if tabs[5].open:
+        with tabs[5], metrics.span("admin.reopen"):
+            if st.button("Reopen ALL Submitted Data"):
+                queue_job("reopen")
 
     # ------------------------------------------------
     # 7️⃣ DOWNLOAD
     # ------------------------------------------------
-    with tabs[6]:
-        status = st.radio("Download Status", ["Draft", "Submitted"])
-        df = pd.read_sql(
-            text("""
-                SELECT m.exp_id,m.location,m.year,m.season,
-                       m.replication,m.block,m.treatment,
-                       o.attribute_name,o.attribute_value
-                FROM experiment_metadata m
-                JOIN observation_data o ON m.id=o.metadata_id
-                WHERE m.entry_status=:st AND m.location_id=:loc
-            """),
-            engine,
-            params={"st": status, "loc": LOCATION_ID}
-        )
+    if tabs[6].open:
+        with tabs[6], metrics.span("admin.download"):
+            status = st.radio("Download Status", ["Draft", "Submitted"])
+            fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+            rows = st.radio("Rows", ["Everything", "Changes since a checkpoint"], horizontal=True)
+
+            # Changes are counted in change log numbers; a download remembers
+            # the last one it covered, per user and status
+            since = None
+            if rows != "Everything":
+                checkpoint = repo.export_checkpoint(LOCATION_ID, status, user["username"])
+                head = repo.change_head(LOCATION_ID)
+                since = int(st.number_input(
+                    "Changes after #", min_value=0, max_value=head,
+                    value=min(checkpoint or 0, head), step=1
+                ))
+                st.caption(
+                    (f"Your last {status} download covered changes up to #{checkpoint}. "
+                     if checkpoint is not None else f"No earlier {status} download recorded. ")
+                    + f"Latest change is #{head}."
+                )
+                ids, rewritten = repo.changed_plots(LOCATION_ID, since, head)
+                if rewritten:
+                    st.warning(
+                        f"Data was uploaded, deleted or archived after #{since}; download everything instead."
+                    )
+                    since = None
+                else:
+                    st.caption(f"{len(ids)} plot(s) changed. Plots that left {status} come as \"removed\".")
+
+            # Nothing is queried until asked; a generated file is reused until
+            # the location's data changes.
+            if rows == "Everything" or since is not None:
+                cached = cached_export(LOCATION_ID, status, fmt, since)
+                if cached is None and st.button("Generate export"):
+                    queue_job("export", {"status": status, "fmt": fmt, "since": since})
+
+                if cached:
+                    path, seq = cached
+                    with open(path, "rb") as fh:
+                        st.download_button(
+                            f"Download {fmt.upper()}",
+                            fh,
+                            f"{status}_data.{fmt}" if since is None else f"{status}_changes_{since}-{seq}.{fmt}",
+                            mime=EXPORT_FORMATS[fmt],
+                            on_click=repo.set_export_checkpoint,
+                            args=(LOCATION_ID, status, user["username"], seq)
+                        )
+
+            if st.toggle("Show change log"):
+                st.dataframe(repo.changes(LOCATION_ID), hide_index=True)
 
-        if not df.empty:
-            wide = df.pivot_table(
-                index=["exp_id","location","year","season","replication","block","treatment"],
-                columns="attribute_name",
-                values="attribute_value"
-            ).reset_index()
-
-            buf = io.BytesIO()
-            with pd.ExcelWriter(buf, engine="openpyxl") as w:
-                wide.to_excel(w, index=False)
-
-            st.download_button(
-                "Download Excel",
-                buf.getvalue(),
-                f"{status}_data.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+    # ------------------------------------------------
+    # 8️⃣ STATISTICS (RCBD)
+    # ------------------------------------------------
+    if tabs[7].open:
+        with tabs[7], metrics.span("admin.stats"):
+            status = st.radio("Status", ["Submitted", "Draft"], horizontal=True, key="stats_status")
+            envs = analysis.environments(repo, LOCATION_ID, status)
+            if not envs:
+                st.caption(f"No {status} plots with a year and season")
+            else:
+                c1, c2 = st.columns(2)
+                env = c1.selectbox("Season", envs, format_func=lambda e: f"{e[0]} {e[1]}")
+                block = c2.radio("Blocks", ["replication", "block"], horizontal=True)
+
+                result = analysis.location_summary(LOCATION_ID, status, env[0], env[1], block=block)
+                st.subheader("All traits")
+                st.dataframe(result["summary"])
+
+                trait = st.selectbox("Trait", list(result["summary"].index))
+                if trait:
+                    st.subheader(f"ANOVA: {trait}")
+                    st.dataframe(result["anova"].loc[trait])
+                    st.subheader("Treatment means (adjusted for blocks)")
+                    st.dataframe(pd.DataFrame({
+                        "mean": result["means"][trait], "se": result["se"][trait]
+                    }))
+
+                st.download_button(
+                    "Download means (CSV)", result["means"].to_csv(),
+                    f"means_{env[0]}_{env[1]}_{status}.csv", mime="text/csv"
+                )
 
     # ------------------------------------------------
-    # 8️⃣ DANGER ZONE
+    # 9️⃣ SEASONS (ARCHIVE)
     # ------------------------------------------------
-    with tabs[7]:
-        st.error("Danger Zone — irreversible actions")
-        confirm = st.text_input("Type DELETE to confirm")
-
-        if confirm == "DELETE":
-            if st.button("Delete EVERYTHING for this location"):
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute("DELETE FROM observation_data WHERE location_id=%s", (LOCATION_ID,))
-                cur.execute("DELETE FROM experiment_traits WHERE location_id=%s", (LOCATION_ID,))
-                cur.execute("DELETE FROM experiment_metadata WHERE location_id=%s", (LOCATION_ID,))
-                conn.commit()
-                conn.close()
-                st.success("All data deleted")
-                st.rerun()
+    if tabs[8].open:
+        with tabs[8], metrics.span("admin.seasons"):
+            if not archive.AVAILABLE:
+                st.warning("Archiving seasons needs pyarrow")
+            else:
+                st.subheader("Current seasons")
+                seasons = repo.seasons(LOCATION_ID)
+                st.dataframe(seasons, hide_index=True)
+
+                # Only fully Submitted seasons move to the archive
+                ready = [
+                    (int(r.year), r.season) for r in seasons.itertuples()
+                    if pd.notna(r.year) and pd.notna(r.season) and not r.drafts
+                ]
+                if ready:
+                    pick = st.selectbox("Season to archive", ready, format_func=lambda s: f"{s[0]} {s[1]}")
+                    if st.button("Archive season"):
+                        queue_job("archive", {"year": pick[0], "season": pick[1], "by": user["username"]})
+                else:
+                    st.caption("No fully Submitted season to archive")
+
+                st.subheader("Archived seasons")
+                archived = repo.archived_seasons(LOCATION_ID)
+                if archived.empty:
+                    st.caption("Nothing archived yet")
+                else:
+                    st.dataframe(archived.drop(columns="path"), hide_index=True)
+                    row = st.selectbox(
+                        "Archived season", archived.to_dict("records"),
+                        format_func=lambda r: f"{r['year']} {r['season']}"
+                    )
+                    with open(archive.ARCHIVE_DIR / row["path"], "rb") as fh:
+                        st.download_button(
+                            "Download Parquet", fh, f"{row['year']}_{row['season']}.parquet",
+                            mime=EXPORT_FORMATS["parquet"]
+                        )
+                    if st.toggle("Preview"):
+                        st.dataframe(archive.read_season(row["path"]).head(500), hide_index=True)
+
+                st.subheader("Compare seasons")
+                traits_df = repo.traits(LOCATION_ID)
+                trait = st.selectbox("Trait", traits_df.loc[traits_df["data_type"] != "text", "trait_name"].tolist())
+                if trait:
+                    st.dataframe(archive.compare(repo, LOCATION_ID, trait), hide_index=True)
 
-    st.stop()
+    # ------------------------------------------------
+    # 🔟 DANGER ZONE
+    # ------------------------------------------------
+    if tabs[9].open:
+        with tabs[9], metrics.span("admin.danger"):
+            st.error("Danger Zone — irreversible actions")
+            confirm = st.text_input("Type DELETE to confirm")
+
+            if confirm == "DELETE":
+                if st.button("Delete EVERYTHING for this location"):
+                    queue_job("delete")
+
+    finish()
 
 # ==================================================
-# USER PANEL (UNCHANGED, STABLE)
+# USER PANEL (DATA ENTRY)
 # ==================================================
 st.title("📊 Data Entry")
 
-meta_df = pd.read_sql(
-    text("""
-        SELECT * FROM experiment_metadata
-        WHERE location_id=:loc AND is_active=1
-    """),
-    engine,
-    params={"loc": LOCATION_ID}
-)
-
-traits_df = pd.read_sql(
-    text("""
-        SELECT trait_name
-        FROM experiment_traits
-        WHERE is_active=1 AND location_id=:loc
-    """),
-    engine,
-    params={"loc": LOCATION_ID}
-)
-
-traits = traits_df["trait_name"].tolist()
-selected_traits = st.multiselect("Select traits (H+)", traits)
-
-if not selected_traits:
-    st.stop()
-
-obs_df = pd.read_sql(
-    text("""
-        SELECT metadata_id,attribute_name,attribute_value
-        FROM observation_data
-        WHERE location_id=:loc
-    """),
-    engine,
-    params={"loc": LOCATION_ID}
-)
-
-existing = {
-    (r.metadata_id, r.attribute_name): r.attribute_value
-    for _, r in obs_df.iterrows()
-}
+with metrics.span("user.page"):
+    entry_filters = filter_bar("entry", filter_options(LOCATION_ID), statuses=["Draft", "Submitted"])
+    page_size = st.sidebar.selectbox("Plots per page", [25, 50, PAGE_SIZE, 250, 500], index=2)
+
+    meta_df, has_next = metadata_page(LOCATION_ID, entry_filters, page_start("entry"), page_size)
+    st.caption(f"{metadata_count(LOCATION_ID, entry_filters)} plots match")
+
+    traits = repo.active_traits(LOCATION_ID)
+    text_cols = text_traits(LOCATION_ID)
+    limits = validation.bounds(repo.traits(LOCATION_ID))
+
+
+@st.fragment
+def entry_panel(meta_df, traits, text_cols, limits):
+    # Trait selection, entry mode and Save rerun only this fragment. The page
+    # (filters, metadata, trait list) comes in as arguments kept from the
+    # last full run, so none of it is queried or rebuilt here.
+    with metrics.fragment("user.entry", user=user["username"], role=ROLE, mode=mode):
+        selected_traits = st.multiselect("Select traits (H+)", traits)
+        if not selected_traits:
+            return
+
+        with metrics.span("user.values"):
+            obs_df = observations_for(LOCATION_ID, meta_df["id"].tolist())
+
+            # Reuse the lookup while the read cache hands back the same frame
+            held = st.session_state.get("entry_existing")
+            if held is None or held[0] is not obs_df:
+                held = (obs_df, existing_lookup(obs_df))
+                st.session_state.entry_existing = held
+            existing = held[1]
+            if journal:
+                # Saved on this device but not on the server yet
+                existing = overlay(existing, journal.overlay(LOCATION_ID))
+            shown = lookup(existing, [(int(mid), t) for mid in meta_df["id"] for t in selected_traits])
+
+        # What this session saw on its previous render; compared on Save so we only
+        # write touched cells and notice if someone else wrote them in between.
+        prev_snapshot = st.session_state.get("entry_snapshot", {})
+
+        with metrics.span("user.grid"):
+            entry_mode = st.radio("Entry mode", ["Grid", "Form"], horizontal=True)
+            values = {}
+
+            if entry_mode == "Grid":
+                # Single editable table: the browser only renders the visible rows and
+                # supports keyboard navigation, so this scales to thousands of plots.
+                wide_df = build_wide(meta_df, existing, selected_traits, text_cols)
+
+                with st.form("entry_grid"):
+                    edited = st.data_editor(
+                        wide_df,
+                        column_config=column_config(selected_traits, text_cols, limits),
+                        num_rows="fixed",
+                        hide_index=True,
+                        height=600
+                    )
+                    accept = st.checkbox("Save values flagged as unusual", key="accept_grid")
+                    save = st.form_submit_button("💾 Save")
+                    submit = st.form_submit_button("✅ Submit")
+
+                values = grid_values(edited, selected_traits, text_cols)
+            else:
+                fixed_cols = FIXED_COLS
+                all_cols = fixed_cols + selected_traits
+
+                header = st.columns(len(all_cols))
+                for i, c in enumerate(all_cols):
+                    header[i].markdown(f"**{c.upper()}**")
+
+                with st.form("entry_form"):
+                    for _, row in meta_df.iterrows():
+                        cols = st.columns(len(all_cols))
+
+                        for i, col in enumerate(fixed_cols):
+                            cols[i].write(row[col])
+
+                        for j, trait in enumerate(selected_traits):
+                            idx = len(fixed_cols) + j
+                            default = shown[(int(row["id"]), trait)]
+
+                            if trait in text_cols:
+                                # blank stays blank: no value to save
+                                values[(int(row["id"]), trait)] = cols[idx].text_input(
+                                    "",
+                                    value=default or "",
+                                    max_chars=255,
+                                    key=f"{row['id']}_{trait}",
+                                    label_visibility="collapsed"
+                                ).strip() or None
+                                continue
+
+                            # blank, not 0.0: 0 is a measurement
+                            values[(int(row["id"]), trait)] = cols[idx].number_input(
+                                "",
+                                value=default,
+                                key=f"{row['id']}_{trait}",
+                                label_visibility="collapsed"
+                            )
+
+                    accept = st.checkbox("Save values flagged as unusual", key="accept_form")
+                    save = st.form_submit_button("💾 Save")
+                    submit = st.form_submit_button("✅ Submit")
+
+        st.session_state.entry_snapshot = dict(shown)
+
+        if not (save or submit):
+            return
+
+        with metrics.span("user.save"):
+            # Replace/delete jobs commit in batches; don't write into the middle
+            if repo.replacing(LOCATION_ID):
+                st.warning(
+                    "An admin is replacing or archiving this location's data right now. "
+                    "Nothing was saved; try again once that has finished."
+                )
+                return
+
+            baseline = {k: prev_snapshot.get(k, shown[k]) for k in values}
+            changes = diff_grid(values, baseline, default=None)
+            dirty = {**changes["inserted"], **changes["changed"]}
+
+            # Every problem in the written cells at once, before any write
+            problems = validation.check(LOCATION_ID, dirty, limits)
+            errors = (problems["severity"] == "error").sum()
+            if errors or (len(problems) and not accept):
+                if errors:
+                    st.error(
+                        f"{errors} value(s) are outside their trait's bounds. "
+                        "Nothing was saved; fix them and save again."
+                    )
+                else:
+                    st.warning(
+                        f"{len(problems)} value(s) look unusual for this location. Nothing was saved; "
+                        "check them, then tick \"Save values flagged as unusual\" and save again."
+                    )
+                plots = meta_df[["id", "replication", "block", "treatment"]].rename(columns={"id": "metadata_id"})
+                st.dataframe(plots.merge(problems, on="metadata_id").drop(columns="metadata_id"), hide_index=True)
+                return
+
+            if journal:
+                # Conflicts are found when the journal syncs, cell by cell
+                journal.record(
+                    LOCATION_ID, {**dirty, **{k: None for k in changes["cleared"]}},
+                    baseline, user["username"], submit=submit
+                )
+                st.session_state.entry_snapshot.update(dirty)
+                for k in changes["cleared"]:
+                    st.session_state.entry_snapshot[k] = None
+                st.success(
+                    f"{'Saved' if save else 'Submitted'} on this device "
+                    f"({len(changes['inserted'])} new, {len(changes['changed'])} changed, "
+                    f"{len(changes['cleared'])} cleared); it goes to the server with the next sync"
+                )
+                return
 
-fixed_cols = ["exp_id","location","year","season","replication","block","treatment"]
-all_cols = fixed_cols + selected_traits
+            with repo.begin() as conn:
+                conflicts = repo.find_conflicts(
+                    [*dirty, *changes["cleared"]], baseline, LOCATION_ID, conn=conn
+                )
+                if not conflicts:
+                    repo.upsert_observations(dirty, LOCATION_ID, conn=conn)
+                    repo.delete_observations(changes["cleared"], LOCATION_ID, conn=conn)
+                    repo.log_cells(
+                        LOCATION_ID, {**dirty, **{k: None for k in changes["cleared"]}},
+                        by=user["username"], conn=conn
+                    )
+                    if submit:
+                        repo.set_status(LOCATION_ID, "Submitted", conn=conn, by=user["username"])
+
+        if conflicts:
+            st.error(
+                f"{len(conflicts)} cell(s) were changed by someone else since you loaded this page. "
+                "Nothing was saved. Review the values and save again to overwrite."
+            )
+            st.dataframe(pd.DataFrame(
+                [(mid, trait, old, new) for (mid, trait), (old, new) in conflicts.items()],
+                columns=["metadata_id", "trait", "loaded value", "current value"]
+            ))
+            return
+
+        if submit:
+            cache.invalidate("observation_data", "experiment_metadata", location_id=LOCATION_ID)
+        else:
+            cache.invalidate("observation_data", location_id=LOCATION_ID)
 
-header = st.columns(len(all_cols))
-for i, c in enumerate(all_cols):
-    header[i].markdown(f"**{c.upper()}**")
+        wide_store.apply_cells(LOCATION_ID, {**dirty, **{k: None for k in changes["cleared"]}})
+        if submit:
+            wide_store.set_status(LOCATION_ID, "Submitted")
 
-values = {}
+        st.session_state.entry_snapshot.update(dirty)
+        for k in changes["cleared"]:
+            st.session_state.entry_snapshot[k] = None
 
-with st.form("entry_form"):
-    for _, row in meta_df.iterrows():
-        cols = st.columns(len(all_cols))
+        st.success(
+            f"{'Saved' if save else 'Submitted'} "
+            f"({len(changes['inserted'])} new, {len(changes['changed'])} changed, "
+            f"{len(changes['cleared'])} cleared)"
+        )
 
-        for i, col in enumerate(fixed_cols):
-            cols[i].write(row[col])
 
-        for j, trait in enumerate(selected_traits):
-            idx = len(fixed_cols) + j
-            default = existing.get((row["id"], trait), 0.0)
+def sync_panel():
+    # Field devices: what is still on this device, and sync conflicts
+    s = journal.status()
+    if s["pending"]:
+        st.warning(f"{s['pending']} change(s) waiting to sync")
+        if s["last_error"]:
+            st.caption(f"Server unreachable: {s['last_error']}")
+    else:
+        st.success("All changes synced")
+    if s["last_sync"]:
+        st.caption(f"Last sync {time.strftime('%H:%M:%S', time.localtime(s['last_sync']))}")
+    if st.button("Sync now"):
+        journal.wake.set()
+
+    if s["conflicts"]:
+        conflicts = journal.conflicts(LOCATION_ID)
+        st.error(f"{len(conflicts)} cell(s) were changed on the server by someone else")
+        st.dataframe(conflicts[["metadata_id", "attribute_name", "value", "server_value"]], hide_index=True)
+        keep, take = st.columns(2)
+        if keep.button("Keep mine"):
+            journal.resolve(LOCATION_ID, keep_mine=True)
+            st.rerun()
+        if take.button("Use server values"):
+            journal.resolve(LOCATION_ID, keep_mine=False)
+            st.rerun()
 
-            values[(row["id"], trait)] = cols[idx].number_input(
-                "",
-                value=float(default),
-                key=f"{row['id']}_{trait}",
-                label_visibility="collapsed"
-            )
 
-    save = st.form_submit_button("💾 Save")
-    submit = st.form_submit_button("✅ Submit")
+if journal:
+    with st.sidebar:
+        st.fragment(sync_panel, run_every=5)()
 
-if save or submit:
-    conn = get_connection()
-    cur = conn.cursor()
+entry_panel(meta_df, traits, text_cols, limits)
+pager("entry", meta_df, has_next)
 
-    for (mid, trait), val in values.items():
-        cur.execute(
-            "DELETE FROM observation_data WHERE metadata_id=%s AND attribute_name=%s",
-            (mid, trait)
-        )
-        cur.execute("""
-            INSERT INTO observation_data
-            (metadata_id,attribute_name,attribute_value,location_id)
-            VALUES (%s,%s,%s,%s)
-        """, (mid, trait, float(val), LOCATION_ID))
-
-    if submit:
-        cur.execute("""
-            UPDATE experiment_metadata
-            SET entry_status='Submitted'
-            WHERE location_id=%s
-        """, (LOCATION_ID,))
-
-    conn.commit()
-    conn.close()
-    st.success("Saved" if save else "Submitted")
+finish()
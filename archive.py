@@ -0,0 +1,168 @@
+import hashlib
+import os
+import re
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from db import cache
+from db import wide as wide_store
+from db.db import get_engine, setting
+from db.observations import chunks, pivot_values
+from export import FIXED_DTYPES, pq, text_traits, trait_columns, trait_dtypes, write_parquet
+from ingest import FIXED_COLS
+
+# Season lifecycle. A completed season (every plot Submitted) is written to
+# one Parquet file per location/year/season under ARCHIVE_DIR, recorded in
+# `archived_seasons`, and then deleted from the hot tables, so the
+# per-location queries behind every rerun stop carrying past seasons.
+# Archived seasons are read back from their file on demand: downloads,
+# previews and the season comparison.
+ARCHIVE_DIR = Path(setting("archive_dir", Path(__file__).resolve().parent / "archive"))
+AVAILABLE = pq is not None
+CHUNK_PLOTS = 5000
+
+ARCHIVE_COLS = ["id"] + FIXED_COLS + ["entry_status", "is_active"]
+
+META_SQL = text("""
+    SELECT id,exp_id,location,year,season,replication,block,treatment,entry_status,is_active
+    FROM experiment_metadata
+    WHERE id IN :ids
+    ORDER BY id
+""").bindparams(bindparam("ids", expanding=True))
+
+OBS_SQL = text("""
+    SELECT o.metadata_id id,t.trait_name attribute_name,o.attribute_value,o.text_value
+    FROM observation_data o
+    JOIN experiment_traits t ON t.id=o.trait_id
+    WHERE o.metadata_id IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+# Per-season summary of one trait over the hot tables
+COMPARE_SQL = text("""
+    SELECT m.year,m.season,COUNT(o.attribute_value) n,AVG(o.attribute_value) mean,
+           MIN(o.attribute_value) min,MAX(o.attribute_value) max
+    FROM observation_data o
+    JOIN experiment_metadata m ON m.id=o.metadata_id
+    JOIN experiment_traits t ON t.id=o.trait_id
+    WHERE o.location_id=:loc AND t.trait_name=:t AND m.is_active=1
+    GROUP BY m.year,m.season
+""")
+
+
+def season_file(location_id, year, season):
+    # Path relative to ARCHIVE_DIR, so the directory can be moved. The hash
+    # of the raw name keeps "Kharif/1" and "Kharif 1" in separate files.
+    name = re.sub(r"[^\w.-]+", "_", str(season))
+    digest = hashlib.sha1(str(season).encode()).hexdigest()[:8]
+    return f"location_{location_id}/{int(year)}_{name}_{digest}.parquet"
+
+
+def read_season(path, columns=None):
+    return pd.read_parquet(ARCHIVE_DIR / path, columns=columns)
+
+
+def _season_chunks(ids, traits, text_cols, counts, progress=None):
+    dtypes = {**FIXED_DTYPES, "entry_status": "string", "is_active": "Int64",
+              **trait_dtypes(traits, text_cols)}
+    with get_engine().connect() as conn:
+        for batch in chunks(ids, CHUNK_PLOTS):
+            meta = pd.read_sql(META_SQL, conn, params={"ids": batch})
+            obs = pd.read_sql(OBS_SQL, conn, params={"ids": batch})
+            vals = pivot_values(obs, "id")
+            wide = meta.set_index("id").join(vals.reindex(columns=traits)).reset_index()
+
+            counts["plots"] += len(meta)
+            counts["observations"] += len(obs)
+            if progress:
+                progress(counts["plots"] / len(ids))
+            yield wide[ARCHIVE_COLS + traits].astype(dtypes)
+
+
+def write_season(location_id, year, season, ids, progress=None, taken=()):
+    # Written next to its final name and renamed once complete. taken: the
+    # paths of recorded archives, which are never overwritten (a file that
+    # is not recorded is left over from a run that stopped early).
+    path = season_file(location_id, year, season)
+    final = ARCHIVE_DIR / path
+    if path in set(taken) and final.exists():
+        raise ValueError(f"{path} already holds another archived season")
+    final.parent.mkdir(parents=True, exist_ok=True)
+    tmp = final.with_suffix(".tmp")
+
+    traits = trait_columns(location_id)
+    text_cols = text_traits(location_id)
+    counts = {"plots": 0, "observations": 0}
+    try:
+        write_parquet(_season_chunks(ids, traits, text_cols, counts, progress), tmp, ARCHIVE_COLS + traits)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, final)
+    return path, counts
+
+
+def archive_season(repo, location_id, year, season, archived_by=None, progress=None):
+    # progress(fraction) runs while the file is written; once the file is
+    # recorded the hot rows are deleted without further progress calls, so
+    # a cancel can't leave a season half archived.
+    if not AVAILABLE:
+        raise RuntimeError("Archiving seasons needs pyarrow")
+
+    ids = repo.season_ids(location_id, year, season)
+    archived = repo.archived_seasons(location_id)
+    done = archived[(archived["year"] == int(year)) & (archived["season"] == season)]
+
+    if not done.empty:
+        # An earlier run wrote and recorded the file but stopped while deleting
+        path = done["path"].iloc[0]
+        counts = {"plots": int(done["plots"].iloc[0]), "observations": int(done["observations"].iloc[0])}
+        if not ids:
+            # ... or finished: nothing to delete, and nothing rewritten to log
+            return {**counts, "path": path}
+        if not set(ids) <= set(read_season(path, columns=["id"])["id"]):
+            raise ValueError(f"{year} {season} is already archived and has new plots since")
+    else:
+        if not ids:
+            raise ValueError(f"No plots for {year} {season}")
+        seasons = repo.seasons(location_id)
+        drafts = seasons[(seasons["year"] == int(year)) & (seasons["season"] == season)]["drafts"].sum()
+        if drafts:
+            raise ValueError(f"{int(drafts)} plot(s) of {year} {season} are still in Draft")
+
+        path, counts = write_season(location_id, year, season, ids, progress, taken=archived["path"])
+        repo.add_archived_season(
+            location_id, year, season, counts["plots"], counts["observations"], path, archived_by
+        )
+        # a rerun after a failed delete has to find the record
+        cache.invalidate("archived_seasons", location_id=location_id)
+
+    repo.delete_plots(ids)
+    repo.log_location(location_id, "archive", by=archived_by)
+    cache.invalidate(
+        "experiment_metadata", "observation_data", "archived_seasons",
+        location_id=location_id
+    )
+    wide_store.drop(location_id)
+    return {**counts, "path": path}
+
+
+def compare(repo, location_id, trait):
+    # One row per season, hot and archived alike
+    current = cache.read_sql(
+        COMPARE_SQL, ["experiment_metadata", "observation_data"], location_id,
+        params={"loc": location_id, "t": trait}
+    ).assign(source="current")
+
+    rows = []
+    for r in repo.archived_seasons(location_id).itertuples():
+        if trait not in pq.read_schema(ARCHIVE_DIR / r.path).names:
+            continue
+        df = read_season(r.path, columns=["is_active", trait])
+        v = df.loc[df["is_active"] == 1, trait]
+        rows.append({"year": r.year, "season": r.season, "n": int(v.count()),
+                     "mean": v.mean(), "min": v.min(), "max": v.max(), "source": "archive"})
+
+    out = pd.concat([current, pd.DataFrame(rows)], ignore_index=True) if rows else current
+    return out.sort_values(["year", "season"]).reset_index(drop=True)
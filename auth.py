@@ -1,21 +1,203 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import bcrypt
-from db.db import get_connection
+from db.db import setting
+from db.metrics import span
+from db.repo import get_repo
+
+# bcrypt cost for new hashes; older hashes are upgraded on the next login
+BCRYPT_ROUNDS = int(setting("bcrypt_rounds", 12))
+
+# bcrypt runs on a small worker pool so a login rush (or a brute-force
+# attempt) can use at most LOGIN_WORKERS cores; beyond LOGIN_QUEUE waiting
+# checks new attempts are turned away instead of piling up.
+LOGIN_WORKERS = int(setting("login_workers", 2))
+LOGIN_QUEUE = int(setting("login_queue", 16))
+
+# Failed attempts allowed per username / per client address in the window
+LOGIN_MAX_FAILURES = int(setting("login_max_failures", 5))
+LOGIN_MAX_FAILURES_PER_IP = int(setting("login_max_failures_per_ip", 30))
+LOGIN_WINDOW_SECONDS = int(setting("login_window_seconds", 300))
+
+# Signed session tokens let a page reload skip the password. Without a
+# configured secret a random one is used, so tokens die with the process
+# (and don't carry over between several server processes). The token sits
+# in the URL, so it is short-lived and logout revokes it (session_epoch).
+SESSION_SECRET = (setting("session_secret") or secrets.token_hex(32)).encode()
+SESSION_TTL_SECONDS = int(float(setting("session_ttl_hours", 2)) * 3600)
+
+SESSION_FIELDS = ("id", "username", "role", "location_id")
+
+_pool = ThreadPoolExecutor(max_workers=LOGIN_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(LOGIN_WORKERS + LOGIN_QUEUE)
+
+_lock = threading.Lock()
+_failures = {}  # "user:<name>" / "ip:<addr>" -> deque of failure times
+
+
+class LoginThrottled(Exception):
+    pass
+
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash():
+    # Checked for unknown usernames so they cost the same as a wrong password
+    return hash_password(secrets.token_hex(8))
+
+
+def _checkpw(password, hashed):
+    if not _slots.acquire(blocking=False):
+        raise LoginThrottled("The server is busy with other logins. Try again in a moment.")
+    try:
+        with span("login.bcrypt"):
+            return _pool.submit(bcrypt.checkpw, password.encode(), hashed.encode()).result()
+    finally:
+        _slots.release()
+
+
+# -- rate limiting ------------------------------------------------------
+
+def _limits(username, ip):
+    keys = [(f"user:{username.lower()}", LOGIN_MAX_FAILURES)]
+    if ip:
+        keys.append((f"ip:{ip}", LOGIN_MAX_FAILURES_PER_IP))
+    return keys
+
+
+def _retry_after(keys, now):
+    wait = 0
+    with _lock:
+        for key, limit in keys:
+            times = _failures.get(key)
+            while times and times[0] <= now - LOGIN_WINDOW_SECONDS:
+                times.popleft()
+            if times and len(times) >= limit:
+                wait = max(wait, times[0] + LOGIN_WINDOW_SECONDS - now)
+            elif times is not None and not times:
+                del _failures[key]
+    return wait
+
+
+def _record_failure(keys, now):
+    with _lock:
+        for key, _ in keys:
+            _failures.setdefault(key, deque()).append(now)
+
+        # many distinct names/addresses (a spray): drop the ones past the window
+        if len(_failures) > 10000:
+            for key in [k for k, t in _failures.items() if t[-1] <= now - LOGIN_WINDOW_SECONDS]:
+                del _failures[key]
+
+
+def _clear_failures(username):
+    with _lock:
+        _failures.pop(f"user:{username.lower()}", None)
 
-def verify_user(username: str, password: str):
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
 
-    cur.execute(
-        "SELECT * FROM users WHERE username=%s",
-        (username,)
-    )
-    user = cur.fetchone()
-    conn.close()
+# -- login --------------------------------------------------------------
 
-    if not user:
+def verify_user(username: str, password: str, ip: str = None):
+    # Returns the session user dict (with a fresh session "token"), or None
+    # for bad credentials. Raises LoginThrottled when the username or address
+    # is locked out or the bcrypt pool is saturated.
+    now = time.monotonic()
+    keys = _limits(username, ip)
+    wait = _retry_after(keys, now)
+    if wait:
+        raise LoginThrottled(f"Too many failed logins. Try again in {int(wait) + 1} s.")
+
+    repo = get_repo()
+    user = repo.user_by_name(username)
+    ok = _checkpw(password, user["password_hash"] if user else _dummy_hash())
+
+    if not (user and ok):
+        _record_failure(keys, now)
+        return None
+
+    _clear_failures(username)
+    if bcrypt_rounds(user["password_hash"]) != BCRYPT_ROUNDS:
+        user["password_hash"] = hash_password(password)
+        repo.set_password_hash(user["id"], user["password_hash"])
+
+    session = {k: user[k] for k in SESSION_FIELDS}
+    session["token"] = issue_token(user)
+    return session
+
+
+def bcrypt_rounds(hashed):
+    # "$2b$12$..." -> 12
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
         return None
 
-    if bcrypt.checkpw(password.encode(), user["password_hash"].encode()):
-        return user
 
-    return None
+# -- session tokens -----------------------------------------------------
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(body):
+    return _b64(hmac.new(SESSION_SECRET, body.encode(), hashlib.sha256).digest())
+
+
+def _fingerprint(password_hash):
+    # Changing the password invalidates outstanding tokens
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
+
+def issue_token(user):
+    # user: a users row including password_hash
+    body = _b64(json.dumps({
+        "u": user["username"],
+        "exp": int(time.time()) + SESSION_TTL_SECONDS,
+        "pw": _fingerprint(user["password_hash"]),
+        "ep": user["session_epoch"],
+    }).encode())
+    return f"{body}.{_sign(body)}"
+
+
+def user_from_token(token):
+    # The session user for a valid, unexpired token; None otherwise
+    try:
+        body, sig = token.split(".")
+        if not hmac.compare_digest(sig, _sign(body)):
+            return None
+        claims = json.loads(_unb64(body))
+    except (ValueError, TypeError):
+        return None
+
+    if claims.get("exp", 0) < time.time():
+        return None
+    user = get_repo().user_by_name(claims.get("u", ""))
+    if not user or not hmac.compare_digest(claims.get("pw", ""), _fingerprint(user["password_hash"])):
+        return None
+    if claims.get("ep") != user["session_epoch"]:
+        return None  # logged out since
+
+    session = {k: user[k] for k in SESSION_FIELDS}
+    session["token"] = token
+    return session
+
+
+def end_sessions(session):
+    # Logout: this token (and the user's other sessions) stop working
+    get_repo().end_sessions(session["id"])
@@ -0,0 +1,66 @@
+# Building the User panel's existing-values lookup.
+#
+#   python -m bench.bench_existing --rows 1000000 --traits 40
+#
+# Compares the old dict-over-iterrows build with the compact MultiIndex
+# Series (grid.existing_lookup) and the per-page lookup the grid uses.
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from grid import compact_observations, existing_lookup, lookup
+
+
+def synthetic(rows, traits, seed=0):
+    rng = np.random.default_rng(seed)
+    plots = rows // traits
+    return pd.DataFrame({
+        "metadata_id": np.repeat(np.arange(1, plots + 1, dtype=np.int64), traits),
+        "attribute_name": np.tile(np.array([f"trait_{j}" for j in range(traits)], dtype=object), plots),
+        "attribute_value": rng.random(plots * traits) * 100,
+    })
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def legacy(obs_df):
+    return {
+        (r.metadata_id, r.attribute_name): r.attribute_value
+        for _, r in obs_df.iterrows()
+    }
+
+
+def mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--traits", type=int, default=40)
+    ap.add_argument("--page", type=int, default=100, help="plots per page for the lookup")
+    args = ap.parse_args()
+
+    obs_df = synthetic(args.rows, args.traits)
+    keys = [(mid, f"trait_{j}") for mid in range(1, args.page + 1) for j in range(10)]
+
+    _, t_legacy = timed(legacy, obs_df)
+    existing, t_new = timed(existing_lookup, obs_df)
+    _, t_lookup = timed(lookup, existing, keys)
+
+    print(f"rows                     {len(obs_df):>12,d}")
+    print(f"dict via iterrows        {t_legacy:12.3f} s")
+    print(f"MultiIndex Series        {t_new:12.3f} s")
+    print(f"page lookup ({len(keys)} cells) {t_lookup:10.4f} s")
+    print(f"frame memory, raw        {mb(obs_df):12.1f} MiB")
+    print(f"frame memory, compact    {mb(compact_observations(obs_df)):12.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Server-side cost of building the User panel entry grid.
+#
+#   python -m bench.bench_grid --plots 100 1000 10000 --traits 10
+#
+# Runs Streamlit in bare mode (no browser), so it measures what the script
+# thread spends per rerun: widget construction and serialization for the
+# Form mode vs. the pivot + data_editor payload for the Grid mode. Browser
+# paint time comes on top and grows with widget count in Form mode only.
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from grid import FIXED_COLS, existing_lookup, build_wide, grid_values, column_config
+
+
+def synthetic(plots, traits, fill=0.7, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, plots + 1)
+    meta_df = pd.DataFrame({
+        "id": ids,
+        "exp_id": "BENCH", "location": "bench", "year": 2026, "season": "Kharif",
+        "replication": ids % 4 + 1, "block": ids % 10 + 1,
+        "treatment": [f"T{i}" for i in ids],
+    })
+    names = [f"trait_{j}" for j in range(traits)]
+    obs_df = pd.DataFrame({
+        "metadata_id": np.repeat(ids, traits),
+        "attribute_name": names * plots,
+        "attribute_value": rng.random(plots * traits) * 100,
+    }).sample(frac=fill, random_state=seed)
+    return meta_df, obs_df, names
+
+
+def form_mode(meta_df, obs_df, traits):
+    existing = {
+        (int(r.metadata_id), r.attribute_name): r.attribute_value
+        for _, r in obs_df.iterrows()
+    }
+    values = {}
+    for _, row in meta_df.iterrows():
+        cols = st.columns(len(FIXED_COLS) + len(traits))
+        for i, col in enumerate(FIXED_COLS):
+            cols[i].write(row[col])
+        for j, trait in enumerate(traits):
+            default = existing.get((int(row["id"]), trait), 0.0)
+            values[(int(row["id"]), trait)] = cols[len(FIXED_COLS) + j].number_input(
+                "", value=float(default), key=f"{row['id']}_{trait}",
+                label_visibility="collapsed"
+            )
+    return values
+
+
+def grid_mode(meta_df, obs_df, traits):
+    wide_df = build_wide(meta_df, existing_lookup(obs_df), traits)
+    edited = st.data_editor(
+        wide_df, column_config=column_config(traits), num_rows="fixed", hide_index=True
+    )
+    return grid_values(edited, traits)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plots", type=int, nargs="+", default=[100, 1000, 10000])
+    ap.add_argument("--traits", type=int, default=10)
+    ap.add_argument("--max-form-plots", type=int, default=1000,
+                    help="skip Form mode above this size (it takes minutes)")
+    args = ap.parse_args()
+    warnings.filterwarnings("ignore")
+
+    print(f"{'plots':>7s} {'cells':>8s} {'form (s)':>10s} {'grid (s)':>10s}")
+    for plots in args.plots:
+        meta_df, obs_df, traits = synthetic(plots, args.traits)
+        form = timed(form_mode, meta_df, obs_df, traits) if plots <= args.max_form_plots else float("nan")
+        grid = timed(grid_mode, meta_df, obs_df, traits)
+        print(f"{plots:7d} {plots * args.traits:8d} {form:10.3f} {grid:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Save/Submit throughput: legacy per-cell DELETE+INSERT vs bulk upsert.
+#
+#   python -m bench.bench_save --plots 500 --traits 10
+#
+# Runs against the configured backend (AGRI_DB_BACKEND=sqlite for a local
+# file) inside a throw-away location that is removed afterwards.
+import argparse
+import random
+import time
+
+from sqlalchemy import text
+
+from db.repo import get_repo
+
+
+def legacy_save(repo, values, location_id, conn):
+    keys = repo.trait_keys(location_id, conn=conn)
+    for (mid, trait), val in values.items():
+        conn.execute(
+            text("DELETE FROM observation_data WHERE metadata_id=:m AND trait_id=:t"),
+            {"m": mid, "t": keys[trait][0]}
+        )
+        conn.execute(text("""
+            INSERT INTO observation_data
+            (metadata_id,trait_id,attribute_value,location_id)
+            VALUES (:m,:t,:v,:loc)
+        """), {"m": mid, "t": keys[trait][0], "v": float(val), "loc": location_id})
+
+
+def bulk_save(repo, values, location_id, conn):
+    repo.upsert_observations(values, location_id, conn=conn)
+
+
+def logged_save(repo, values, location_id, conn):
+    # what the Save button does: the upsert plus its change log rows
+    repo.upsert_observations(values, location_id, conn=conn)
+    repo.log_cells(location_id, values, by="bench", conn=conn)
+
+
+def setup(repo, plots, traits):
+    name = f"__bench_{time.time_ns()}"
+    with repo.begin() as conn:
+        repo.add_location(name, conn=conn)
+        location_id = conn.execute(
+            text("SELECT id FROM locations WHERE name=:n"), {"n": name}
+        ).scalar_one()
+        rows = [("BENCH", "bench", 2026, "Kharif", i % 4 + 1, i % 10 + 1, f"T{i}") for i in range(plots)]
+        ids = repo.insert_metadata(rows, location_id, conn=conn)
+        repo.add_traits(location_id, traits, exp_id="BENCH", conn=conn)
+    return location_id, ids
+
+
+def timed(fn, repo, values, location_id):
+    start = time.perf_counter()
+    with repo.begin() as conn:
+        fn(repo, values, location_id, conn)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plots", type=int, default=500)
+    ap.add_argument("--traits", type=int, default=10)
+    args = ap.parse_args()
+
+    repo = get_repo()
+    traits = [f"trait_{j}" for j in range(args.traits)]
+    location_id, ids = setup(repo, args.plots, traits)
+
+    values = {(mid, t): random.random() * 100 for mid in ids for t in traits}
+    n = len(values)
+
+    try:
+        for label, fn in [("legacy", legacy_save), ("bulk", bulk_save), ("logged", logged_save)]:
+            # first pass inserts, second pass overwrites existing cells
+            for phase in ("insert", "update"):
+                secs = timed(fn, repo, values, location_id)
+                print(f"{label:7s} {phase:7s} {n:8d} rows  {secs:8.3f}s  {n / secs:10.0f} rows/s")
+            repo.delete_observations(list(values), location_id)
+    finally:
+        with repo.begin() as conn:
+            repo.delete_location_data(location_id, conn=conn)
+            for table, col in (("change_log", "location_id"), ("locations", "id")):
+                conn.execute(text(f"DELETE FROM {table} WHERE {col}=:id"), {"id": location_id})
+
+
+if __name__ == "__main__":
+    main()
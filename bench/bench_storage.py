@@ -0,0 +1,159 @@
+# Storage and read cost of observation_data keyed by trait id (migration
+# 006) vs the earlier layout that repeated the trait name on every row.
+#
+#   python -m bench.bench_storage --plots 10000 --traits 50
+#
+# Builds both layouts side by side in a throw-away SQLite file: the current
+# one from sql/schema_sqlite.sql, the old one from LEGACY_DDL below, with
+# the same synthetic values. Reports table + index bytes (dbstat) and the
+# median time of the reads the app runs: one page of observations, a whole
+# location (wide table build) and the Download join.
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from db.repo import SQLITE_SCHEMA
+
+LEGACY_DDL = """
+CREATE TABLE observation_legacy (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    metadata_id INTEGER NOT NULL REFERENCES experiment_metadata(id) ON DELETE CASCADE,
+    attribute_name VARCHAR(100) NOT NULL,
+    attribute_value DOUBLE,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    UNIQUE (metadata_id, attribute_name)
+);
+CREATE INDEX idx_legacy_loc_meta_attr ON observation_legacy (location_id, metadata_id, attribute_name);
+"""
+
+# Trait names as they come from real sheets, not trait_01
+NAMES = ["Plant height (cm)", "Days to 50% flowering", "Grain yield (kg/ha)",
+         "1000 grain weight (g)", "Panicle length (cm)", "Tillers per plant",
+         "Chlorophyll (SPAD)", "Days to maturity"]
+
+QUERIES = {
+    "page (100 plots)": (
+        """SELECT metadata_id,attribute_name,attribute_value FROM observation_legacy
+           WHERE location_id=1 AND metadata_id IN ({ids})""",
+        """SELECT o.metadata_id,t.trait_name,o.attribute_value,o.text_value
+           FROM observation_data o JOIN experiment_traits t ON t.id=o.trait_id
+           WHERE o.location_id=1 AND o.metadata_id IN ({ids})""",
+    ),
+    "location read": (
+        "SELECT metadata_id,attribute_name,attribute_value FROM observation_legacy WHERE location_id=1",
+        "SELECT metadata_id,trait_id,attribute_value,text_value FROM observation_data WHERE location_id=1",
+    ),
+    "download join": (
+        """SELECT m.id,m.exp_id,m.treatment,o.attribute_name,o.attribute_value
+           FROM experiment_metadata m JOIN observation_legacy o ON m.id=o.metadata_id
+           WHERE m.entry_status='Draft' AND m.location_id=1 ORDER BY m.id""",
+        """SELECT m.id,m.exp_id,m.treatment,o.trait_id,o.attribute_value,o.text_value
+           FROM experiment_metadata m JOIN observation_data o ON m.id=o.metadata_id
+           WHERE m.entry_status='Draft' AND m.location_id=1 ORDER BY m.id""",
+    ),
+    "download join + names": (
+        None,
+        """SELECT m.id,m.exp_id,m.treatment,t.trait_name,o.attribute_value,o.text_value
+           FROM experiment_metadata m JOIN observation_data o ON m.id=o.metadata_id
+           JOIN experiment_traits t ON t.id=o.trait_id
+           WHERE m.entry_status='Draft' AND m.location_id=1 ORDER BY m.id""",
+    ),
+}
+
+
+def build(path, plots, traits, fill, seed=0):
+    conn = sqlite3.connect(path)
+    conn.executescript(SQLITE_SCHEMA.read_text(encoding="utf-8"))
+    conn.executescript(LEGACY_DDL)
+    conn.execute("INSERT INTO locations (name) VALUES ('bench')")
+
+    names = [f"{NAMES[j % len(NAMES)]} {j // len(NAMES) + 1}" for j in range(traits)]
+    conn.executemany(
+        "INSERT INTO experiment_traits (id,exp_id,trait_name,location_id) VALUES (?,'BENCH',?,1)",
+        [(j + 1, n) for j, n in enumerate(names)]
+    )
+    conn.executemany(
+        """INSERT INTO experiment_metadata
+           (id,exp_id,location,year,season,replication,block,treatment,location_id)
+           VALUES (?,'BENCH','bench',2026,'Kharif',?,?,?,1)""",
+        [(i, i % 4 + 1, i % 10 + 1, f"T{i % 250}") for i in range(1, plots + 1)]
+    )
+
+    rng = np.random.default_rng(seed)
+    mid, tid = np.divmod(np.arange(plots * traits), traits)
+    keep = rng.random(plots * traits) < fill
+    vals = (rng.random(plots * traits) * 500).round(3)
+    rows = list(zip((mid[keep] + 1).tolist(), (tid[keep] + 1).tolist(), vals[keep].tolist()))
+
+    conn.executemany(
+        "INSERT INTO observation_data (metadata_id,trait_id,attribute_value,location_id) VALUES (?,?,?,1)",
+        rows
+    )
+    conn.executemany(
+        "INSERT INTO observation_legacy (metadata_id,attribute_name,attribute_value,location_id) VALUES (?,?,?,1)",
+        [(m, names[t - 1], v) for m, t, v in rows]
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    return conn, len(rows)
+
+
+def sizes(conn, table):
+    # bytes of the table and of its indexes
+    rows = conn.execute("""
+        SELECT s.name = m.tbl_name, SUM(s.pgsize)
+        FROM dbstat s JOIN sqlite_master m ON m.name = s.name
+        WHERE m.tbl_name = ?
+        GROUP BY 1
+    """, (table,)).fetchall()
+    out = dict(rows)
+    return out.get(1, 0), out.get(0, 0)
+
+
+def timed(conn, sql, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plots", type=int, default=10000)
+    ap.add_argument("--traits", type=int, default=50)
+    ap.add_argument("--fill", type=float, default=0.9, help="share of cells with a value")
+    ap.add_argument("--repeat", type=int, default=9)
+    args = ap.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        conn, n = build(path, args.plots, args.traits, args.fill)
+        print(f"{n:,d} observations, {args.plots:,d} plots x {args.traits} traits")
+
+        mb = 2 ** 20
+        print(f"{'':24s} {'table MB':>9s} {'index MB':>9s} {'total MB':>9s}")
+        for label, table in (("name per row (old)", "observation_legacy"), ("trait_id (now)", "observation_data")):
+            t, i = sizes(conn, table)
+            print(f"{label:24s} {t / mb:9.1f} {i / mb:9.1f} {(t + i) / mb:9.1f}")
+
+        ids = ",".join(str(i) for i in range(1, 101))
+        print(f"{'':24s} {'old ms':>9s} {'now ms':>9s}")
+        for label, (old, new) in QUERIES.items():
+            t_old = timed(conn, old.format(ids=ids), args.repeat) * 1000 if old else float("nan")
+            t_new = timed(conn, new.format(ids=ids), args.repeat) * 1000
+            print(f"{label:24s} {t_old:9.1f} {t_new:9.1f}")
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
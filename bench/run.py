@@ -0,0 +1,208 @@
+# End-to-end benchmark suite over the real code paths.
+#
+#   AGRI_DB_BACKEND=sqlite AGRI_DB_PATH=/tmp/bench.db \
+#       python -m bench.run --plots 2000 --traits 20 --seasons 2
+#   python -m bench.run ... --compare bench/results/<older>.json
+#
+# Builds a synthetic location (bench/synth.py), then times login, the
+# Excel upload ingest, the User panel load, Save/Submit and the Download
+# export. Read caches are cleared before every iteration, so numbers are
+# cold-cache. Each scenario reports latency percentiles, rows/second and
+# peak Python memory (tracemalloc, measured in one extra iteration), and
+# the whole run is written to bench/results/ as JSON.
+import argparse
+import io
+import json
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+from sqlalchemy import text
+
+from auth import hash_password, verify_user
+from bench.synth import trial_frame, write_workbook, load_frame
+from db import cache
+from db import wide as wide_store
+from db.db import DB_BACKEND
+from db.paging import metadata_page, observations_for
+from db.repo import get_repo
+from export import build_export
+from grid import existing_lookup, lookup
+from ingest import ingest_excel
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+PASSWORD = "bench-password"
+
+
+def percentile(samples, p):
+    s = sorted(samples)
+    k = (len(s) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def measure(fn, iterations):
+    # fn() returns the number of rows it processed
+    times, rows = [], 0
+    for _ in range(iterations):
+        cache.clear()
+        start = time.perf_counter()
+        rows = fn()
+        times.append(time.perf_counter() - start)
+
+    cache.clear()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean = statistics.mean(times)
+    return {
+        "n": iterations,
+        "rows": rows,
+        "mean_ms": round(mean * 1000, 3),
+        "p50_ms": round(percentile(times, 50) * 1000, 3),
+        "p90_ms": round(percentile(times, 90) * 1000, 3),
+        "p99_ms": round(percentile(times, 99) * 1000, 3),
+        "rows_per_s": round(rows / mean, 1) if mean else None,
+        "peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def make_location(repo, name):
+    with repo.begin() as conn:
+        repo.add_location(name, conn=conn)
+        return conn.execute(
+            text("SELECT id FROM locations WHERE name=:n"), {"n": name}
+        ).scalar_one()
+
+
+def drop_location(repo, location_id):
+    with repo.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE location_id=:loc"), {"loc": location_id})
+        repo.delete_location_data(location_id, conn=conn)
+        conn.execute(text("DELETE FROM locations WHERE id=:loc"), {"loc": location_id})
+
+
+def run(args):
+    repo = get_repo()
+    tag = f"__bench_{time.time_ns()}"
+    df = trial_frame(args.plots, args.reps, args.blocks, args.traits, args.seasons, seed=args.seed)
+    traits = list(df.columns[7:])
+    cells = int(df[traits].notna().sum().sum())
+
+    workbook = io.BytesIO()
+    write_workbook(df, workbook)
+
+    loc = make_location(repo, tag)
+    upload_loc = make_location(repo, tag + "_upload")
+    username = tag
+    repo.create_user(username, hash_password(PASSWORD), "user", loc)
+    load_frame(repo, loc, df)
+
+    results = {}
+    try:
+        results["login"] = measure(lambda: 1 if verify_user(username, PASSWORD) else 0, args.iterations)
+
+        def ingest():
+            workbook.seek(0)
+            with repo.begin() as conn:
+                repo.delete_location_data(upload_loc, conn=conn)
+                stats = ingest_excel(repo, conn, workbook, upload_loc)
+            return stats["plots"] + stats["observations"]
+        results["upload_ingest"] = measure(ingest, max(1, args.iterations // 5))
+
+        selected = traits[:args.selected]
+
+        def user_load():
+            meta, _ = metadata_page(loc, None, 0, args.page)
+            active = repo.active_traits(loc)
+            obs = observations_for(loc, meta["id"].tolist())
+            existing = existing_lookup(obs)
+            shown = lookup(existing, [(int(m), t) for m in meta["id"] for t in selected])
+            return len(meta) + len(active) + len(obs) + len(shown)
+        results["user_panel_load"] = measure(user_load, args.iterations)
+
+        page, _ = metadata_page(loc, None, 0, args.page)
+        keys = [(int(m), t) for m in page["id"] for t in selected]
+
+        def save():
+            baseline = lookup(existing_lookup(observations_for(loc, page["id"].tolist())), keys)
+            values = {k: random.random() * 100 for k in keys}
+            with repo.begin() as conn:
+                repo.find_conflicts(keys, baseline, loc, conn=conn)
+                repo.upsert_observations(values, loc, conn=conn)
+                repo.set_status(loc, "Submitted", conn=conn)
+            return len(values)
+        results["save_submit"] = measure(save, args.iterations)
+
+        def download():
+            wide_store.drop(loc)
+            build_export(loc, "Submitted", "xlsx")
+            return cells
+        results["download_xlsx"] = measure(download, max(1, args.iterations // 5))
+    finally:
+        drop_location(repo, loc)
+        drop_location(repo, upload_loc)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backend": DB_BACKEND,
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        "observations": cells,
+        "results": results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def report(run_data, baseline=None):
+    print(f"commit {run_data['commit']}  backend {run_data['backend']}  "
+          f"observations {run_data['observations']}")
+    print(f"{'scenario':18s} {'p50 ms':>10s} {'p90 ms':>10s} {'p99 ms':>10s} "
+          f"{'rows/s':>12s} {'peak MB':>9s}" + ("  vs baseline p50" if baseline else ""))
+    for name, r in run_data["results"].items():
+        line = (f"{name:18s} {r['p50_ms']:10.1f} {r['p90_ms']:10.1f} {r['p99_ms']:10.1f} "
+                f"{r['rows_per_s'] or 0:12.0f} {r['peak_mb']:9.1f}")
+        old = (baseline or {}).get("results", {}).get(name)
+        if old and old["p50_ms"]:
+            line += f"  {r['p50_ms'] / old['p50_ms']:.2f}x"
+        print(line)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plots", type=int, default=1000, help="plots per season")
+    ap.add_argument("--reps", type=int, default=4)
+    ap.add_argument("--blocks", type=int, default=5)
+    ap.add_argument("--traits", type=int, default=20)
+    ap.add_argument("--seasons", type=int, default=1)
+    ap.add_argument("--selected", type=int, default=10, help="traits selected in the User panel")
+    ap.add_argument("--page", type=int, default=100, help="plots per User panel page")
+    ap.add_argument("--iterations", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--compare", type=Path, default=None)
+    args = ap.parse_args()
+
+    data = run(args)
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    report(data, baseline)
+
+    out = args.out or RESULTS_DIR / f"{data['timestamp'].replace(':', '')}-{data['commit']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(data, indent=2))
+    print(f"wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
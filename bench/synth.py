@@ -0,0 +1,64 @@
+# Synthetic trial data matching sql/schema.sql, as a sheet-shaped frame
+# (A–G + one column per trait) that can be written to xlsx for the upload
+# path or loaded straight into a location through the repository.
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from ingest import FIXED_COLS
+
+SEASONS = ["Kharif", "Rabi", "Zaid"]
+
+
+def trial_frame(plots=500, reps=4, blocks=5, traits=10, seasons=1, year=2026,
+                exp_id="SYN", location="Synthetic", missing=0.05, seed=0):
+    # `plots` per season; treatments cycle within each replication so the
+    # layout looks like an RCBD.
+    rng = np.random.default_rng(seed)
+    n = plots * seasons
+    i = np.arange(n)
+    per_rep = max(plots // reps, 1)
+
+    df = pd.DataFrame({
+        "exp_id": exp_id,
+        "location": location,
+        "year": year - (i // plots) // len(SEASONS),
+        "season": [SEASONS[s % len(SEASONS)] for s in i // plots],
+        "replication": (i % plots) // per_rep % reps + 1,
+        "block": (i % per_rep) % blocks + 1,
+        "treatment": [f"T{t}" for t in (i % per_rep)],
+    })
+
+    effects = rng.normal(0, 1, size=per_rep)
+    for j in range(traits):
+        base = rng.uniform(10, 500)
+        vals = base + effects[i % per_rep] * base * 0.05 + rng.normal(0, base * 0.1, size=n)
+        vals[rng.random(n) < missing] = np.nan
+        df[f"trait_{j:02d}"] = vals.round(3)
+
+    return df
+
+
+def write_workbook(df, target):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        ws.append([None if pd.isna(v) else (v.item() if hasattr(v, "item") else v) for v in row])
+    wb.save(target)
+
+
+def load_frame(repo, location_id, df, conn=None):
+    # Bulk-load a trial frame into a location without going through xlsx
+    traits = list(df.columns[len(FIXED_COLS):])
+    with repo.begin(conn) as c:
+        repo.add_traits(location_id, traits, exp_id=str(df["exp_id"].iloc[0]), conn=c)
+        rows = [
+            tuple(v.item() if hasattr(v, "item") else v for v in r)
+            for r in df[FIXED_COLS].itertuples(index=False)
+        ]
+        ids = repo.insert_metadata(rows, location_id, conn=c)
+
+        vals = df[traits].set_axis(ids).stack().dropna()
+        repo.upsert_observations(dict(zip(vals.index, vals.to_numpy())), location_id, conn=c)
+    return ids
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import uuid
+
+# Settings are read at import: every test module talks to a throwaway
+# SQLite file, created on first use like the embedded backend
+os.environ["AGRI_DB_BACKEND"] = "sqlite"
+os.environ["AGRI_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="agri_test_"), "agri.db")
+os.environ.pop("AGRI_JOURNAL_PATH", None)
+
+import pytest
+from sqlalchemy import text
+
+from db import cache
+from db.repo import get_repo
+
+
+@pytest.fixture
+def repo():
+    return get_repo()
+
+
+@pytest.fixture
+def location(repo):
+    # A location of its own per test, so tests never see each other's rows
+    name = f"test {uuid.uuid4().hex[:8]}"
+    repo.add_location(name)
+    cache.invalidate("locations")
+    with repo.begin() as c:
+        return c.execute(text("SELECT id FROM locations WHERE name=:n"), {"n": name}).scalar()
+
+
+@pytest.fixture
+def add_plots(repo):
+    # add_plots(location_id, rows, values, types=None) -> plot ids, where rows
+    # are the A–G tuples and values {(row index, trait): value}
+    def add(location_id, rows, values, types=None):
+        traits = list(dict.fromkeys(t for _, t in values))
+        with repo.begin() as c:
+            repo.add_traits(location_id, traits, conn=c, types=types)
+            ids = repo.insert_metadata(rows, location_id, conn=c)
+            repo.upsert_observations(
+                {(ids[i], t): v for (i, t), v in values.items()}, location_id, conn=c
+            )
+        cache.invalidate(
+            "experiment_metadata", "experiment_traits", "observation_data", location_id=location_id
+        )
+        return ids
+    return add
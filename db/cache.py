@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from db import metrics
+from db.db import get_engine
+
+# In-process read cache shared by every session on this server.
+# Entries are tagged with the tables they read and the location they were
+# loaded for, and every write path in app.py calls invalidate() for what it
+# touched. The TTL is only a safety net for writes made outside the app.
+MAX_ENTRIES = 256
+TTL_SECONDS = 300
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+# (table, location_id or None) -> write counter, for derived outputs
+# (exports, summaries) that key themselves on data_version()
+_versions = {}
+# table -> write counter over every location, for location-independent reads
+_table_gens = {}
+
+
+def _params_key(params):
+    return tuple(sorted(
+        (k, tuple(v) if isinstance(v, (list, tuple)) else v)
+        for k, v in (params or {}).items()
+    ))
+
+
+def _generation(tables, location_id):
+    # Call with _lock held. Moves on every invalidate() that would drop an
+    # entry for these tables and location.
+    if location_id is None:
+        return (_versions.get(("*", None), 0),) + tuple(_table_gens.get(t, 0) for t in sorted(tables))
+    return (_versions.get(("*", None), 0),) + tuple(
+        _versions.get((t, location_id), 0) + _versions.get((t, None), 0)
+        for t in sorted(tables)
+    )
+
+
+def read_sql(sql, tables, location_id=None, params=None):
+    # Cached pd.read_sql. Returned frames are shared: treat them as read-only.
+    key = (str(sql), _params_key(params), location_id)
+    now = time.monotonic()
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry[0] > now:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[3]
+        _stats["misses"] += 1
+        gen = _generation(tables, location_id)
+
+    df = pd.read_sql(sql, get_engine(), params=params)
+    metrics.add_rows(len(df))
+
+    with _lock:
+        # A write invalidated these tables while we were reading: the frame
+        # may predate it, so hand it out but don't keep it
+        if _generation(tables, location_id) != gen:
+            return df
+        _entries[key] = (now + TTL_SECONDS, frozenset(tables), location_id, df)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+    return df
+
+
+def invalidate(*tables, location_id=None):
+    # Drop entries reading any of `tables`. With a location_id only that
+    # location's entries (and location-independent ones) are dropped.
+    tables = set(tables)
+    with _lock:
+        for t in tables:
+            _versions[(t, location_id)] = _versions.get((t, location_id), 0) + 1
+            _table_gens[t] = _table_gens.get(t, 0) + 1
+
+        stale = [
+            k for k, (_, t, loc, _) in _entries.items()
+            if t & tables and (location_id is None or loc is None or loc == location_id)
+        ]
+        for k in stale:
+            del _entries[k]
+        _stats["invalidations"] += len(stale)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _versions[("*", None)] = _versions.get(("*", None), 0) + 1
+
+
+def data_version(tables, location_id=None):
+    # Changes whenever invalidate() touches one of `tables` for this location
+    # (for any location when location_id is None)
+    with _lock:
+        return _generation(tables, location_id)
+
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
+
+
+metrics.collector("cache", cache_stats)
@@ -1,25 +1,130 @@
+import os
+import threading
+import time
+
 import streamlit as st
-from sqlalchemy import create_engine
-import mysql.connector
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+def setting(name, default=None):
+    # AGRI_<NAME> environment variable first (CI, benchmarks, field laptops),
+    # then the "Secrets" area of Streamlit Cloud / .streamlit/secrets.toml
+    env = os.environ.get(f"AGRI_{name.upper()}")
+    if env is not None:
+        return env
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:
+        return default
+
+
+# "mysql" (default) or "sqlite" for the embedded single-file backend
+DB_BACKEND = setting("db_backend", "mysql")
+DB_PATH = setting("db_path", "agri.db")
+
+DB_HOST = setting("db_host")
+DB_PORT = setting("db_port", 3306)
+DB_USER = setting("db_user")
+DB_PASS = setting("db_password")
+DB_NAME = setting("db_name")
+
+# Pool sizing (optional secrets, sensible defaults for a single Streamlit server)
+POOL_SIZE = int(setting("db_pool_size", 10))
+POOL_MAX_OVERFLOW = int(setting("db_pool_max_overflow", 10))
+POOL_TIMEOUT = int(setting("db_pool_timeout", 30))
+POOL_RECYCLE = int(setting("db_pool_recycle", 1800))
+
+_stats_lock = threading.Lock()
+_stats = {
+    "checkouts": 0,
+    "checkins": 0,
+    "connects": 0,
+    "timeouts": 0,
+    "raw_checkouts": 0,
+    "wait_total_ms": 0.0,
+    "wait_max_ms": 0.0,
+}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
 
-# This pulls the info from the "Secrets" area of Streamlit Cloud
-DB_HOST = st.secrets["db_host"]
-DB_PORT = st.secrets["db_port"]
-DB_USER = st.secrets["db_user"]
-DB_PASS = st.secrets["db_password"]
-DB_NAME = st.secrets["db_name"]
 
+def _sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA foreign_keys=ON")
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA busy_timeout=30000")
+    cur.close()
+
+
+@st.cache_resource
 def get_engine():
-    # Construct connection string for SQLAlchemy
-    conn_url = f"mysql+mysqlconnector://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    return create_engine(conn_url)
+    # One engine (and one bounded pool) per server process, shared by every
+    # session and rerun. pre_ping drops connections MySQL closed on idle,
+    # recycle keeps us under wait_timeout.
+    pool_args = dict(
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+    )
+
+    if DB_BACKEND == "sqlite":
+        engine = create_engine(
+            f"sqlite:///{DB_PATH}",
+            connect_args={"check_same_thread": False},
+            **pool_args
+        )
+        event.listen(engine, "connect", _sqlite_pragmas)
+    elif DB_BACKEND == "mysql":
+        conn_url = f"mysql+mysqlconnector://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        engine = create_engine(
+            conn_url,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=True,
+            **pool_args
+        )
+    else:
+        raise ValueError(f"Unknown db_backend {DB_BACKEND!r} (expected 'mysql' or 'sqlite')")
+
+    event.listen(engine, "connect", lambda *a: _bump("connects"))
+    event.listen(engine, "checkout", lambda *a: _bump("checkouts"))
+    event.listen(engine, "checkin", lambda *a: _bump("checkins"))
+    return engine
+
 
 def get_connection():
-    # Construct standard connection for Cursors
-    return mysql.connector.connect(
-        host=DB_HOST,
-        port=int(DB_PORT),
-        user=DB_USER,
-        password=DB_PASS,
-        database=DB_NAME
+    # Raw DB-API connection checked out of the shared pool.
+    # conn.close() hands it back to the pool instead of closing the socket.
+    # App code goes through db.repo; this is for the MySQL-only tools.
+    start = time.perf_counter()
+    try:
+        conn = get_engine().raw_connection()
+    except PoolTimeoutError:
+        _bump("timeouts")
+        raise
+
+    waited = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats["raw_checkouts"] += 1
+        _stats["wait_total_ms"] += waited
+        _stats["wait_max_ms"] = max(_stats["wait_max_ms"], waited)
+    return conn
+
+
+def pool_stats():
+    pool = get_engine().pool
+    with _stats_lock:
+        stats = dict(_stats)
+
+    stats["pool_size"] = pool.size()
+    stats["checked_out"] = pool.checkedout()
+    stats["checked_in"] = pool.checkedin()
+    stats["overflow"] = pool.overflow()
+    stats["max_overflow"] = POOL_MAX_OVERFLOW
+    stats["wait_avg_ms"] = (
+        stats["wait_total_ms"] / stats["raw_checkouts"] if stats["raw_checkouts"] else 0.0
     )
+    return stats
@@ -0,0 +1,272 @@
+# EXPLAIN every statement the app actually runs and fail if one falls back
+# to a full table scan on the large tables.
+#
+#   python -m db.explain_check [--plots N]
+#
+# The statements are not listed here, they are recorded (db.metrics
+# recording()) while record() drives a scratch location through the pages
+# (AppTest: User entry with a Save and Submit, every Admin tab, Super Admin)
+# and through what the pages hand off: export, archive, reopen, replace and
+# delete jobs and a device sync. The scratch location and everything under
+# it is removed afterwards. Run it against a database with realistic volume
+# in the other locations (e.g. after bench/bench_save.py or a real season);
+# on near-empty tables MySQL may legitimately prefer a scan.
+# test_explain_check.py runs it on SQLite.
+import argparse
+import io
+import re
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import text
+
+from db import cache, metrics
+from db.db import get_engine
+
+# Tables that grow with every season or every save; locations/users stay tiny.
+LARGE_TABLES = {
+    "experiment_metadata", "experiment_traits", "observation_data", "change_log",
+    "jobs", "sync_batches", "archived_seasons", "export_checkpoints",
+}
+APP = Path(__file__).resolve().parent.parent / "app.py"
+PLOTS = 200
+JOB_TIMEOUT = 120
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+# -- workload -----------------------------------------------------------
+
+def _session(role, location_id):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APP), default_timeout=JOB_TIMEOUT)
+    at.session_state["user"] = {
+        "id": 0, "username": "explain_check", "role": role, "location_id": location_id
+    }
+    return at
+
+
+def _widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+def _run(at, admin_tab=None):
+    # The tab key is set again before every run, like a click on the tab
+    if admin_tab:
+        at.session_state["admin_tab"] = admin_tab
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"app.py raised: {at.exception[0].message}")
+    return at
+
+
+def _user_pages(location_id, trait):
+    at = _run(_session("user", location_id))
+    _widget(at.multiselect, "Select traits (H+)").set_value([trait])
+    _widget(_run(at).radio, "Entry mode").set_value("Form")
+    _run(at)
+    number = next(w for w in at.number_input if w.key and w.key.endswith(f"_{trait}"))
+    number.set_value(123.0)
+    _widget(at.button, "💾 Save").click()
+    _widget(_run(at).button, "✅ Submit").click()
+    _run(at)
+
+
+def _admin_pages(location_id):
+    at = _run(_session("admin", location_id))
+    for tab in [t.label for t in at.tabs]:
+        _run(at, tab)
+        # the reads behind a click, a toggle or the second export mode
+        for w in at.button:
+            if w.label == "Compare with a fresh pivot":
+                w.click()
+                _run(at, tab)
+        for w in at.toggle:
+            if w.label in ("Show change log", "Preview"):
+                w.set_value(True)
+                _run(at, tab)
+        for w in at.radio:
+            if w.label == "Rows":
+                w.set_value("Changes since a checkpoint")
+                _run(at, tab)
+
+
+def _super_admin_pages(location_id):
+    _run(_session("super_admin", location_id))
+
+
+def _wait(runner, job_id):
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while time.monotonic() < deadline:
+        job = runner.repo.job(job_id)
+        if job["status"] not in ("queued", "running"):
+            if job["status"] != "done":
+                raise RuntimeError(f"job {job_id} ({job['kind']}) {job['status']}: {job['error']}")
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(f"job {job_id} still running after {JOB_TIMEOUT}s")
+
+
+def _jobs(runner, location_id, df):
+    import archive
+    from bench.synth import write_workbook
+    from jobs import save_upload
+
+    def run(kind, params=None):
+        return _wait(runner, runner.submit(kind, location_id, params, "explain_check"))
+
+    for fmt in ("csv", "parquet"):
+        run("export", {"status": "Submitted", "fmt": fmt})
+    run("export", {"status": "Submitted", "fmt": "csv", "since": 0})
+    if archive.AVAILABLE:
+        run("archive", {"year": int(df["year"].iloc[-1]), "season": df["season"].iloc[-1]})
+    run("reopen")
+
+    buf = io.BytesIO()
+    write_workbook(df, buf)
+    buf.name = "explain_check.xlsx"
+    buf.seek(0)
+    run("replace", {"path": save_upload(buf)})
+    run("delete")
+
+
+def _sync(repo, location_id, trait):
+    from db.journal import apply_batch, encode_batch
+
+    mid = int(cache.read_sql(
+        text("SELECT MIN(id) id FROM experiment_metadata WHERE location_id=:loc"),
+        ["experiment_metadata"], location_id, params={"loc": location_id}
+    )["id"].iloc[0])
+    batch = f"explain-check-{uuid.uuid4().hex}"
+    entries = [
+        {"location_id": location_id, "metadata_id": mid, "attribute_name": trait,
+         "baseline": None, "value": 7.0},
+        {"location_id": location_id, "metadata_id": None, "attribute_name": None,
+         "baseline": None, "value": None},
+    ]
+    apply_batch(repo, encode_batch(batch, entries))
+    return batch
+
+
+def _remove(repo, location_id, batch):
+    repo.delete_location_data(location_id)
+    with repo.begin() as c:
+        for table in ("change_log", "export_checkpoints", "archived_seasons", "jobs"):
+            c.execute(text(f"DELETE FROM {table} WHERE location_id=:loc"), {"loc": location_id})
+        c.execute(text("DELETE FROM sync_batches WHERE batch_id=:b"), {"b": batch})
+        c.execute(text("DELETE FROM locations WHERE id=:loc OR staging_for=:loc"), {"loc": location_id})
+    cache.clear()
+
+
+def record(plots=PLOTS):
+    # [(sql, parameters, span)] for every statement the workload ran on the
+    # app database, first occurrence of each
+    import archive
+    from bench.synth import load_frame, trial_frame
+    from db.repo import get_repo
+    from jobs import get_runner
+
+    repo = get_repo()
+    name = f"explain check {uuid.uuid4().hex[:8]}"
+    repo.add_location(name)
+    cache.invalidate("locations")
+    with repo.begin() as c:
+        location_id = c.execute(text("SELECT id FROM locations WHERE name=:n"), {"n": name}).scalar()
+
+    df = trial_frame(plots, traits=4, seasons=2)
+    trait = df.columns[-1]
+    archive_dir, batch = archive.ARCHIVE_DIR, None
+    try:
+        load_frame(repo, location_id, df)
+        cache.clear()
+        with tempfile.TemporaryDirectory() as tmp, metrics.recording() as seen:
+            archive.ARCHIVE_DIR = Path(tmp)
+            _user_pages(location_id, trait)
+            _admin_pages(location_id)
+            _super_admin_pages(location_id)
+            batch = _sync(repo, location_id, trait)
+            _jobs(get_runner(), location_id, df)
+    finally:
+        archive.ARCHIVE_DIR = archive_dir
+        _remove(repo, location_id, batch)
+
+    engine, statements = get_engine(), {}
+    for eng, sql, params, where in seen:
+        if eng is engine and sql.lstrip().split(None, 1)[0].upper() in EXPLAINED:
+            statements.setdefault(" ".join(sql.split()), (sql, params, where))
+    return list(statements.values())
+
+
+# -- plans --------------------------------------------------------------
+
+def _tables(sql):
+    # alias or table name as a plan shows it -> table
+    names = {}
+    for table, alias in re.findall(
+        r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.I
+    ):
+        names[table] = table
+        if alias and alias.upper() not in {
+            "WHERE", "SET", "ON", "JOIN", "LEFT", "INNER", "GROUP", "ORDER", "LIMIT",
+            "VALUES", "SELECT", "USING", "AND", "UNION",
+        }:
+            names[alias] = table
+    return names
+
+
+def full_scans(conn, sql, params):
+    # (scanned large tables, plan rows)
+    names = _tables(sql)
+    cur = conn.connection.cursor()
+    try:
+        if conn.dialect.name == "sqlite":
+            cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [r[-1] for r in cur.fetchall()]
+            scanned = [m.group(1) for m in map(re.compile(r"^SCAN (\w+)").match, plan) if m]
+        else:
+            cur.execute("EXPLAIN " + sql, params)
+            cols = [d[0] for d in cur.description]
+            rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+            plan = [f"table={r.get('table')} type={r.get('type')} key={r.get('key')} rows={r.get('rows')}"
+                    for r in rows]
+            scanned = [r.get("table") for r in rows if r.get("type") == "ALL"]
+    finally:
+        cur.close()
+    return sorted({names[t] for t in scanned if names.get(t) in LARGE_TABLES}), plan
+
+
+def check(statements):
+    # {sql: (span, scanned tables, plan)} for the statements that scan
+    failures = {}
+    with get_engine().connect() as conn:
+        for sql, params, where in statements:
+            bad, plan = full_scans(conn, sql, params)
+            if bad:
+                failures[sql] = (where, bad, plan)
+        conn.rollback()
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plots", type=int, default=PLOTS, help="plots per season in the scratch location")
+    args = ap.parse_args()
+
+    statements = record(args.plots)
+    failures = check(statements)
+    for sql, params, where in statements:
+        short = " ".join(sql.split())[:metrics.MAX_SQL_CHARS]
+        print(f"{'FULL SCAN' if sql in failures else 'ok':9s}  {where}: {short}")
+        if sql in failures:
+            for line in failures[sql][2]:
+                print(f"           {line}")
+
+    print(f"{len(statements)} statements, {len(failures)} with full scans")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+import zlib
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import bindparam, create_engine, event, text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from db import cache
+from db import metrics
+from db import wide as wide_store
+from db.db import _sqlite_pragmas, setting
+from db.repo import get_repo
+
+# Offline-first field entry. With JOURNAL_PATH set, a Save in the User
+# panel only appends the edited cells to a local SQLite journal, which
+# never needs the network. A background thread pushes pending entries to
+# the server in batches:
+#
+#   - a batch is zlib-compressed JSON with one entry per cell (the last
+#     value and the first baseline when a cell was edited several times);
+#   - the batch id is stored on the journal rows before sending and the
+#     server records every batch it applied (sync_batches), so a batch
+#     resent after a lost reply gets the stored result and is not applied
+#     twice;
+#   - each cell is checked against its baseline (what the grid showed when
+#     it was edited); cells someone else changed meanwhile come back as
+#     conflicts and wait for the user to keep theirs or take the server's.
+#
+# Page loads still read from the server (through the read cache).
+JOURNAL_PATH = setting("journal_path")  # unset: saves go straight to the server
+SYNC_BATCH = int(setting("sync_batch", 500))
+SYNC_INTERVAL = float(setting("sync_interval_seconds", 15))
+DEVICE = setting("device_id") or socket.gethostname()
+
+log = logging.getLogger("agri.journal")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS journal (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        location_id INTEGER NOT NULL,
+        metadata_id INTEGER,
+        attribute_name VARCHAR(100),
+        value TEXT,
+        baseline TEXT,
+        created_by VARCHAR(100),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        batch_id VARCHAR(64),
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        server_value TEXT,
+        synced_at TIMESTAMP NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_journal_status ON journal (status, id)",
+    "CREATE INDEX IF NOT EXISTS idx_journal_batch ON journal (batch_id)",
+]
+# metadata_id NULL is a Submit; value NULL clears the cell. status is
+# pending -> synced, or conflict -> discarded once the user decided.
+# value, baseline and server_value hold JSON ("7.0", "\"007\""), so a text
+# trait's "007" or "1e3" comes back exactly as typed rather than as a number.
+
+INSERT_SQL = text("""
+    INSERT INTO journal (location_id,metadata_id,attribute_name,value,baseline,created_by)
+    VALUES (:loc,:m,:a,:v,:b,:by)
+""")
+
+
+def _dump(value):
+    # NULL for no value (None or NaN)
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return json.dumps(value if isinstance(value, str) else float(value))
+
+
+def _load(value):
+    return None if value is None else json.loads(value)
+
+
+def _upgrade(c):
+    # Journals created before the values were JSON declared them DOUBLE;
+    # SQLite kept numbers as REAL and anything non-numeric as TEXT
+    columns = {r[1]: r[2] for r in c.execute(text("PRAGMA table_info(journal)"))}
+    if columns.get("value", "").upper() != "DOUBLE":
+        return
+    c.execute(text("ALTER TABLE journal RENAME TO journal_old"))
+    c.execute(text(SCHEMA[0]))
+    rows = [dict(r) for r in c.execute(text("SELECT * FROM journal_old")).mappings()]
+    for r in rows:
+        for col in ("value", "baseline", "server_value"):
+            r[col] = _dump(r[col])
+    if rows:
+        c.execute(text("""
+            INSERT INTO journal
+            (id,location_id,metadata_id,attribute_name,value,baseline,created_by,created_at,
+             batch_id,status,server_value,synced_at)
+            VALUES (:id,:location_id,:metadata_id,:attribute_name,:value,:baseline,:created_by,
+                    :created_at,:batch_id,:status,:server_value,:synced_at)
+        """), rows)
+    c.execute(text("DROP TABLE journal_old"))
+
+
+# -- wire format --------------------------------------------------------
+
+def encode_batch(batch_id, entries):
+    cells, submits = {}, set()
+    for e in entries:
+        if e["metadata_id"] is None:
+            submits.add(e["location_id"])
+            continue
+        key = (e["location_id"], e["metadata_id"], e["attribute_name"])
+        if key in cells:
+            cells[key][1] = e["value"]
+        else:
+            cells[key] = [e["baseline"], e["value"]]
+
+    return zlib.compress(json.dumps({
+        "batch": batch_id,
+        "device": DEVICE,
+        "entries": len(entries),
+        "cells": [[*key, base, val] for key, (base, val) in cells.items()],
+        "submit": sorted(submits),
+    }).encode())
+
+
+def apply_batch(repo, blob):
+    # Server side of a sync, in one transaction. Returns
+    # {"applied": n, "conflicts": [[loc, mid, trait, server value]], "held": [loc]}
+    # where "held" are Submits not applied because the location had conflicts.
+    batch = json.loads(zlib.decompress(blob))
+    with repo.begin() as conn:
+        done = repo.sync_result(batch["batch"], conn=conn)
+        if done is not None:
+            return json.loads(done)
+
+        by_loc = {}
+        for loc, mid, trait, base, val in batch["cells"]:
+            by_loc.setdefault(loc, {})[(mid, trait)] = (base, val)
+
+        applied, conflicts = 0, []
+        # locations in id order, so two batches lock their change logs alike
+        for loc, cells in sorted(by_loc.items()):
+            baseline = {k: base for k, (base, _) in cells.items()}
+            found = repo.find_conflicts(list(cells), baseline, loc, conn=conn)
+            # someone else already wrote the same value: nothing to decide
+            found = {k: cur for k, (_, cur) in found.items() if cur != cells[k][1]}
+            # a trait removed on the server meanwhile has nowhere to store the value
+            known = repo.trait_keys(loc, conn=conn)
+            found.update({k: None for k, (_, val) in cells.items() if k[1] not in known and val is not None})
+
+            ok = {k: val for k, (_, val) in cells.items() if k not in found}
+            repo.upsert_observations({k: v for k, v in ok.items() if v is not None}, loc, conn=conn)
+            repo.delete_observations([k for k, v in ok.items() if v is None], loc, conn=conn)
+            repo.log_cells(loc, ok, by=batch["device"], conn=conn)
+            applied += len(ok)
+            conflicts += [[loc, mid, trait, cur] for (mid, trait), cur in found.items()]
+
+        held = sorted({c[0] for c in conflicts} & set(batch["submit"]))
+        for loc in batch["submit"]:
+            if loc not in held:
+                repo.set_status(loc, "Submitted", conn=conn, by=batch["device"])
+
+        result = {"applied": applied, "conflicts": conflicts, "held": held}
+        repo.record_sync(batch["batch"], batch["device"], batch["entries"], json.dumps(result), conn=conn)
+    return result
+
+
+# -- device side --------------------------------------------------------
+
+class Journal:
+    def __init__(self, path, repo):
+        self.repo = repo
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        event.listen(self.engine, "connect", _sqlite_pragmas)
+        with self.engine.begin() as c:
+            _upgrade(c)
+            for stmt in SCHEMA:
+                c.execute(text(stmt))
+
+        self.lock = threading.Lock()  # one sync at a time
+        self.wake = threading.Event()
+        self.last_sync = None
+        self.last_error = None
+
+    def record(self, location_id, values, baseline, user, submit=False):
+        # values: {(metadata_id, attribute_name): value or None}
+        rows = [
+            {"loc": location_id, "m": int(mid), "a": trait,
+             "v": _dump(val), "b": _dump(baseline.get((mid, trait))), "by": user}
+            for (mid, trait), val in values.items()
+        ]
+        if submit:
+            rows.append({"loc": location_id, "m": None, "a": None, "v": None, "b": None, "by": user})
+        if rows:
+            with self.engine.begin() as c:
+                c.execute(INSERT_SQL, rows)
+            self.wake.set()
+        return len(rows)
+
+    def overlay(self, location_id):
+        # Latest unsent value per cell, to lay over what the server returned
+        with self.engine.connect() as c:
+            rows = c.execute(text("""
+                SELECT metadata_id,attribute_name,value FROM journal
+                WHERE location_id=:loc AND status='pending' AND metadata_id IS NOT NULL
+                ORDER BY id
+            """), {"loc": location_id}).all()
+        return {(mid, trait): _load(val) for mid, trait, val in rows}
+
+    def status(self):
+        with self.engine.connect() as c:
+            counts = dict(c.execute(text("""
+                SELECT status,COUNT(*) FROM journal
+                WHERE status IN ('pending','conflict') GROUP BY status
+            """)).all())
+        return {
+            "pending": counts.get("pending", 0),
+            "conflicts": counts.get("conflict", 0),
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+        }
+
+    def conflicts(self, location_id):
+        # Latest conflicting entry per cell (Submits have no cell)
+        with self.engine.connect() as c:
+            df = pd.read_sql(text("""
+                SELECT id,metadata_id,attribute_name,value,server_value,created_by,created_at
+                FROM journal
+                WHERE location_id=:loc AND status='conflict'
+                ORDER BY id
+            """), c, params={"loc": location_id})
+        for col in ("value", "server_value"):
+            df[col] = df[col].map(_load, na_action="ignore").astype(object)
+        return df.drop_duplicates(["metadata_id", "attribute_name"], keep="last")
+
+    def resolve(self, location_id, keep_mine):
+        # Keep mine: queue the values again against the server's current
+        # ones, so the next sync overwrites them. Otherwise drop them.
+        conflicts = self.conflicts(location_id)
+        with self.engine.begin() as c:
+            if keep_mine:
+                for r in conflicts.itertuples():
+                    c.execute(INSERT_SQL, {
+                        "loc": location_id,
+                        "m": None if pd.isna(r.metadata_id) else int(r.metadata_id),
+                        "a": r.attribute_name, "v": _dump(r.value), "b": _dump(r.server_value),
+                        "by": r.created_by,
+                    })
+            c.execute(text("""
+                UPDATE journal SET status='discarded'
+                WHERE location_id=:loc AND status='conflict'
+            """), {"loc": location_id})
+        self.wake.set()
+
+    def _next_batch(self):
+        # Entries already sent under a batch id go again under the same id:
+        # the server may have applied them before we heard back.
+        with self.engine.begin() as c:
+            batch_id = c.execute(text("""
+                SELECT batch_id FROM journal
+                WHERE status='pending' AND batch_id IS NOT NULL LIMIT 1
+            """)).scalar()
+            if batch_id is None:
+                ids = c.execute(
+                    text("SELECT id FROM journal WHERE status='pending' ORDER BY id LIMIT :n"),
+                    {"n": SYNC_BATCH}
+                ).scalars().all()
+                if not ids:
+                    return None, []
+                batch_id = uuid.uuid4().hex
+                c.execute(
+                    text("UPDATE journal SET batch_id=:b WHERE id IN :ids")
+                    .bindparams(bindparam("ids", expanding=True)),
+                    {"b": batch_id, "ids": list(ids)}
+                )
+
+            entries = c.execute(text("""
+                SELECT location_id,metadata_id,attribute_name,value,baseline
+                FROM journal WHERE batch_id=:b ORDER BY id
+            """), {"b": batch_id}).mappings().all()
+        return batch_id, [
+            {**e, "value": _load(e["value"]), "baseline": _load(e["baseline"])} for e in entries
+        ]
+
+    def _finish(self, batch_id, result):
+        with self.engine.begin() as c:
+            for loc, mid, trait, server_value in result["conflicts"]:
+                c.execute(text("""
+                    UPDATE journal SET status='conflict',server_value=:sv
+                    WHERE batch_id=:b AND location_id=:loc AND metadata_id=:m AND attribute_name=:a
+                """), {"b": batch_id, "loc": loc, "m": mid, "a": trait, "sv": _dump(server_value)})
+            for loc in result["held"]:
+                c.execute(text("""
+                    UPDATE journal SET status='conflict'
+                    WHERE batch_id=:b AND location_id=:loc AND metadata_id IS NULL
+                """), {"b": batch_id, "loc": loc})
+            c.execute(text("""
+                UPDATE journal SET status='synced',synced_at=CURRENT_TIMESTAMP
+                WHERE batch_id=:b AND status='pending'
+            """), {"b": batch_id})
+
+    def sync(self):
+        # Push every pending entry; returns how many were sent. When the
+        # server is unreachable the entries stay pending for the next round.
+        if not self.lock.acquire(blocking=False):
+            return 0
+        sent = 0
+        try:
+            while True:
+                batch_id, entries = self._next_batch()
+                if not entries:
+                    break
+                try:
+                    with metrics.span("journal.sync"):
+                        result = apply_batch(self.repo, encode_batch(batch_id, entries))
+                except (DBAPIError, PoolTimeoutError) as e:
+                    self.last_error = str(getattr(e, "orig", None) or e).splitlines()[0][:200]
+                    log.warning("sync failed, %d entries pending: %s", len(entries), self.last_error)
+                    break
+
+                self._finish(batch_id, result)
+                sent += len(entries)
+                self.last_sync = time.time()
+                self.last_error = None
+
+                for loc in {e["location_id"] for e in entries}:
+                    cache.invalidate("observation_data", "experiment_metadata", location_id=loc)
+                    wide_store.drop(loc)
+        finally:
+            self.lock.release()
+        return sent
+
+    def _loop(self):
+        while True:
+            self.wake.wait(SYNC_INTERVAL)
+            self.wake.clear()
+            try:
+                self.sync()
+            except Exception:
+                log.exception("journal sync failed")
+
+    def start(self):
+        threading.Thread(target=self._loop, name="agri-journal-sync", daemon=True).start()
+
+
+@st.cache_resource
+def get_journal():
+    # None unless this server is a field device with a journal configured
+    if not JOURNAL_PATH:
+        return None
+    journal = Journal(JOURNAL_PATH, get_repo())
+    journal.start()
+    return journal
@@ -0,0 +1,323 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from db.db import setting, pool_stats
+
+# Timing spans with query and row counts.
+#
+#   with metrics.span("admin.upload"):
+#       ...
+#
+# Every statement on every engine is timed through cursor events and charged
+# to the spans open on the current thread; a Streamlit rerun runs on a single
+# script thread, so start_rerun()/end_rerun() around it give a per-rerun
+# breakdown. Per-span totals are exposed as Prometheus text on METRICS_PORT,
+# and slow queries / slow spans / reruns are logged as JSON lines.
+SLOW_QUERY_MS = float(setting("slow_query_ms", 500))
+SLOW_SPAN_MS = float(setting("slow_span_ms", 2000))
+METRICS_HOST = setting("metrics_host", "127.0.0.1")
+METRICS_PORT = setting("metrics_port")  # unset: no scrape endpoint
+MAX_SQL_CHARS = 300
+
+log = logging.getLogger("agri.metrics")
+
+_local = threading.local()
+_lock = threading.Lock()
+_spans = {}  # span name -> {"count", "seconds", "queries", "rows"}
+_queries = {"count": 0, "seconds": 0.0, "slow": 0, "rows": 0}
+_reruns = {"count": 0, "seconds": 0.0}
+_recent = deque(maxlen=50)  # finished reruns, oldest first
+_collectors = {}  # prefix -> fn returning {name: number}, exported as gauges
+_recorders = []  # open recording() lists
+_server = None
+
+
+def _record(name, depth):
+    return {"name": name, "depth": depth, "ms": 0.0, "queries": 0, "query_ms": 0.0, "rows": 0}
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _charge(queries=0, query_ms=0.0, rows=0):
+    for rec in _stack():
+        rec["queries"] += queries
+        rec["query_ms"] += query_ms
+        rec["rows"] += rows
+
+
+def add_rows(n):
+    # Rows read into a frame; SELECT cursors don't report a count up front
+    _charge(rows=int(n))
+    with _lock:
+        _queries["rows"] += int(n)
+
+
+@contextmanager
+def span(name):
+    stack = _stack()
+    rec = _record(name, len(stack))
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        rec["depth"] -= 1  # the rerun itself sits at the bottom of the stack
+        trace["spans"].append(rec)
+
+    stack.append(rec)
+    start = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        elapsed = time.perf_counter() - start
+        if rec in stack:
+            stack.remove(rec)
+        rec["ms"] = round(elapsed * 1000, 1)
+        rec["query_ms"] = round(rec["query_ms"], 1)
+
+        with _lock:
+            total = _spans.setdefault(name, {"count": 0, "seconds": 0.0, "queries": 0, "rows": 0})
+            total["count"] += 1
+            total["seconds"] += elapsed
+            total["queries"] += rec["queries"]
+            total["rows"] += rec["rows"]
+
+        if rec["ms"] >= SLOW_SPAN_MS:
+            log.warning(json.dumps({"event": "slow_span", **rec}))
+
+
+# -- reruns -------------------------------------------------------------
+
+def start_rerun(**tags):
+    # Anything left open on this thread (a rerun cut short by st.rerun())
+    # is dropped; its spans are already in the totals.
+    trace = {**_record("rerun", 0), "tags": tags, "at": time.time(), "spans": []}
+    _local.trace = trace
+    _local.stack = [trace]
+    _local.started = time.perf_counter()
+    return trace
+
+
+def tag(**tags):
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace["tags"].update(tags)
+
+
+def end_rerun():
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return None
+    elapsed = time.perf_counter() - _local.started
+    _local.trace = None
+    _local.stack = []
+
+    trace["ms"] = round(elapsed * 1000, 1)
+    trace["query_ms"] = round(trace["query_ms"], 1)
+    with _lock:
+        _reruns["count"] += 1
+        _reruns["seconds"] += elapsed
+        _recent.append(trace)
+
+    line = json.dumps({
+        "event": "rerun",
+        **{k: trace[k] for k in ("tags", "ms", "queries", "query_ms", "rows")},
+        "spans": {s["name"]: s["ms"] for s in trace["spans"] if s["depth"] == 0},
+    }, default=str)
+    log.log(logging.WARNING if trace["ms"] >= SLOW_SPAN_MS else logging.INFO, line)
+    return trace
+
+
+@contextmanager
+def fragment(name, **tags):
+    # A Streamlit fragment rerun executes only the fragment function, so it
+    # is traced as a rerun of its own; inside a full rerun it is just a span.
+    if getattr(_local, "trace", None) is not None:
+        with span(name) as rec:
+            yield rec
+        return
+
+    start_rerun(fragment=name, **tags)
+    try:
+        with span(name) as rec:
+            yield rec
+    finally:
+        end_rerun()
+
+
+def recent_reruns(min_ms=0):
+    with _lock:
+        return [t for t in _recent if t["ms"] >= min_ms]
+
+
+# -- queries ------------------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    ms = (time.perf_counter() - start) * 1000
+    # DML reports affected rows; SELECT rows come in through add_rows()
+    rows = cursor.rowcount if cursor.description is None and cursor.rowcount > 0 else 0
+    _charge(queries=1, query_ms=ms, rows=rows)
+
+    slow = ms >= SLOW_QUERY_MS
+    with _lock:
+        _queries["count"] += 1
+        _queries["seconds"] += ms / 1000
+        _queries["rows"] += rows
+        _queries["slow"] += slow
+
+    if _recorders:
+        stack = _stack()
+        seen = (conn.engine, statement, parameters[0] if executemany else parameters,
+                stack[-1]["name"] if stack else threading.current_thread().name)
+        with _lock:
+            for r in _recorders:
+                r.append(seen)
+
+    if slow:
+        stack = _stack()
+        log.warning(json.dumps({
+            "event": "slow_query",
+            "ms": round(ms, 1),
+            "span": stack[-1]["name"] if stack else None,
+            "sql": " ".join(statement.split())[:MAX_SQL_CHARS],
+        }))
+
+
+@contextmanager
+def recording():
+    # Every statement run on any thread while open, as
+    # (engine, sql, parameters, innermost span or thread name); executemany
+    # keeps its first parameter set. Used by db.explain_check.
+    seen = []
+    with _lock:
+        _recorders.append(seen)
+    try:
+        yield seen
+    finally:
+        with _lock:
+            _recorders.remove(seen)
+
+
+# -- exposition ---------------------------------------------------------
+
+def collector(prefix, fn):
+    # Register a stats function whose numeric values are exported as gauges
+    _collectors[prefix] = fn
+
+
+def span_totals():
+    with _lock:
+        return {name: dict(t) for name, t in _spans.items()}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    with _lock:
+        spans = {name: dict(t) for name, t in _spans.items()}
+        queries = dict(_queries)
+        reruns = dict(_reruns)
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP agri_{name} {help_text}")
+        lines.append(f"# TYPE agri_{name} {kind}")
+        for suffix, labels, value in samples:
+            label = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"agri_{name}{suffix}{{{label}}} {value}" if label
+                         else f"agri_{name}{suffix} {value}")
+
+    metric("reruns_total", "counter", "Completed script reruns.",
+           [("", {}, reruns["count"])])
+    metric("rerun_seconds_total", "counter", "Time spent in completed reruns.",
+           [("", {}, reruns["seconds"])])
+    metric("queries_total", "counter", "SQL statements executed.",
+           [("", {}, queries["count"])])
+    metric("query_seconds_total", "counter", "Time spent executing SQL.",
+           [("", {}, queries["seconds"])])
+    metric("slow_queries_total", "counter", f"Statements slower than {SLOW_QUERY_MS:g} ms.",
+           [("", {}, queries["slow"])])
+    metric("rows_total", "counter", "Rows read into frames or written by DML.",
+           [("", {}, queries["rows"])])
+
+    metric("span_seconds", "summary", "Time spent in instrumented blocks.",
+           [s for name, t in sorted(spans.items()) for s in (
+               ("_sum", {"span": name}, t["seconds"]),
+               ("_count", {"span": name}, t["count"]),
+           )])
+    metric("span_queries_total", "counter", "SQL statements issued inside each block.",
+           [("", {"span": name}, t["queries"]) for name, t in sorted(spans.items())])
+    metric("span_rows_total", "counter", "Rows read or written inside each block.",
+           [("", {"span": name}, t["rows"]) for name, t in sorted(spans.items())])
+
+    for prefix, fn in _collectors.items():
+        try:
+            stats = fn()
+        except Exception:
+            log.exception("metrics collector %s failed", prefix)
+            continue
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric(f"{prefix}_{key}", "gauge", f"{prefix} {key}.", [("", {}, value)])
+
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # a scrape every few seconds would flood the server log
+        pass
+
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    # Start the /metrics endpoint once per process. No-op without a port;
+    # if the port is taken (a second server process) we log and carry on.
+    global _server
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, int(port)), _Handler)
+        except OSError as e:
+            log.warning("metrics endpoint not started on %s:%s: %s", host, port, e)
+            _server = False
+            return _server
+
+    threading.Thread(target=_server.serve_forever, name="agri-metrics", daemon=True).start()
+    return _server
+
+
+collector("db_pool", pool_stats)
@@ -0,0 +1,77 @@
+# Apply pending sql/migrations/*.sql in version order.
+#
+#   python -m db.migrate           apply everything pending
+#   python -m db.migrate --list    show applied / pending
+import argparse
+from pathlib import Path
+
+from db.db import get_connection
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "sql" / "migrations"
+
+
+def split_statements(sql):
+    lines = [l for l in sql.splitlines() if not l.strip().startswith("--")]
+    return [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+
+
+def available():
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+
+def applied(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(100) PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+
+def migrate(log=print):
+    conn = get_connection()
+    cur = conn.cursor()
+    done = applied(cur)
+
+    ran = []
+    try:
+        for path in available():
+            version = path.stem
+            if version in done:
+                continue
+
+            log(f"applying {version}")
+            # MySQL DDL commits implicitly, so each migration is recorded
+            # right after its statements succeed.
+            for stmt in split_statements(path.read_text(encoding="utf-8")):
+                cur.execute(stmt)
+            cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            conn.commit()
+            ran.append(version)
+    finally:
+        conn.close()
+
+    return ran
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--list", action="store_true")
+    args = ap.parse_args()
+
+    if args.list:
+        conn = get_connection()
+        done = applied(conn.cursor())
+        conn.close()
+        for path in available():
+            print(f"{'applied' if path.stem in done else 'pending'}  {path.stem}")
+        return
+
+    ran = migrate()
+    print(f"{len(ran)} migration(s) applied")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import pandas as pd
+
+# Helpers for observation_data rows (the SQL lives in db/repo.py). A cell
+# value is a float, or a str for traits with data_type 'text'.
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def same_value(a, b):
+    if isinstance(a, str) or isinstance(b, str):
+        return str(a) == str(b)
+    return float(a) == float(b)
+
+
+def cell_values(obs):
+    # One value column from attribute_value/text_value; stays float unless
+    # the rows include text traits
+    if "text_value" not in obs or obs["text_value"].isna().all():
+        return obs["attribute_value"].astype(float)
+    return obs["attribute_value"].astype(object).where(obs["text_value"].isna(), obs["text_value"])
+
+
+def pivot_values(obs, index):
+    # Long rows -> one column per trait; number traits come out float,
+    # text traits object
+    is_text = obs["text_value"].notna()
+    parts = [obs[~is_text].pivot(index=index, columns="attribute_name", values="attribute_value")]
+    if is_text.any():
+        parts.append(obs[is_text].pivot(index=index, columns="attribute_name", values="text_value"))
+    return pd.concat(parts, axis=1)
+
+
+def diff_grid(values, baseline, default=0.0):
+    # Compare submitted widget values with what the form showed.
+    # baseline: {(metadata_id, attribute_name): value or None}; a missing
+    # value was rendered as `default`, so leaving it untouched is not a change.
+    # Pass default=None when blanks are shown as blanks (grid mode).
+    inserted, changed, cleared = {}, {}, []
+
+    for key, val in values.items():
+        old = baseline.get(key)
+
+        if old is None:
+            if val is not None and (default is None or not same_value(val, default)):
+                inserted[key] = val
+        elif val is None:
+            cleared.append(key)
+        elif not same_value(val, old):
+            changed[key] = val
+
+    return {"inserted": inserted, "changed": changed, "cleared": cleared}
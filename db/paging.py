@@ -0,0 +1,87 @@
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from db import cache
+
+PAGE_SIZE = 100
+
+# Filter name -> column; values are lists, empty/None means "any"
+FILTER_COLS = {
+    "replication": "replication",
+    "block": "block",
+    "treatment": "treatment",
+    "entry_status": "entry_status",
+}
+
+
+def _where(location_id, filters, active_only):
+    clauses = ["location_id=:loc"]
+    params = {"loc": location_id}
+    expanding = []
+
+    if active_only:
+        clauses.append("is_active=1")
+
+    for name, col in FILTER_COLS.items():
+        vals = (filters or {}).get(name)
+        if vals:
+            clauses.append(f"{col} IN :{name}")
+            params[name] = list(vals)
+            expanding.append(name)
+
+    return " AND ".join(clauses), params, expanding
+
+
+def metadata_page(location_id, filters=None, after_id=0, page_size=PAGE_SIZE,
+                  active_only=True, columns="*"):
+    # Keyset pagination on experiment_metadata.id. Returns (page_df, has_next).
+    where, params, expanding = _where(location_id, filters, active_only)
+    sql = text(f"""
+        SELECT {columns} FROM experiment_metadata
+        WHERE {where} AND id>:after
+        ORDER BY id
+        LIMIT :lim
+    """).bindparams(*[bindparam(n, expanding=True) for n in expanding])
+
+    df = cache.read_sql(
+        sql, ["experiment_metadata"], location_id,
+        params={**params, "after": int(after_id), "lim": page_size + 1}
+    )
+    return df.iloc[:page_size], len(df) > page_size
+
+
+def metadata_count(location_id, filters=None, active_only=True):
+    where, params, expanding = _where(location_id, filters, active_only)
+    sql = text(f"SELECT COUNT(*) n FROM experiment_metadata WHERE {where}") \
+        .bindparams(*[bindparam(n, expanding=True) for n in expanding])
+    return int(cache.read_sql(sql, ["experiment_metadata"], location_id, params=params)["n"].iloc[0])
+
+
+def filter_options(location_id, active_only=True):
+    where = "location_id=:loc" + (" AND is_active=1" if active_only else "")
+    opts = {}
+    for name in ("replication", "block", "treatment"):
+        df = cache.read_sql(
+            text(f"SELECT DISTINCT {name} FROM experiment_metadata WHERE {where} ORDER BY {name}"),
+            ["experiment_metadata"], location_id,
+            params={"loc": location_id}
+        )
+        opts[name] = df[name].dropna().tolist()
+    return opts
+
+
+def observations_for(location_id, metadata_ids):
+    # Observation lookup restricted to the plots on the current page
+    if not len(metadata_ids):
+        return pd.DataFrame(columns=["metadata_id", "attribute_name", "attribute_value", "text_value"])
+
+    sql = text("""
+        SELECT o.metadata_id,t.trait_name attribute_name,o.attribute_value,o.text_value
+        FROM observation_data o
+        JOIN experiment_traits t ON t.id=o.trait_id
+        WHERE o.location_id=:loc AND o.metadata_id IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
+    return cache.read_sql(
+        sql, ["observation_data", "experiment_traits"], location_id,
+        params={"loc": location_id, "ids": [int(i) for i in metadata_ids]}
+    )
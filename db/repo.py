@@ -0,0 +1,760 @@
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import bindparam, text
+
+from db import cache
+from db.db import DB_BACKEND, get_engine
+from db.observations import chunks
+
+# Storage layer used by app.py, auth.py and ingest.py. All SQL is written
+# against SQLAlchemy text() with named parameters so it runs on MySQL and
+# on the embedded SQLite backend; the few dialect-specific pieces (upsert,
+# row locks, generated ids, schema bootstrap) live in the subclasses.
+#
+# Write methods take an optional `conn` to join a caller's transaction
+# (`with repo.begin() as conn:`); without one they commit on their own.
+# Reads go through the shared read cache and return DataFrames.
+
+SQL_DIR = Path(__file__).resolve().parent.parent / "sql"
+SQLITE_SCHEMA = SQL_DIR / "schema_sqlite.sql"
+# Upgrades for SQLite files created before a schema change that
+# CREATE ... IF NOT EXISTS can't apply: (script, table, column the script
+# adds), run in order on files whose table exists without that column
+SQLITE_UPGRADES = [
+    (SQL_DIR / "sqlite_upgrades" / "006_observation_trait_ids.sql", "observation_data", "trait_id"),
+    (SQL_DIR / "sqlite_upgrades" / "007_trait_bounds.sql", "experiment_traits", "min_value"),
+    (SQL_DIR / "sqlite_upgrades" / "009_session_epoch.sql", "users", "session_epoch"),
+    (SQL_DIR / "sqlite_upgrades" / "010_replace_staging.sql", "locations", "staging_for"),
+]
+
+LOG_SQL = text("""
+    INSERT INTO change_log
+    (metadata_id,trait_id,attribute_value,text_value,location_id,action,changed_by)
+    VALUES (:m,:t,:v,:x,:loc,:act,:by)
+""")
+
+
+def values_clause(rows, prefix="p", tail=""):
+    # Multi-row VALUES (...),(...) with named binds. `tail` ends every group,
+    # for values all rows share (e.g. ",:loc" bound once).
+    groups, params = [], {}
+    for i, row in enumerate(rows):
+        names = [f"{prefix}{i}_{j}" for j in range(len(row))]
+        groups.append("(" + ",".join(f":{n}" for n in names) + tail + ")")
+        params.update(zip(names, row))
+    return ",".join(groups), params
+
+
+def key_filter(keys):
+    # (metadata_id, trait_id) pairs as an OR of equalities
+    clauses, params = [], {}
+    for i, (mid, trait_id) in enumerate(keys):
+        clauses.append(f"(metadata_id=:m{i} AND trait_id=:t{i})")
+        params[f"m{i}"] = int(mid)
+        params[f"t{i}"] = int(trait_id)
+    return " OR ".join(clauses), params
+
+
+class Repository:
+    # bind parameters per statement; big statements are split to fit
+    max_params = 4000
+    lock_clause = ""
+    # rows removed per statement (and per transaction) by delete_location_data
+    delete_batch = 2000
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @contextmanager
+    def begin(self, conn=None):
+        if conn is not None:
+            yield conn
+            return
+        with self.engine.begin() as c:
+            yield c
+
+    def bootstrap(self):
+        pass
+
+    def batches(self, rows, width):
+        # Split rows so each statement carries at most max_params binds
+        return chunks(rows, max(1, self.max_params // width))
+
+    # -- dialect hooks ------------------------------------------------
+
+    def upsert_suffix(self):
+        raise NotImplementedError
+
+    def first_inserted_id(self, result, n):
+        raise NotImplementedError
+
+    # -- locations ----------------------------------------------------
+
+    def locations(self):
+        return cache.read_sql(
+            text("SELECT id,name FROM locations WHERE staging_for IS NULL"), ["locations"]
+        )
+
+    def add_location(self, name, conn=None):
+        with self.begin(conn) as c:
+            c.execute(text("INSERT INTO locations (name) VALUES (:name)"), {"name": name})
+
+    # A replace loads into a staging location nobody reads, then swaps it
+    # with the live one in one transaction (see jobs.run_replace)
+
+    def add_staging_location(self, location_id, job_id, conn=None):
+        with self.begin(conn) as c:
+            result = c.execute(
+                text("INSERT INTO locations (name,staging_for) VALUES (:name,:loc)"),
+                {"name": f"staging {location_id} (job {job_id})", "loc": location_id}
+            )
+            return self.first_inserted_id(result, 1)
+
+    def staging_locations(self, location_id, conn=None):
+        with self.begin(conn) as c:
+            return c.execute(
+                text("SELECT id FROM locations WHERE staging_for=:loc ORDER BY id"),
+                {"loc": location_id}
+            ).scalars().all()
+
+    def swap_location_data(self, location_id, staging_id, conn=None):
+        # The staging location's plots, traits and observations become the
+        # location's and the location's old ones move to staging
+        with self.begin(conn) as c:
+            for table in ("experiment_traits", "experiment_metadata", "observation_data"):
+                c.execute(text(f"""
+                    UPDATE {table}
+                    SET location_id=CASE WHEN location_id=:loc THEN :stage ELSE :loc END
+                    WHERE location_id IN (:loc,:stage)
+                """), {"loc": location_id, "stage": staging_id})
+
+    def drop_staging_location(self, staging_id):
+        # Its data in delete_batch transactions, then the row itself
+        self.delete_location_data(staging_id)
+        with self.begin() as c:
+            c.execute(
+                text("DELETE FROM locations WHERE id=:id AND staging_for IS NOT NULL"),
+                {"id": staging_id}
+            )
+
+    # -- users --------------------------------------------------------
+
+    def user_by_name(self, username, conn=None):
+        with self.begin(conn) as c:
+            row = c.execute(
+                text("""
+                    SELECT id,username,password_hash,role,location_id,session_epoch
+                    FROM users WHERE username=:u
+                """), {"u": username}
+            ).mappings().first()
+        return dict(row) if row else None
+
+    def set_password_hash(self, user_id, password_hash, conn=None):
+        with self.begin(conn) as c:
+            c.execute(
+                text("UPDATE users SET password_hash=:h WHERE id=:id"),
+                {"h": password_hash, "id": int(user_id)}
+            )
+
+    def end_sessions(self, user_id, conn=None):
+        # Revokes every session token issued to the user so far
+        with self.begin(conn) as c:
+            c.execute(
+                text("UPDATE users SET session_epoch=session_epoch+1 WHERE id=:id"),
+                {"id": int(user_id)}
+            )
+
+    def users(self):
+        return cache.read_sql(text("""
+            SELECT u.username,u.role,l.name location
+            FROM users u
+            LEFT JOIN locations l ON u.location_id=l.id
+        """), ["users", "locations"])
+
+    def create_user(self, username, password_hash, role, location_id, conn=None):
+        with self.begin(conn) as c:
+            c.execute(text("""
+                INSERT INTO users (username,password_hash,role,location_id)
+                VALUES (:u,:h,:r,:loc)
+            """), {"u": username, "h": password_hash, "r": role, "loc": location_id})
+
+    # -- experiment metadata -----------------------------------------
+
+    def treatments(self, location_id):
+        return cache.read_sql(
+            text("SELECT id,treatment,is_active FROM experiment_metadata WHERE location_id=:loc"),
+            ["experiment_metadata"], location_id,
+            params={"loc": location_id}
+        )
+
+    def add_treatment(self, location_id, vals, conn=None):
+        with self.begin(conn) as c:
+            c.execute(text("""
+                INSERT INTO experiment_metadata
+                (exp_id,location,year,season,replication,block,treatment,entry_status,is_active,location_id)
+                VALUES (:a,:b,:c,:d,:e,:f,:g,'Draft',1,:loc)
+            """), {**dict(zip("abcdefg", vals)), "loc": location_id})
+
+    def toggle_treatment(self, metadata_id, conn=None, by=None):
+        with self.begin(conn) as c:
+            c.execute(
+                text("UPDATE experiment_metadata SET is_active=1-is_active WHERE id=:id"),
+                {"id": int(metadata_id)}
+            )
+            self._log_toggle(c, "experiment_metadata", "metadata_id", "toggle_plot", metadata_id, by)
+
+    def set_status(self, location_id, status, from_status=None, conn=None, by=None):
+        # Logs every plot it moves, as "submit" or "reopen"
+        where = "location_id=:loc AND entry_status<>:st"
+        params = {"st": status, "loc": location_id}
+        if from_status:
+            where += " AND entry_status=:old"
+            params["old"] = from_status
+        with self.begin(conn) as c:
+            self._lock_log(c, location_id)
+            c.execute(text(f"""
+                INSERT INTO change_log (metadata_id,location_id,action,changed_by)
+                SELECT id,location_id,:act,:by FROM experiment_metadata WHERE {where}
+            """), {**params, "act": "submit" if status == "Submitted" else "reopen", "by": by})
+            c.execute(text(f"UPDATE experiment_metadata SET entry_status=:st WHERE {where}"), params)
+
+    def insert_metadata(self, rows, location_id, conn=None):
+        # rows: tuples of the A–G values. Returns generated ids in row order.
+        ids = []
+        with self.begin(conn) as c:
+            for chunk in self.batches(rows, 10):
+                vals, params = values_clause([(*r, "Draft", 1, location_id) for r in chunk])
+                result = c.execute(text(f"""
+                    INSERT INTO experiment_metadata
+                    (exp_id,location,year,season,replication,block,treatment,entry_status,is_active,location_id)
+                    VALUES {vals}
+                """), params)
+
+                first = self.first_inserted_id(result, len(chunk))
+                ids += c.execute(text("""
+                    SELECT id FROM experiment_metadata
+                    WHERE location_id=:loc AND id>=:first
+                    ORDER BY id LIMIT :n
+                """), {"loc": location_id, "first": first, "n": len(chunk)}).scalars().all()
+        return ids
+
+    def delete_location_data(self, location_id, conn=None, progress=None):
+        # Children first, delete_batch rows at a time by primary key. Without
+        # a caller's transaction every batch commits on its own, so clearing a
+        # large location never holds row locks (or SQLite's write lock) for
+        # longer than one batch. progress(rows_deleted) runs between batches.
+        deleted = 0
+        for table in ("observation_data", "experiment_traits", "experiment_metadata"):
+            while True:
+                with self.begin(conn) as c:
+                    ids = c.execute(
+                        text(f"SELECT id FROM {table} WHERE location_id=:loc LIMIT :n"),
+                        {"loc": location_id, "n": self.delete_batch}
+                    ).scalars().all()
+                    if ids:
+                        c.execute(
+                            text(f"DELETE FROM {table} WHERE id IN :ids")
+                            .bindparams(bindparam("ids", expanding=True)),
+                            {"ids": list(ids)}
+                        )
+                deleted += len(ids)
+                if progress:
+                    progress(deleted)
+                if len(ids) < self.delete_batch:
+                    break
+        return deleted
+
+    # -- seasons ------------------------------------------------------
+
+    def seasons(self, location_id, active_only=False):
+        # Seasons still in the hot tables, with how many plots are in Draft
+        return cache.read_sql(
+            text(f"""
+                SELECT year,season,COUNT(*) plots,
+                       SUM(CASE WHEN entry_status='Draft' THEN 1 ELSE 0 END) drafts
+                FROM experiment_metadata
+                WHERE location_id=:loc{" AND is_active=1" if active_only else ""}
+                GROUP BY year,season
+                ORDER BY year,season
+            """),
+            ["experiment_metadata"], location_id,
+            params={"loc": location_id}
+        )
+
+    def season_ids(self, location_id, year, season, conn=None):
+        with self.begin(conn) as c:
+            return c.execute(text("""
+                SELECT id FROM experiment_metadata
+                WHERE location_id=:loc AND year=:y AND season=:s
+                ORDER BY id
+            """), {"loc": location_id, "y": int(year), "s": season}).scalars().all()
+
+    def delete_plots(self, metadata_ids, conn=None):
+        # Plots and their observations, delete_batch plots per transaction
+        # unless a caller's conn is given (see delete_location_data)
+        for batch in chunks(list(metadata_ids), self.delete_batch):
+            with self.begin(conn) as c:
+                for table, col in (("observation_data", "metadata_id"), ("experiment_metadata", "id")):
+                    c.execute(
+                        text(f"DELETE FROM {table} WHERE {col} IN :ids")
+                        .bindparams(bindparam("ids", expanding=True)),
+                        {"ids": batch}
+                    )
+
+    def archived_seasons(self, location_id):
+        return cache.read_sql(
+            text("""
+                SELECT year,season,plots,observations,path,archived_by,archived_at
+                FROM archived_seasons WHERE location_id=:loc
+                ORDER BY year,season
+            """),
+            ["archived_seasons"], location_id,
+            params={"loc": location_id}
+        )
+
+    def add_archived_season(self, location_id, year, season, plots, observations, path,
+                            archived_by, conn=None):
+        with self.begin(conn) as c:
+            c.execute(text("""
+                INSERT INTO archived_seasons
+                (location_id,year,season,plots,observations,path,archived_by)
+                VALUES (:loc,:y,:s,:p,:o,:path,:by)
+            """), {"loc": location_id, "y": int(year), "s": season, "p": plots,
+                   "o": observations, "path": path, "by": archived_by})
+
+    # -- traits -------------------------------------------------------
+
+    def traits(self, location_id):
+        return cache.read_sql(
+            text("""
+                SELECT id,trait_name,data_type,unit,min_value,max_value,is_active
+                FROM experiment_traits WHERE location_id=:loc
+            """),
+            ["experiment_traits"], location_id,
+            params={"loc": location_id}
+        )
+
+    def active_traits(self, location_id):
+        return cache.read_sql(
+            text("""
+                SELECT trait_name
+                FROM experiment_traits
+                WHERE is_active=1 AND location_id=:loc
+            """),
+            ["experiment_traits"], location_id,
+            params={"loc": location_id}
+        )["trait_name"].tolist()
+
+    def trait_keys(self, location_id, conn=None):
+        # trait name -> (id, data_type) for the write paths. Read on the
+        # caller's connection so traits added earlier in its transaction are
+        # seen; a name listed twice maps to its oldest row.
+        with self.begin(conn) as c:
+            rows = c.execute(text("""
+                SELECT id,trait_name,data_type FROM experiment_traits
+                WHERE location_id=:loc ORDER BY id DESC
+            """), {"loc": location_id}).all()
+        return {name: (int(tid), data_type) for tid, name, data_type in rows}
+
+    def add_traits(self, location_id, names, exp_id="MANUAL", conn=None, types=None):
+        # types: {name: data_type}, "number" when missing. Names the location
+        # already has are skipped; returns the names added.
+        types = types or {}
+        with self.begin(conn) as c:
+            known = self.trait_keys(location_id, conn=c)
+            added = [n for n in dict.fromkeys(names) if n not in known]
+            rows = [(exp_id, n, types.get(n, "number"), "", 1, location_id) for n in added]
+            for chunk in self.batches(rows, 6):
+                vals, params = values_clause(chunk)
+                c.execute(text(f"""
+                    INSERT INTO experiment_traits
+                    (exp_id,trait_name,data_type,unit,is_active,location_id)
+                    VALUES {vals}
+                """), params)
+        return added
+
+    def toggle_trait(self, trait_id, conn=None, by=None):
+        with self.begin(conn) as c:
+            c.execute(
+                text("UPDATE experiment_traits SET is_active=1-is_active WHERE id=:id"),
+                {"id": int(trait_id)}
+            )
+            self._log_toggle(c, "experiment_traits", "trait_id", "toggle_trait", trait_id, by)
+
+    def set_trait_bounds(self, rows, conn=None):
+        # rows: [(trait_id, unit, min_value, max_value)], None for no bound
+        if not rows:
+            return
+        with self.begin(conn) as c:
+            c.execute(
+                text("UPDATE experiment_traits SET unit=:unit,min_value=:lo,max_value=:hi WHERE id=:id"),
+                [{"id": int(tid), "unit": unit or "", "lo": lo, "hi": hi} for tid, unit, lo, hi in rows]
+            )
+
+    # -- observations -------------------------------------------------
+
+    def upsert_observations(self, values, location_id, conn=None):
+        # values: {(metadata_id, attribute_name): value}. Relies on the unique
+        # (metadata_id, trait_id) key, so a full grid is a handful of
+        # statements instead of two per cell. Text traits are stored in
+        # text_value, everything else in attribute_value.
+        statements = 0
+        if not values:
+            return statements
+        with self.begin(conn) as c:
+            keys = self.trait_keys(location_id, conn=c)
+            rows = {"attribute_value": [], "text_value": []}
+            for (mid, trait), val in values.items():
+                if trait not in keys:
+                    raise ValueError(f"Location {location_id} has no trait {trait!r}")
+                trait_id, data_type = keys[trait]
+                if data_type == "text" and val is not None:
+                    rows["text_value"].append((int(mid), trait_id, str(val)))
+                else:
+                    rows["attribute_value"].append((int(mid), trait_id, None if val is None else float(val)))
+
+            # The other value column is NULL and location_id is bound once,
+            # so a row costs three binds
+            for column, other in (("attribute_value", "text_value"), ("text_value", "attribute_value")):
+                for chunk in chunks(rows[column], (self.max_params - 1) // 3):
+                    vals, params = values_clause(chunk, tail=",NULL,:loc")
+                    c.execute(text(f"""
+                        INSERT INTO observation_data
+                        (metadata_id,trait_id,{column},{other},location_id)
+                        VALUES {vals}
+                        {self.upsert_suffix()}
+                    """), {**params, "loc": location_id})
+                    statements += 1
+        return statements
+
+    def delete_observations(self, keys, location_id, conn=None):
+        if not keys:
+            return
+        with self.begin(conn) as c:
+            traits = self.trait_keys(location_id, conn=c)
+            # a trait the location doesn't have has nothing stored
+            ids = [(mid, traits[t][0]) for mid, t in keys if t in traits]
+            for chunk in self.batches(ids, 2):
+                clause, params = key_filter(chunk)
+                c.execute(
+                    text(f"DELETE FROM observation_data WHERE location_id=:loc AND ({clause})"),
+                    {**params, "loc": location_id}
+                )
+
+    def find_conflicts(self, keys, baseline, location_id, conn=None):
+        # Optimistic concurrency: lock the rows we are about to write and make
+        # sure nobody changed them since this session loaded the grid.
+        conflicts = {}
+        if not keys:
+            return conflicts
+        with self.begin(conn) as c:
+            traits = self.trait_keys(location_id, conn=c)
+            names = {trait_id: name for name, (trait_id, _) in traits.items()}
+            ids = [(mid, traits[t][0]) for mid, t in keys if t in traits]
+
+            current = {}
+            for chunk in self.batches(ids, 2):
+                clause, params = key_filter(chunk)
+                rows = c.execute(text(f"""
+                    SELECT metadata_id,trait_id,attribute_value,text_value
+                    FROM observation_data
+                    WHERE location_id=:loc AND ({clause})
+                    {self.lock_clause}
+                """), {**params, "loc": location_id}).all()
+                current.update({
+                    (int(mid), names[tid]): num if txt is None else txt
+                    for mid, tid, num, txt in rows
+                })
+
+            for mid, trait in keys:
+                key = (int(mid), trait)
+                if current.get(key) != baseline.get(key):
+                    conflicts[key] = (baseline.get(key), current.get(key))
+        return conflicts
+
+    # -- change log ---------------------------------------------------
+    # Append-only record of every write to a location's data, made in the
+    # writer's transaction: one row per saved cell (both values NULL when
+    # cleared), per plot submitted, reopened or toggled, per toggled trait
+    # (attribute_value is the new is_active), and one row with neither id
+    # when the whole location was rewritten (upload, delete, archive).
+    # seq only grows, and an append locks the location's row until the
+    # writer commits, so a location's rows become visible in seq order: a
+    # reader that has seen seq N never finds a new row below N later.
+    # Not cached; the Download tab reads it on demand.
+
+    def _lock_log(self, c, location_id):
+        c.execute(
+            text(f"SELECT id FROM locations WHERE id=:loc {self.lock_clause}"), {"loc": location_id}
+        )
+
+    def _log_toggle(self, c, table, column, action, row_id, by):
+        loc = c.execute(
+            text(f"SELECT location_id FROM {table} WHERE id=:id"), {"id": int(row_id)}
+        ).scalar()
+        self._lock_log(c, loc)
+        c.execute(text(f"""
+            INSERT INTO change_log ({column},attribute_value,location_id,action,changed_by)
+            SELECT id,is_active,location_id,:act,:by FROM {table} WHERE id=:id
+        """), {"id": int(row_id), "act": action, "by": by})
+
+    def _append_log(self, c, location_id, action, rows, by):
+        # rows: [(metadata_id, trait_id, attribute_value, text_value)]. One
+        # statement with many parameter sets: nothing to re-parse per batch,
+        # and the driver batches the rows itself.
+        self._lock_log(c, location_id)
+        c.execute(LOG_SQL, [
+            {"m": m, "t": t, "v": v, "x": x, "loc": location_id, "act": action, "by": by}
+            for m, t, v, x in rows
+        ])
+
+    def log_cells(self, location_id, values, by=None, conn=None):
+        # values: {(metadata_id, attribute_name): value or None}, as written
+        # by upsert_observations/delete_observations
+        if not values:
+            return
+        with self.begin(conn) as c:
+            keys = self.trait_keys(location_id, conn=c)
+            rows = []
+            for (mid, trait), val in values.items():
+                if trait not in keys:
+                    continue  # nothing was stored for it
+                trait_id, data_type = keys[trait]
+                if data_type == "text" and val is not None:
+                    rows.append((int(mid), trait_id, None, str(val)))
+                else:
+                    rows.append((int(mid), trait_id, None if val is None else float(val), None))
+            self._append_log(c, location_id, "save", rows, by)
+
+    def log_location(self, location_id, action, by=None, conn=None):
+        with self.begin(conn) as c:
+            self._append_log(c, location_id, action, [(None, None, None, None)], by)
+
+    def change_head(self, location_id, conn=None):
+        # Latest seq of the location, 0 before its first change
+        with self.begin(conn) as c:
+            return int(c.execute(
+                text("SELECT COALESCE(MAX(seq),0) FROM change_log WHERE location_id=:loc"),
+                {"loc": location_id}
+            ).scalar())
+
+    def changed_plots(self, location_id, since, upto, conn=None):
+        # Plot ids with changes in (since, upto], and whether the whole
+        # location was rewritten in that range
+        with self.begin(conn) as c:
+            rows = c.execute(text("""
+                SELECT DISTINCT metadata_id,trait_id FROM change_log
+                WHERE location_id=:loc AND seq>:since AND seq<=:upto
+            """), {"loc": location_id, "since": int(since), "upto": int(upto)}).all()
+        ids = sorted({int(mid) for mid, _ in rows if mid is not None})
+        return ids, any(mid is None and tid is None for mid, tid in rows)
+
+    def changes(self, location_id, since=0, limit=200, conn=None):
+        # Newest first, with trait names where the trait still exists
+        with self.begin(conn) as c:
+            return pd.read_sql(text("""
+                SELECT l.seq,l.changed_at,l.changed_by,l.action,l.metadata_id,
+                       t.trait_name,l.attribute_value,l.text_value
+                FROM change_log l
+                LEFT JOIN experiment_traits t ON t.id=l.trait_id
+                WHERE l.location_id=:loc AND l.seq>:since
+                ORDER BY l.seq DESC LIMIT :n
+            """), c, params={"loc": location_id, "since": int(since), "n": limit})
+
+    def export_checkpoint(self, location_id, status, username, conn=None):
+        # seq covered by this user's last download of this status, or None
+        with self.begin(conn) as c:
+            return c.execute(text("""
+                SELECT seq FROM export_checkpoints
+                WHERE location_id=:loc AND entry_status=:st AND username=:u
+            """), {"loc": location_id, "st": status, "u": username}).scalar()
+
+    def set_export_checkpoint(self, location_id, status, username, seq, conn=None):
+        params = {"loc": location_id, "st": status, "u": username, "seq": int(seq)}
+        with self.begin(conn) as c:
+            c.execute(text("""
+                DELETE FROM export_checkpoints
+                WHERE location_id=:loc AND entry_status=:st AND username=:u
+            """), params)
+            c.execute(text("""
+                INSERT INTO export_checkpoints (location_id,entry_status,username,seq)
+                VALUES (:loc,:st,:u,:seq)
+            """), params)
+
+    # -- offline sync -------------------------------------------------
+
+    def sync_result(self, batch_id, conn=None):
+        # Stored result of a batch already applied, else None
+        with self.begin(conn) as c:
+            return c.execute(
+                text("SELECT result FROM sync_batches WHERE batch_id=:b"), {"b": batch_id}
+            ).scalar()
+
+    def record_sync(self, batch_id, device, entries, result, conn=None):
+        with self.begin(conn) as c:
+            c.execute(text("""
+                INSERT INTO sync_batches (batch_id,device,entries,result)
+                VALUES (:b,:d,:n,:r)
+            """), {"b": batch_id, "d": device, "n": entries, "r": result})
+
+    # -- jobs ---------------------------------------------------------
+    # Not cached: the Admin panel polls these while jobs run.
+
+    def create_job(self, kind, location_id, params, created_by, worker, conn=None):
+        with self.begin(conn) as c:
+            result = c.execute(text("""
+                INSERT INTO jobs (kind,location_id,params,created_by,worker)
+                VALUES (:k,:loc,:p,:by,:w)
+            """), {"k": kind, "loc": location_id, "p": params, "by": created_by, "w": worker})
+            return self.first_inserted_id(result, 1)
+
+    def job(self, job_id, conn=None):
+        with self.begin(conn) as c:
+            row = c.execute(text("SELECT * FROM jobs WHERE id=:id"), {"id": int(job_id)}).mappings().first()
+        return dict(row) if row else None
+
+    def jobs(self, location_id, limit=20):
+        with self.begin() as c:
+            rows = c.execute(text("""
+                SELECT id,kind,status,progress,message,result,error,cancel_requested,
+                       created_by,created_at,started_at,finished_at
+                FROM jobs WHERE location_id=:loc
+                ORDER BY id DESC LIMIT :n
+            """), {"loc": location_id, "n": limit}).mappings().all()
+        return [dict(r) for r in rows]
+
+    def start_job(self, job_id, location_id, conn=None):
+        # Claim a queued job unless a job (from any server process) is
+        # already running at its location; False if it was cancelled or has
+        # to wait. Check and claim are one statement; MySQL reads the table
+        # being updated only through a materialised derived table, and the
+        # location row lock keeps two claims for a location in line.
+        with self.begin(conn) as c:
+            if self.lock_clause:
+                c.execute(
+                    text(f"SELECT id FROM locations WHERE id=:loc {self.lock_clause}"),
+                    {"loc": location_id}
+                )
+            return c.execute(text("""
+                UPDATE jobs SET status='running',started_at=CURRENT_TIMESTAMP
+                WHERE id=:id AND status='queued'
+                  AND location_id NOT IN (
+                      SELECT location_id FROM (
+                          SELECT DISTINCT location_id FROM jobs WHERE status='running'
+                      ) busy
+                  )
+            """), {"id": int(job_id)}).rowcount == 1
+
+    def queued_jobs(self, worker, conn=None):
+        with self.begin(conn) as c:
+            rows = c.execute(text("""
+                SELECT id,location_id FROM jobs
+                WHERE status='queued' AND worker=:w ORDER BY id
+            """), {"w": worker}).mappings().all()
+        return [dict(r) for r in rows]
+
+    def cancel_requested(self, job_id, conn=None):
+        with self.begin(conn) as c:
+            return bool(c.execute(
+                text("SELECT cancel_requested FROM jobs WHERE id=:id"), {"id": int(job_id)}
+            ).scalar())
+
+    def finish_job(self, job_id, status, message="", result=None, error=None, conn=None):
+        with self.begin(conn) as c:
+            c.execute(text("""
+                UPDATE jobs
+                SET status=:st,message=:m,result=:r,error=:e,finished_at=CURRENT_TIMESTAMP,
+                    progress=CASE WHEN :st='done' THEN 1 ELSE progress END
+                WHERE id=:id
+            """), {"id": int(job_id), "st": status, "m": message[:255], "r": result, "e": error})
+
+    def fail_orphan(self, job_id, worker, message, conn=None):
+        # Only while the row still belongs to the dead worker
+        with self.begin(conn) as c:
+            c.execute(text("""
+                UPDATE jobs
+                SET status='failed',message=:m,error=:m,finished_at=CURRENT_TIMESTAMP
+                WHERE id=:id AND worker=:w AND status IN ('queued','running')
+            """), {"id": int(job_id), "w": worker, "m": message})
+
+    def cancel_job(self, job_id, conn=None):
+        # Queued jobs are cancelled outright; running ones stop at their next
+        # progress report
+        with self.begin(conn) as c:
+            c.execute(
+                text("UPDATE jobs SET cancel_requested=1 WHERE id=:id AND status IN ('queued','running')"),
+                {"id": int(job_id)}
+            )
+            c.execute(text("""
+                UPDATE jobs SET status='cancelled',finished_at=CURRENT_TIMESTAMP
+                WHERE id=:id AND status='queued'
+            """), {"id": int(job_id)})
+
+    def replacing(self, location_id):
+        # A replace/delete/archive job is rewriting this location's data
+        with self.begin() as c:
+            return c.execute(text("""
+                SELECT 1 FROM jobs
+                WHERE location_id=:loc AND status='running'
+                  AND kind IN ('replace','delete','archive')
+                LIMIT 1
+            """), {"loc": location_id}).first() is not None
+
+    def active_jobs(self, conn=None):
+        with self.begin(conn) as c:
+            rows = c.execute(text("""
+                SELECT id,location_id,status,worker FROM jobs
+                WHERE status IN ('queued','running') ORDER BY id
+            """)).mappings().all()
+        return [dict(r) for r in rows]
+
+
+class MySQLRepository(Repository):
+    lock_clause = "FOR UPDATE"
+
+    def upsert_suffix(self):
+        return ("ON DUPLICATE KEY UPDATE "
+                "attribute_value=VALUES(attribute_value),text_value=VALUES(text_value)")
+
+    def first_inserted_id(self, result, n):
+        # LAST_INSERT_ID() is the first id of a multi-row insert
+        return result.lastrowid
+
+
+class SQLiteRepository(Repository):
+    # SQLITE_MAX_VARIABLE_NUMBER on older builds
+    max_params = 999
+
+    def bootstrap(self):
+        raw = self.engine.raw_connection()
+        try:
+            for script, table, column in SQLITE_UPGRADES:
+                columns = [r[1] for r in raw.execute(f"PRAGMA table_info({table})")]
+                if columns and column not in columns:
+                    raw.executescript(script.read_text(encoding="utf-8"))
+            raw.executescript(SQLITE_SCHEMA.read_text(encoding="utf-8"))
+            raw.commit()
+        finally:
+            raw.close()
+
+    def upsert_suffix(self):
+        return ("ON CONFLICT (metadata_id, trait_id) DO UPDATE SET "
+                "attribute_value=excluded.attribute_value,text_value=excluded.text_value")
+
+    def first_inserted_id(self, result, n):
+        # last_insert_rowid() is the last row; the database-wide write lock
+        # makes the ids of one statement consecutive
+        return result.lastrowid - n + 1
+
+
+BACKENDS = {"mysql": MySQLRepository, "sqlite": SQLiteRepository}
+
+
+@st.cache_resource
+def get_repo():
+    repo = BACKENDS[DB_BACKEND](get_engine())
+    repo.bootstrap()
+    return repo
@@ -0,0 +1,82 @@
+from sqlalchemy import text
+
+from db import cache
+
+PLOTS = [("E1", "L", 2024, "Kharif", 1, 1, "T1"), ("E1", "L", 2024, "Kharif", 2, 1, "T2")]
+COUNT = text("SELECT COUNT(*) n FROM experiment_metadata WHERE location_id=:loc")
+
+
+def count(location):
+    return int(cache.read_sql(COUNT, ["experiment_metadata"], location, {"loc": location})["n"].iloc[0])
+
+
+def add_plot_behind_the_cache(repo, location):
+    repo.insert_metadata([("E1", "L", 2024, "Kharif", 3, 1, "T3")], location)
+
+
+def test_served_until_invalidated(repo, location, add_plots):
+    add_plots(location, PLOTS, {(0, "h"): 1.0})
+    assert count(location) == 2
+    add_plot_behind_the_cache(repo, location)
+    assert count(location) == 2
+
+    cache.invalidate("experiment_metadata", location_id=location)
+    assert count(location) == 3
+
+
+def test_invalidate_is_per_location_and_table(repo, location, add_plots):
+    add_plots(location, PLOTS, {(0, "h"): 1.0})
+    assert count(location) == 2
+    add_plot_behind_the_cache(repo, location)
+
+    cache.invalidate("experiment_metadata", location_id=location + 1000)
+    cache.invalidate("experiment_traits", location_id=location)
+    assert count(location) == 2
+    # no location: every location's entries for the table
+    cache.invalidate("experiment_metadata")
+    assert count(location) == 3
+
+
+def test_location_independent_entries_drop_on_any_location(repo, location):
+    sql = text("SELECT id FROM locations")
+    before = len(cache.read_sql(sql, ["locations"]))
+    repo.add_location(f"behind the cache {location}")
+    assert len(cache.read_sql(sql, ["locations"])) == before
+
+    cache.invalidate("locations", location_id=location)
+    assert len(cache.read_sql(sql, ["locations"])) == before + 1
+
+
+def test_data_version(location):
+    other = location + 1000
+    v = cache.data_version(["observation_data"], location)
+    everywhere = cache.data_version(["observation_data"])
+
+    cache.invalidate("observation_data", location_id=other)
+    cache.invalidate("experiment_traits", location_id=location)
+    assert cache.data_version(["observation_data"], location) == v
+    assert cache.data_version(["observation_data"]) != everywhere
+
+    cache.invalidate("observation_data", location_id=location)
+    assert cache.data_version(["observation_data"], location) != v
+
+    v = cache.data_version(["observation_data"], location)
+    cache.clear()
+    assert cache.data_version(["observation_data"], location) != v
+
+
+def test_read_raced_by_a_write_is_not_kept(repo, location, add_plots, monkeypatch):
+    add_plots(location, PLOTS, {(0, "h"): 1.0})
+    read_sql = cache.pd.read_sql
+
+    def racing(*args, **kwargs):
+        # a save lands between the read and storing its result
+        df = read_sql(*args, **kwargs)
+        add_plot_behind_the_cache(repo, location)
+        cache.invalidate("experiment_metadata", location_id=location)
+        return df
+
+    monkeypatch.setattr(cache.pd, "read_sql", racing)
+    assert count(location) == 2
+    monkeypatch.setattr(cache.pd, "read_sql", read_sql)
+    assert count(location) == 3
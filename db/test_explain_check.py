@@ -0,0 +1,32 @@
+from sqlalchemy import text
+
+from db import explain_check
+from db.db import get_engine
+
+
+def test_flags_a_full_scan(repo):
+    repo.locations()  # schema in place
+    with get_engine().connect() as conn:
+        bad, plan = explain_check.full_scans(
+            conn, "SELECT o.id FROM observation_data o WHERE o.attribute_value>?", (1,)
+        )
+        assert bad == ["observation_data"]
+        bad, plan = explain_check.full_scans(
+            conn, "SELECT id FROM observation_data WHERE location_id=?", (1,)
+        )
+        assert bad == []
+
+
+def test_app_statements_use_indexes(repo):
+    statements = explain_check.record(plots=60)
+    seen = " ".join(" ".join(sql.split()) for sql, _, _ in statements)
+    # the workload still reaches the paths that used to be listed by hand
+    for piece in ("FROM change_log l", "UPDATE jobs SET status='running'",
+                  "m.year,m.season,COUNT(o.attribute_value)", "SELECT COUNT(*) n FROM experiment_metadata",
+                  "SELECT DISTINCT replication", "LEFT JOIN observation_data o",
+                  "SET location_id=CASE"):
+        assert piece in seen, piece
+
+    assert explain_check.check(statements) == {}
+    with repo.begin() as c:
+        assert c.execute(text("SELECT COUNT(*) FROM locations WHERE name LIKE 'explain check %'")).scalar() == 0
@@ -0,0 +1,83 @@
+import json
+import uuid
+import zlib
+
+from sqlalchemy import text
+
+from db.journal import Journal, apply_batch, encode_batch
+
+PLOTS = [("E1", "L", 2024, "Kharif", 1, 1, "T1"), ("E1", "L", 2024, "Kharif", 2, 1, "T2")]
+
+
+def entry(loc, mid, trait, value, baseline=None):
+    return {"location_id": loc, "metadata_id": mid, "attribute_name": trait,
+            "value": value, "baseline": baseline}
+
+
+def logged(repo, location):
+    with repo.begin() as c:
+        return c.execute(
+            text("SELECT COUNT(*) FROM change_log WHERE location_id=:loc"), {"loc": location}
+        ).scalar()
+
+
+def test_encode_keeps_last_value_and_first_baseline():
+    blob = encode_batch("b1", [
+        entry(1, 10, "h", 5.0, 4.0),
+        entry(1, 10, "h", 6.0, 5.0),
+        entry(1, None, None, None),
+    ])
+    batch = json.loads(zlib.decompress(blob))
+    assert batch["cells"] == [[1, 10, "h", 4.0, 6.0]]
+    assert batch["submit"] == [1] and batch["entries"] == 3
+
+
+def test_resent_batch_is_applied_once(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0})
+    blob = encode_batch(uuid.uuid4().hex, [
+        entry(location, ids[0], "h", 6.0, 5.0),
+        entry(location, ids[1], "h", 2.0),
+    ])
+
+    first = apply_batch(repo, blob)
+    assert first == {"applied": 2, "conflicts": [], "held": []}
+    before = logged(repo, location)
+
+    # someone edits the cell before the device resends (its reply was lost)
+    repo.upsert_observations({(ids[0], "h"): 9.0}, location)
+    assert apply_batch(repo, blob) == first
+    assert logged(repo, location) == before
+    assert repo.find_conflicts([(ids[0], "h")], {(ids[0], "h"): 9.0}, location) == {}
+
+
+def test_conflict_holds_submit(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0})
+    repo.upsert_observations({(ids[0], "h"): 7.0}, location)
+    result = apply_batch(repo, encode_batch(uuid.uuid4().hex, [
+        entry(location, ids[0], "h", 6.0, 5.0),
+        entry(location, ids[1], "h", 1.0),
+        entry(location, None, None, None),
+    ]))
+    assert result == {"applied": 1, "conflicts": [[location, ids[0], "h", 7.0]], "held": [location]}
+    with repo.begin() as c:
+        statuses = c.execute(
+            text("SELECT DISTINCT entry_status FROM experiment_metadata WHERE location_id=:loc"),
+            {"loc": location}
+        ).scalars().all()
+    assert statuses == ["Draft"]
+
+
+def test_journal_round_trip_keeps_text(repo, location, add_plots, tmp_path):
+    ids = add_plots(location, PLOTS, {(0, "note"): "007"}, types={"note": "text"})
+    journal = Journal(tmp_path / "journal.db", repo)
+    journal.record(location, {(ids[0], "note"): "008", (ids[1], "note"): "1e3"},
+                   {(ids[0], "note"): "007"}, "u")
+    assert journal.overlay(location) == {(ids[0], "note"): "008", (ids[1], "note"): "1e3"}
+
+    assert journal.sync() == 2
+    assert journal.status()["pending"] == 0
+    # a second sync has nothing left to send
+    assert journal.sync() == 0
+    assert repo.find_conflicts(
+        [(ids[0], "note"), (ids[1], "note")], {(ids[0], "note"): "008", (ids[1], "note"): "1e3"}, location
+    ) == {}
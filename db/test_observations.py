@@ -0,0 +1,30 @@
+from db.observations import diff_grid
+
+
+def test_untouched_default_is_not_a_change():
+    # Form mode shows a missing value as 0.0
+    out = diff_grid({(1, "h"): 0.0, (2, "h"): 5.0}, {(2, "h"): 5.0})
+    assert out == {"inserted": {}, "changed": {}, "cleared": []}
+
+
+def test_insert_change_clear():
+    baseline = {(1, "h"): 5.0, (2, "h"): 6.0, (3, "h"): 7.0}
+    values = {(1, "h"): 5.0, (2, "h"): 6.5, (3, "h"): None, (4, "h"): 1.0}
+    out = diff_grid(values, baseline, default=None)
+    assert out == {"inserted": {(4, "h"): 1.0}, "changed": {(2, "h"): 6.5}, "cleared": [(3, "h")]}
+
+
+def test_blank_grid_cell_is_not_a_change():
+    out = diff_grid({(1, "h"): None}, {}, default=None)
+    assert out == {"inserted": {}, "changed": {}, "cleared": []}
+
+
+def test_zero_in_grid_mode_is_a_value():
+    out = diff_grid({(1, "h"): 0.0}, {}, default=None)
+    assert out["inserted"] == {(1, "h"): 0.0}
+
+
+def test_text_values_compare_as_text():
+    baseline = {(1, "note"): "007", (2, "note"): "wilted"}
+    values = {(1, "note"): "7", (2, "note"): "wilted"}
+    assert diff_grid(values, baseline, default=None)["changed"] == {(1, "note"): "7"}
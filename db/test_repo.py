@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from db.repo import SQLiteRepository
+
+PLOTS = [("E1", "L", 2024, "Kharif", 1, 1, "T1"), ("E1", "L", 2024, "Kharif", 2, 1, "T2")]
+
+
+def stored(repo, location):
+    # {(metadata_id, trait): value} as the observation rows hold it
+    with repo.begin() as c:
+        rows = c.execute(text("""
+            SELECT o.metadata_id,t.trait_name,o.attribute_value,o.text_value
+            FROM observation_data o JOIN experiment_traits t ON t.id=o.trait_id
+            WHERE o.location_id=:loc
+        """), {"loc": location}).all()
+    return {(mid, name): num if txt is None else txt for mid, name, num, txt in rows}
+
+
+# -- upsert_observations --------------------------------------------------
+
+def test_upsert_inserts_then_overwrites(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0, (0, "note"): "a"}, types={"note": "text"})
+    repo.upsert_observations({(ids[0], "h"): 6.0, (ids[1], "h"): 1.0, (ids[0], "note"): "b"}, location)
+    assert stored(repo, location) == {(ids[0], "h"): 6.0, (ids[1], "h"): 1.0, (ids[0], "note"): "b"}
+
+
+def test_upsert_splits_big_grids(repo, location, add_plots, monkeypatch):
+    rows = [("E1", "L", 2024, "Kharif", 1, 1, f"T{p}") for p in range(40)]
+    ids = add_plots(location, rows, {(0, "h"): 0.0})
+    values = {(mid, "h"): float(i) for i, mid in enumerate(ids)}
+
+    monkeypatch.setattr(repo, "max_params", 31)    # 10 rows per statement
+    assert repo.upsert_observations(values, location) == 4
+    assert stored(repo, location) == values
+
+
+def test_upsert_unknown_trait(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0})
+    with pytest.raises(ValueError):
+        repo.upsert_observations({(ids[0], "nope"): 1.0}, location)
+    assert stored(repo, location) == {(ids[0], "h"): 5.0}
+
+
+# -- find_conflicts -------------------------------------------------------
+
+def test_no_conflict_when_baseline_matches(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0, (1, "h"): 6.0})
+    baseline = {(ids[0], "h"): 5.0, (ids[1], "h"): 6.0}
+    assert repo.find_conflicts(list(baseline), baseline, location) == {}
+
+
+def test_changed_since_loaded(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0})
+    baseline = {(ids[0], "h"): 5.0}
+    repo.upsert_observations({(ids[0], "h"): 7.5}, location)
+    assert repo.find_conflicts([(ids[0], "h")], baseline, location) == {(ids[0], "h"): (5.0, 7.5)}
+
+
+def test_filled_or_cleared_by_someone_else(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0, (1, "w"): 1.0})
+    # the grid showed the second plot's h blank and its w as 1.0
+    repo.upsert_observations({(ids[1], "h"): 2.0}, location)
+    repo.delete_observations([(ids[1], "w")], location)
+    keys = [(ids[1], "h"), (ids[1], "w")]
+    found = repo.find_conflicts(keys, {(ids[1], "w"): 1.0}, location)
+    assert found == {(ids[1], "h"): (None, 2.0), (ids[1], "w"): (1.0, None)}
+
+
+def test_text_values(repo, location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "note"): "007"}, types={"note": "text"})
+    assert repo.find_conflicts([(ids[0], "note")], {(ids[0], "note"): "007"}, location) == {}
+    found = repo.find_conflicts([(ids[0], "note")], {(ids[0], "note"): "7"}, location)
+    assert found == {(ids[0], "note"): ("7", "007")}
+
+
+# -- SQLite upgrade 006: trait ids on observation_data ------------------
+
+OLD_SCHEMA = """
+CREATE TABLE locations (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(100) UNIQUE NOT NULL);
+CREATE TABLE experiment_metadata (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, exp_id VARCHAR(100), location VARCHAR(100),
+    year INTEGER, season VARCHAR(50), replication INTEGER, block INTEGER, treatment VARCHAR(100),
+    entry_status VARCHAR(20) DEFAULT 'Draft', is_active INTEGER DEFAULT 1,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE
+);
+CREATE TABLE experiment_traits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, exp_id VARCHAR(100), trait_name VARCHAR(100) NOT NULL,
+    data_type VARCHAR(50) DEFAULT 'number', unit VARCHAR(50) DEFAULT '', is_active INTEGER DEFAULT 1,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE
+);
+CREATE TABLE observation_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    metadata_id INTEGER NOT NULL REFERENCES experiment_metadata(id) ON DELETE CASCADE,
+    attribute_name VARCHAR(100) NOT NULL, attribute_value DOUBLE,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    UNIQUE (metadata_id, attribute_name)
+);
+INSERT INTO locations (name) VALUES ('A'), ('B');
+INSERT INTO experiment_metadata (exp_id, location_id) VALUES ('E', 1), ('E', 2);
+-- h is listed twice at location 1; location 2 has an h of its own
+INSERT INTO experiment_traits (trait_name, location_id) VALUES ('h', 1), ('h', 1), ('h', 2);
+INSERT INTO observation_data (metadata_id, attribute_name, attribute_value, location_id) VALUES
+    (1, 'h', 5.0, 1), (1, 'gone', 3.0, 1), (2, 'h', 9.0, 2);
+"""
+
+
+def test_upgrade_006_backfills_trait_ids(tmp_path):
+    path = tmp_path / "old.db"
+    raw = create_engine(f"sqlite:///{path}").raw_connection()
+    raw.executescript(OLD_SCHEMA)
+    raw.close()
+
+    repo = SQLiteRepository(create_engine(f"sqlite:///{path}"))
+    repo.bootstrap()
+
+    with repo.begin() as c:
+        traits = c.execute(text(
+            "SELECT id,trait_name,is_active,location_id FROM experiment_traits ORDER BY id"
+        )).all()
+        obs = c.execute(text("""
+            SELECT o.id,o.trait_id,t.trait_name,o.attribute_value,o.location_id
+            FROM observation_data o JOIN experiment_traits t ON t.id=o.trait_id ORDER BY o.id
+        """)).all()
+        columns = [r[1] for r in c.execute(text("PRAGMA table_info(observation_data)"))]
+
+    # the name without a trait row gets an inactive one
+    assert traits[-1][1:] == ("gone", 0, 1)
+    # duplicate names map to the oldest row; locations keep their own traits
+    assert [(r.id, r.trait_id, r.trait_name, r.attribute_value) for r in obs] == [
+        (1, 1, "h", 5.0), (2, traits[-1][0], "gone", 3.0), (3, 3, "h", 9.0)
+    ]
+    assert "attribute_name" not in columns and "text_value" in columns
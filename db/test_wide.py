@@ -0,0 +1,63 @@
+from sqlalchemy import text
+
+from db import wide
+
+PLOTS = [("E1", "L", 2024, "Kharif", 1, 1, "T1"), ("E1", "L", 2024, "Kharif", 2, 1, "T2")]
+
+
+def loaded(location, add_plots):
+    ids = add_plots(location, PLOTS, {(0, "h"): 5.0, (1, "note"): "tall"}, types={"note": "text"})
+    wide.get_wide(location)  # materialized, so the writes below patch it
+    assert wide.is_loaded(location)
+    return ids
+
+
+def consistent(location):
+    summary, mismatches = wide.check_consistency(location)
+    assert mismatches.empty, mismatches
+    assert summary["missing_rows"] == summary["extra_rows"] == 0
+    assert summary["trait_flags_match"]
+    return summary
+
+
+def test_consistent_after_save(repo, location, add_plots):
+    ids = loaded(location, add_plots)
+    values = {(ids[0], "h"): 6.5, (ids[1], "h"): 1.0, (ids[0], "note"): "short", (ids[1], "note"): None}
+    repo.upsert_observations({k: v for k, v in values.items() if v is not None}, location)
+    repo.delete_observations([(ids[1], "note")], location)
+    wide.apply_cells(location, values)
+    assert consistent(location)["rows"] == 2
+
+
+def test_consistent_after_toggles(repo, location, add_plots):
+    ids = loaded(location, add_plots)
+    repo.toggle_treatment(ids[0])
+    wide.set_row_active(location, ids[0], False)
+
+    with repo.begin() as c:
+        trait_id = c.execute(text(
+            "SELECT id FROM experiment_traits WHERE location_id=:loc AND trait_name='h'"
+        ), {"loc": location}).scalar()
+    repo.toggle_trait(trait_id)
+    wide.set_trait_active(location, "h", False)
+    consistent(location)
+
+
+def test_consistent_after_submit_and_reopen(repo, location, add_plots):
+    loaded(location, add_plots)
+    repo.set_status(location, "Submitted")
+    wide.set_status(location, "Submitted")
+    consistent(location)
+
+    repo.set_status(location, "Draft", from_status="Submitted")
+    wide.set_status(location, "Draft", from_status="Submitted")
+    consistent(location)
+    assert len(wide.get_wide(location, "Draft")[0]) == 2
+
+
+def test_reports_a_write_it_missed(repo, location, add_plots):
+    ids = loaded(location, add_plots)
+    repo.upsert_observations({(ids[1], "h"): 2.0}, location)  # store not patched
+    summary, mismatches = wide.check_consistency(location)
+    assert summary["mismatched_cells"] == 1
+    assert mismatches[["metadata_id", "column"]].values.tolist() == [[ids[1], "h"]]
@@ -0,0 +1,184 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db import metrics
+from db.db import get_engine
+from db.observations import pivot_values
+from db.cache import TTL_SECONDS
+
+# Per-location wide table (one row per plot, one column per trait) kept in
+# memory and patched by the write paths, so View Data and Download read it
+# directly instead of pivoting observation_data on every request. Locations
+# are built lazily on first read and rebuilt after TTL_SECONDS in case
+# another server process wrote to them.
+META_COLS = ["exp_id", "location", "year", "season", "replication", "block", "treatment",
+             "entry_status", "is_active"]
+
+_lock = threading.Lock()
+_store = {}  # location_id -> {"wide", "traits", "built"}
+_gens = {}   # location_id -> write counter, so a build racing a write is not kept
+
+
+def build(location_id):
+    # Fresh pivot straight from the database
+    engine = get_engine()
+    params = {"loc": location_id}
+
+    meta = pd.read_sql(text(f"""
+        SELECT id,{",".join(META_COLS)} FROM experiment_metadata
+        WHERE location_id=:loc ORDER BY id
+    """), engine, params=params).set_index("id")
+
+    rows = pd.read_sql(text("""
+        SELECT id,trait_name,data_type,is_active FROM experiment_traits
+        WHERE location_id=:loc ORDER BY id
+    """), engine, params=params)
+    traits = dict(zip(rows["trait_name"], rows["is_active"].astype(bool)))
+    text_cols = set(rows.loc[rows["data_type"] == "text", "trait_name"])
+
+    # only integer trait ids come over the wire; names are mapped here
+    obs = pd.read_sql(text("""
+        SELECT metadata_id,trait_id,attribute_value,text_value FROM observation_data
+        WHERE location_id=:loc
+    """), engine, params=params)
+    obs["attribute_name"] = obs["trait_id"].map(dict(zip(rows["id"], rows["trait_name"])))
+
+    metrics.add_rows(len(meta) + len(rows) + len(obs))
+
+    vals = pivot_values(obs, "metadata_id").reindex(index=meta.index, columns=list(traits))
+    vals = vals.astype({t: object if t in text_cols else float for t in traits})
+    return meta.join(vals), traits
+
+
+def _entry(location_id):
+    with _lock:
+        entry = _store.get(location_id)
+        if entry and time.monotonic() - entry["built"] < TTL_SECONDS:
+            return entry
+        gen = _gens.get(location_id, 0)
+
+    wide, traits = build(location_id)
+    entry = {"wide": wide, "traits": traits, "built": time.monotonic()}
+    with _lock:
+        if _gens.get(location_id, 0) == gen:
+            _store[location_id] = entry
+    return entry
+
+
+def is_loaded(location_id):
+    with _lock:
+        return location_id in _store
+
+
+def get_wide(location_id, status=None, ids=None, active_only=False):
+    # Copy of the wide rows for a status and/or plot ids. active_only keeps
+    # active plots and active trait columns only.
+    entry = _entry(location_id)
+    with _lock:
+        wide = entry["wide"]
+        traits = [t for t, on in entry["traits"].items() if on or not active_only]
+
+        mask = np.ones(len(wide), dtype=bool)
+        if status is not None:
+            mask &= (wide["entry_status"] == status).to_numpy()
+        if active_only:
+            mask &= (wide["is_active"] == 1).to_numpy()
+        out = wide.loc[mask, META_COLS + traits]
+        if ids is not None:
+            out = out.reindex(pd.Index(ids).intersection(out.index))
+        return out.copy(), traits
+
+
+def _patch(location_id, fn):
+    # Apply an in-place update if the location is materialized; if it is
+    # not, the next read builds it fresh anyway.
+    with _lock:
+        _gens[location_id] = _gens.get(location_id, 0) + 1
+        entry = _store.get(location_id)
+        if entry is not None:
+            fn(entry)
+
+
+def apply_cells(location_id, values):
+    # values: {(metadata_id, trait): value or None}
+    def fn(entry):
+        wide = entry["wide"]
+        for (mid, trait), val in values.items():
+            if trait not in wide.columns:
+                wide[trait] = np.nan
+                entry["traits"].setdefault(trait, True)
+            if mid not in wide.index:
+                continue
+            if isinstance(val, str):
+                if wide[trait].dtype != object:
+                    wide[trait] = wide[trait].astype(object)
+                wide.at[mid, trait] = val
+            else:
+                wide.at[mid, trait] = np.nan if val is None else float(val)
+    _patch(location_id, fn)
+
+
+def set_status(location_id, status, from_status=None):
+    def fn(entry):
+        wide = entry["wide"]
+        mask = wide["entry_status"] == from_status if from_status else slice(None)
+        wide.loc[mask, "entry_status"] = status
+    _patch(location_id, fn)
+
+
+def set_row_active(location_id, metadata_id, active):
+    def fn(entry):
+        if metadata_id in entry["wide"].index:
+            entry["wide"].at[metadata_id, "is_active"] = int(active)
+    _patch(location_id, fn)
+
+
+def set_trait_active(location_id, trait_name, active):
+    def fn(entry):
+        entry["traits"][trait_name] = bool(active)
+        if trait_name not in entry["wide"].columns:
+            entry["wide"][trait_name] = np.nan
+    _patch(location_id, fn)
+
+
+def drop(location_id):
+    # Structural changes (upload, delete, new plots) rebuild on next read
+    with _lock:
+        _gens[location_id] = _gens.get(location_id, 0) + 1
+        _store.pop(location_id, None)
+
+
+def check_consistency(location_id):
+    # Compare the maintained table with a fresh pivot. Returns a summary
+    # dict plus a frame of mismatching cells (empty when consistent).
+    entry = _entry(location_id)
+    fresh, fresh_traits = build(location_id)
+
+    with _lock:
+        kept = entry["wide"].copy()
+        kept_traits = dict(entry["traits"])
+
+    cols = list(dict.fromkeys([*fresh.columns, *kept.columns]))
+    a = kept.reindex(index=fresh.index.union(kept.index), columns=cols)
+    b = fresh.reindex(index=a.index, columns=cols)
+
+    diff = ~((a == b) | (a.isna() & b.isna()))
+    cells = diff.stack()
+    cells = cells[cells]
+    mismatches = pd.DataFrame(
+        [(mid, col, a.at[mid, col], b.at[mid, col]) for mid, col in cells.index[:1000]],
+        columns=["metadata_id", "column", "maintained", "fresh"]
+    )
+
+    summary = {
+        "rows": len(fresh),
+        "missing_rows": len(fresh.index.difference(kept.index)),
+        "extra_rows": len(kept.index.difference(fresh.index)),
+        "mismatched_cells": int(len(cells)),
+        "trait_flags_match": kept_traits == fresh_traits,
+    }
+    return summary, mismatches
@@ -0,0 +1,276 @@
+import csv
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import bindparam, text
+
+from db import cache
+from db import wide as wide_store
+from db.db import get_engine
+from db.observations import chunks, pivot_values
+from db.paging import metadata_count
+from db.repo import get_repo
+from ingest import FIXED_COLS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+CHUNK_ROWS = 50000
+
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+}
+if pq is not None:
+    FORMATS["parquet"] = "application/vnd.apache.parquet"
+
+# Rows come ordered by plot id so every plot's observations are contiguous
+# and a chunk can be pivoted on its own (minus the last, possibly split, plot).
+EXPORT_SQL = text("""
+    SELECT m.id,m.exp_id,m.location,m.year,m.season,
+           m.replication,m.block,m.treatment,
+           o.trait_id,o.attribute_value,o.text_value
+    FROM experiment_metadata m
+    JOIN observation_data o ON m.id=o.metadata_id
+    WHERE m.entry_status=:st AND m.location_id=:loc
+    ORDER BY m.id
+""")
+
+# Changes export: the current row of every plot with a logged change since
+# a checkpoint (db/repo.py change log), whatever its status. "change" says
+# whether the plot is now in the exported status ("upsert") or has left it
+# or lost all its values ("removed"); rows are identified by FIXED_COLS.
+CHANGES_SQL = text("""
+    SELECT m.id,m.entry_status,m.exp_id,m.location,m.year,m.season,
+           m.replication,m.block,m.treatment,
+           o.trait_id,o.attribute_value,o.text_value
+    FROM experiment_metadata m
+    LEFT JOIN observation_data o ON m.id=o.metadata_id
+    WHERE m.location_id=:loc AND m.id IN :ids
+    ORDER BY m.id
+""").bindparams(bindparam("ids", expanding=True))
+CHANGE_PLOTS = 2000  # plot ids per CHANGES_SQL query
+
+SOURCE_TABLES = ["experiment_metadata", "experiment_traits", "observation_data"]
+
+MAX_OUTPUTS = 16
+_out_dir = tempfile.mkdtemp(prefix="agri_export_")
+_outputs = OrderedDict()
+_lock = threading.Lock()
+
+
+def _traits(location_id):
+    return cache.read_sql(
+        text("SELECT id,trait_name,data_type FROM experiment_traits WHERE location_id=:loc ORDER BY id"),
+        ["experiment_traits"], location_id,
+        params={"loc": location_id}
+    )
+
+
+def trait_columns(location_id):
+    # Traits in sheet order; every observation points at one of them
+    return list(dict.fromkeys(_traits(location_id)["trait_name"]))
+
+
+def text_traits(location_id):
+    traits = _traits(location_id)
+    return set(traits.loc[traits["data_type"] == "text", "trait_name"])
+
+
+def trait_dtypes(traits, text_cols):
+    # float, or string for text traits; see FIXED_DTYPES
+    return {t: "string" if t in text_cols else "float64" for t in traits}
+
+
+# fixed dtypes so every chunk has the same schema
+FIXED_DTYPES = {
+    "exp_id": "string", "location": "string", "season": "string", "treatment": "string",
+    "year": "Int64", "replication": "Int64", "block": "Int64",
+}
+
+
+def _pivot(long, traits, names, dtypes):
+    meta = long.drop_duplicates("id").set_index("id")[FIXED_COLS].astype(FIXED_DTYPES)
+    long = long.assign(attribute_name=long["trait_id"].map(names))
+    vals = pivot_values(long, "id").reindex(columns=traits).astype(dtypes)
+    return meta.join(vals).reset_index(drop=True)
+
+
+def iter_wide(location_id, status, traits, chunk_rows=CHUNK_ROWS):
+    known = _traits(location_id)
+    names = dict(zip(known["id"], known["trait_name"]))
+    dtypes = trait_dtypes(traits, text_traits(location_id))
+    carry = None
+    with get_engine().connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql(
+            EXPORT_SQL, conn, params={"st": status, "loc": location_id}, chunksize=chunk_rows
+        ):
+            if chunk.empty:
+                continue  # pandas yields one empty chunk when nothing matches
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+
+            last = chunk["id"].iloc[-1]
+            split = chunk["id"] == last
+            carry = chunk[split]
+            if (~split).any():
+                yield _pivot(chunk[~split], traits, names, dtypes)
+
+    if carry is not None and len(carry):
+        yield _pivot(carry, traits, names, dtypes)
+
+
+def iter_changes(location_id, status, traits, ids):
+    known = _traits(location_id)
+    names = dict(zip(known["id"], known["trait_name"]))
+    dtypes = trait_dtypes(traits, text_traits(location_id))
+    with get_engine().connect() as conn:
+        for batch in chunks(ids, CHANGE_PLOTS):
+            long = pd.read_sql(CHANGES_SQL, conn, params={"loc": location_id, "ids": batch})
+            if long.empty:
+                continue
+            # a plot without observations has one row with trait_id NULL
+            plots = long.drop_duplicates("id")
+            wide = _pivot(long, traits, names, dtypes)
+            keep = (plots["entry_status"] == status) & plots["trait_id"].notna()
+            wide.insert(0, "change", np.where(keep.to_numpy(), "upsert", "removed"))
+            yield wide
+
+
+def iter_store(wide, traits, text_cols, chunk_rows=CHUNK_ROWS):
+    # Same rows as iter_wide, read from the maintained wide table; plots
+    # without any observation are skipped like the inner join does.
+    wide = wide.dropna(subset=traits, how="all")[FIXED_COLS + traits]
+    wide = wide.astype({**FIXED_DTYPES, **trait_dtypes(traits, text_cols)}).reset_index(drop=True)
+    for start in range(0, len(wide), chunk_rows):
+        yield wide.iloc[start:start + chunk_rows]
+
+
+def _cell(v):
+    if pd.isna(v):
+        return None
+    return v.item() if hasattr(v, "item") else v
+
+
+def write_csv(chunks, path, columns):
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        csv.writer(fh).writerow(columns)
+        for wide in chunks:
+            wide.to_csv(fh, header=False, index=False)
+
+
+def write_xlsx(chunks, path, columns):
+    # write-only workbooks stream rows to disk instead of keeping cells
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("data")
+    ws.append(columns)
+    for wide in chunks:
+        for row in wide.itertuples(index=False):
+            ws.append([_cell(v) for v in row])
+    wb.save(path)
+
+
+def write_parquet(chunks, path, columns):
+    writer = None
+    try:
+        for wide in chunks:
+            if writer is None:
+                schema = pa.Schema.from_pandas(wide, preserve_index=False)
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_table(pa.Table.from_pandas(wide, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table(pa.Table.from_pandas(pd.DataFrame(columns=columns)), path)
+
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv, "parquet": write_parquet}
+
+
+def export_key(location_id, status, fmt, since=None):
+    # since: None for the full export, else the checkpoint of a changes export
+    return (location_id, status, fmt, since, cache.data_version(SOURCE_TABLES, location_id))
+
+
+def cached_export(location_id, status, fmt, since=None):
+    # (path, seq) of an up-to-date export if one was already generated; the
+    # file covers the change log up to seq
+    key = export_key(location_id, status, fmt, since)
+    with _lock:
+        entry = _outputs.get(key)
+        if entry and entry[0] > time.monotonic() and os.path.exists(entry[1]):
+            _outputs.move_to_end(key)
+            return entry[1], entry[2]
+    return None
+
+
+def _tracked(chunks, total, progress):
+    done = 0
+    for chunk in chunks:
+        yield chunk
+        done += len(chunk)
+        progress(done / total if total else 1.0, done)
+
+
+def build_export(location_id, status, fmt, progress=None, since=None):
+    # progress(fraction, plots_written) is called after every chunk. With
+    # `since`, only plots changed after that change log seq (see
+    # iter_changes); raises ValueError when the location was rewritten
+    # since, as removed plots can't be listed.
+    cached = cached_export(location_id, status, fmt, since)
+    if cached:
+        return cached[0]
+
+    # Read before the data, so a write racing this export is in the next one
+    repo = get_repo()
+    key = export_key(location_id, status, fmt, since)
+    seq = repo.change_head(location_id)
+    columns = None
+
+    if since is not None:
+        ids, rewritten = repo.changed_plots(location_id, since, seq)
+        if rewritten:
+            raise ValueError(
+                f"This location's data was uploaded, deleted or archived after change #{since}; "
+                "download everything instead"
+            )
+        traits = trait_columns(location_id)
+        chunks = iter_changes(location_id, status, traits, ids)
+        total = len(ids)
+        columns = ["change"] + FIXED_COLS + traits
+    elif wide_store.is_loaded(location_id):
+        wide, traits = wide_store.get_wide(location_id, status)
+        chunks = iter_store(wide, traits, text_traits(location_id))
+        total = len(wide)
+    else:
+        traits = trait_columns(location_id)
+        chunks = iter_wide(location_id, status, traits)
+        total = metadata_count(location_id, {"entry_status": [status]}, active_only=False)
+    if progress:
+        chunks = _tracked(chunks, total, progress)
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}", dir=_out_dir)
+    os.close(fd)
+    try:
+        WRITERS[fmt](chunks, path, columns or FIXED_COLS + traits)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    with _lock:
+        _outputs[key] = (time.monotonic() + cache.TTL_SECONDS, path, seq)
+        while len(_outputs) > MAX_OUTPUTS:
+            _, (_, old, _) = _outputs.popitem(last=False)
+            if os.path.exists(old):
+                os.remove(old)
+    return path
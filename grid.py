@@ -0,0 +1,126 @@
+import pandas as pd
+import streamlit as st
+
+from db.observations import cell_values
+from ingest import FIXED_COLS
+
+
+def compact_observations(obs_df):
+    # Categorical trait names and the narrowest integer id dtype; on large
+    # locations this is several times smaller than object strings + int64.
+    return pd.DataFrame({
+        "metadata_id": pd.to_numeric(obs_df["metadata_id"], downcast="unsigned"),
+        "attribute_name": obs_df["attribute_name"].astype("category"),
+        "attribute_value": cell_values(obs_df),
+    })
+
+
+def existing_lookup(obs_df):
+    # (metadata_id, attribute_name) -> value as a MultiIndex Series
+    obs = compact_observations(obs_df)
+    return obs.set_index(["metadata_id", "attribute_name"])["attribute_value"]
+
+
+def lookup(existing, keys):
+    # Vectorized get for many keys; missing cells come back as None
+    if not keys:
+        return {}
+    idx = pd.MultiIndex.from_tuples(keys, names=existing.index.names)
+    vals = existing.reindex(idx).to_numpy()
+    return {k: None if pd.isna(v) else v if isinstance(v, str) else float(v) for k, v in zip(keys, vals)}
+
+
+def overlay(existing, values):
+    # Lay {(metadata_id, attribute_name): value or None} over a lookup;
+    # None removes the cell
+    if not values:
+        return existing
+    idx = pd.MultiIndex.from_tuples(list(values), names=existing.index.names)
+    patch = pd.Series([float("nan") if v is None else v for v in values.values()], index=idx)
+    return pd.concat([existing[~existing.index.isin(idx)], patch.dropna()])
+
+
+def build_wide(meta_df, existing, traits, text_traits=()):
+    # One row per plot, one column per selected trait; blanks stay NaN.
+    names = existing.index.get_level_values("attribute_name")
+    wide = existing[names.isin(traits)].unstack("attribute_name")
+    wide = wide.reindex(index=meta_df["id"].to_numpy(), columns=traits)
+
+    out = meta_df[["id", *FIXED_COLS]].reset_index(drop=True)
+    for t in traits:
+        out[t] = wide[t].to_numpy(dtype=object if t in text_traits else float)
+    return out
+
+
+def grid_values(edited, traits, text_traits=()):
+    # Map the edited frame back to {(metadata_id, attribute_name): value};
+    # an emptied text cell counts as cleared
+    ids = edited["id"].astype(int).tolist()
+    values = {}
+    for t in traits:
+        for mid, v in zip(ids, edited[t].tolist()):
+            if pd.isna(v):
+                v = None
+            elif t in text_traits:
+                v = str(v).strip() or None
+            else:
+                v = float(v)
+            values[(mid, t)] = v
+    return values
+
+
+def column_config(traits, text_traits=(), limits=None):
+    # limits: validation.bounds(); the browser then refuses values outside
+    # a trait's bounds and shows its unit
+    config = {c: st.column_config.Column(c.upper(), disabled=True) for c in FIXED_COLS}
+    config["id"] = None  # hidden, used to map edits back
+    for t in traits:
+        if t in text_traits:
+            config[t] = st.column_config.TextColumn(t, max_chars=255)
+        elif limits is not None and t in limits.index:
+            unit, lo, hi = limits.loc[t, ["unit", "min_value", "max_value"]]
+            config[t] = st.column_config.NumberColumn(
+                t,
+                help=unit or None,
+                min_value=None if pd.isna(lo) else lo,
+                max_value=None if pd.isna(hi) else hi,
+            )
+        else:
+            config[t] = st.column_config.NumberColumn(t)
+    return config
+
+
+def filter_bar(key, options, statuses=None):
+    # Replication / block / treatment (and optionally status) filters that
+    # are pushed into SQL; changing them goes back to the first page.
+    cols = st.columns(4 if statuses else 3)
+    filters = {
+        name: cols[i].multiselect(name.capitalize(), options[name], key=f"{key}_{name}")
+        for i, name in enumerate(("replication", "block", "treatment"))
+    }
+    if statuses:
+        filters["entry_status"] = cols[3].multiselect("Status", statuses, key=f"{key}_status")
+
+    sig = repr(sorted(filters.items()))
+    if st.session_state.get(f"{key}_filters") != sig:
+        st.session_state[f"{key}_filters"] = sig
+        st.session_state[f"{key}_pages"] = [0]
+    return filters
+
+
+def page_start(key):
+    # id after which the current page starts (keyset pagination)
+    return st.session_state.setdefault(f"{key}_pages", [0])[-1]
+
+
+def pager(key, page_df, has_next):
+    pages = st.session_state.setdefault(f"{key}_pages", [0])
+    c1, c2, c3 = st.columns([1, 1, 6])
+
+    if c1.button("◀ Prev", key=f"{key}_prev", disabled=len(pages) == 1):
+        pages.pop()
+        st.rerun()
+    if c2.button("Next ▶", key=f"{key}_next", disabled=not has_next or page_df.empty):
+        pages.append(int(page_df["id"].iloc[-1]))
+        st.rerun()
+    c3.caption(f"Page {len(pages)}")
@@ -0,0 +1,161 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+# Columns A–G of the trial sheet, in order; everything from H on is a trait
+FIXED_COLS = ["exp_id", "location", "year", "season", "replication", "block", "treatment"]
+INT_COLS = ["year", "replication", "block"]
+TEXT_COLS = ["exp_id", "location", "season", "treatment"]
+
+CHUNK_ROWS = 5000
+# plots per transaction when ingest_excel commits as it goes (conn=None)
+COMMIT_ROWS = 500
+
+
+def _labels(header):
+    # Header cells -> column labels. A repeated name gets ".1", ".2", ... as
+    # pd.read_excel did, so every trait column stays a column of its own.
+    labels, seen = [], set()
+    for c in header:
+        name = str(c).strip() if c is not None else ""
+        if name:
+            base, n = name, 0
+            while name in seen:
+                n += 1
+                name = f"{base}.{n}"
+            seen.add(name)
+        labels.append(name)
+    return labels
+
+
+def read_header(file):
+    wb = load_workbook(file, read_only=True, data_only=True)
+    ws = wb.active
+    header = next(ws.iter_rows(max_row=1, values_only=True), ())
+    total = max((ws.max_row or 1) - 1, 0)
+    wb.close()
+    file.seek(0)
+    return _labels(header), total
+
+
+def iter_chunks(file, chunk_rows=CHUNK_ROWS):
+    # openpyxl read-only mode streams rows from the zip instead of building
+    # the whole workbook in memory; we hand out one DataFrame per chunk,
+    # indexed by sheet row number (blank rows are skipped, not renumbered).
+    wb = load_workbook(file, read_only=True, data_only=True)
+    ws = wb.active
+    rows = ws.iter_rows(values_only=True)
+    header = _labels(next(rows, ()))
+
+    buf, numbers = [], []
+    for number, r in enumerate(rows, start=2):
+        if r is None or all(v is None for v in r):
+            continue
+        buf.append(r[:len(header)])
+        numbers.append(number)
+        if len(buf) >= chunk_rows:
+            yield pd.DataFrame(buf, columns=header, index=numbers)
+            buf, numbers = [], []
+
+    if buf:
+        yield pd.DataFrame(buf, columns=header, index=numbers)
+    wb.close()
+
+
+def detect_text_traits(df, traits):
+    # A trait column is text when most of its filled cells in the first
+    # chunk are not numbers; a few stray words in a number column stay
+    # problems to fix instead.
+    found = set()
+    for c in traits:
+        raw = df[c].dropna().astype("string").str.strip()
+        raw = raw[raw != ""]
+        if len(raw) and pd.to_numeric(raw, errors="coerce").isna().mean() > 0.5:
+            found.add(c)
+    return found
+
+
+def coerce_chunk(df, traits, text_traits=()):
+    # Vectorized validation: returns the cleaned frame plus a list of
+    # (sheet row, column, raw value) problems found in this chunk.
+    out = pd.DataFrame(index=df.index)
+    problems = []
+
+    fixed = df.iloc[:, :7].copy()
+    fixed.columns = FIXED_COLS
+
+    for c in TEXT_COLS:
+        out[c] = fixed[c].astype("string").str.strip()
+
+    for c in INT_COLS:
+        num = pd.to_numeric(fixed[c], errors="coerce")
+        bad = (num.isna() & fixed[c].notna()) | (num.notna() & (num % 1 != 0))
+        problems += [(i, c, fixed[c].at[i]) for i in fixed.index[bad]]
+        out[c] = num.where(~bad).astype("Int64")
+
+    numeric = [t for t in traits if t not in text_traits]
+    values = df[numeric].apply(pd.to_numeric, errors="coerce")
+    bad = values.isna() & df[numeric].notna()
+    for c in numeric:
+        problems += [(i, c, df[c].at[i]) for i in df.index[bad[c]]]
+
+    for c in text_traits:
+        values[c] = df[c].astype("string").str.strip().replace("", pd.NA)
+
+    return out, values[traits], problems
+
+
+def _py(v):
+    # mysql-connector cannot bind numpy scalars
+    if pd.isna(v):
+        return None
+    return v.item() if hasattr(v, "item") else v
+
+
+def ingest_excel(repo, conn, file, location_id, progress=None):
+    # Stream the sheet, insert metadata + traits + melted H+ values.
+    # With a conn everything joins the caller's transaction; with conn=None
+    # each chunk commits on its own. The caller removes the old experiment.
+    # Problems are (sheet row, column, raw value).
+    header, total = read_header(file)
+    chunk_rows = CHUNK_ROWS if conn is not None else COMMIT_ROWS
+    traits = [t for t in header[7:] if t]
+    stats = {"plots": 0, "observations": 0, "problems": []}
+    exp_id = text_traits = None
+
+    for chunk in iter_chunks(file, chunk_rows):
+        if text_traits is None:
+            text_traits = detect_text_traits(chunk, traits)
+        meta, values, problems = coerce_chunk(chunk, traits, text_traits)
+        stats["problems"] += sorted(problems, key=lambda p: p[0])
+
+        with repo.begin(conn) as c:
+            if exp_id is None:
+                exp_id = str(meta["exp_id"].iloc[0])
+                repo.add_traits(
+                    location_id, traits, exp_id=exp_id, conn=c,
+                    types={t: "text" for t in text_traits}
+                )
+
+            rows = [tuple(_py(v) for v in r) for r in meta[FIXED_COLS].itertuples(index=False)]
+            ids = repo.insert_metadata(rows, location_id, conn=c)
+            values.index = ids
+
+            long = values.stack().dropna().rename("attribute_value").reset_index()
+            long.columns = ["metadata_id", "attribute_name", "attribute_value"]
+            repo.upsert_observations(
+                dict(zip(zip(long["metadata_id"], long["attribute_name"]), long["attribute_value"])),
+                location_id,
+                conn=c
+            )
+
+        stats["plots"] += len(meta)
+        stats["observations"] += len(long)
+        if progress:
+            progress(min(stats["plots"] / total, 1.0) if total else 1.0, stats)
+
+    if not stats["plots"]:
+        # before a replace swaps an empty experiment in
+        raise ValueError("The sheet has no plot rows below the header")
+    stats["traits"] = traits
+    stats["text_traits"] = sorted(text_traits or ())
+    return stats
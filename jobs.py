@@ -0,0 +1,321 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+import archive
+from db import cache
+from db import metrics
+from db import wide as wide_store
+from db.db import setting
+from db.repo import get_repo
+from export import build_export
+from ingest import ingest_excel
+
+# Background jobs for the heavy Admin operations: replace (upload), delete,
+# reopen and export. Each job is a row in the `jobs` table, so every session
+# (and a page reload) sees its status and progress. Jobs run on a small
+# thread pool in the server process that queued them, one at a time per
+# location across all server processes: a job starts by claiming its row
+# (repo.start_job), which fails while another job runs at the location, so
+# a replace and an export of the same location never overlap. A job that
+# has to wait stays queued and is retried every QUEUE_POLL_SECONDS.
+#
+# Replace and delete work in short transactions (bounded delete batches,
+# one per ingest chunk) so other locations' saves are never stuck behind
+# them. While one runs, repo.replacing() turns away saves to that location.
+# A replace loads into a hidden staging location and swaps it in at the end,
+# so a failed or cancelled one leaves the old data as it was; a delete that
+# stops part way clears the rest rather than leaving some of it.
+JOB_WORKERS = int(setting("job_workers", 2))
+UPLOAD_DIR = os.path.join(setting("job_dir", tempfile.gettempdir()), "agri_jobs")
+CANCEL_POLL_SECONDS = 1.0  # how often a running job re-reads its cancel flag
+QUEUE_POLL_SECONDS = float(setting("job_queue_poll_seconds", 2))
+
+# host:pid:start - the start token tells this process from an earlier one
+# that had the same pid (a restarted container is pid 1 again)
+WORKER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+ACTIVE = ("queued", "running")
+# Kinds the panel only offers to cancel while queued: a running delete
+# clears the rest of the location anyway (see _rewriting)
+CANCEL_WHILE_QUEUED = ("delete",)
+
+
+class JobCancelled(Exception):
+    # str(e) is the message shown for the job
+    def __init__(self, message="Cancelled; nothing was changed"):
+        super().__init__(message)
+
+
+class JobContext:
+    # Handed to a job function: report progress, notice cancellation
+    def __init__(self, runner, job_id, created_by=None):
+        self.runner = runner
+        self.job_id = job_id
+        self.created_by = created_by
+        self.last = 0.0
+
+    def progress(self, fraction, message=""):
+        # Raises JobCancelled once a cancel was requested; jobs call this
+        # between chunks, so the transaction around them rolls back.
+        # Progress stays in memory: on SQLite a write from here would wait
+        # on the job's own open transaction.
+        with self.runner.lock:
+            self.runner.progress[self.job_id] = (min(max(fraction, 0.0), 1.0), message)
+            if self.job_id in self.runner.cancelled:
+                raise JobCancelled()
+
+        now = time.monotonic()
+        if now - self.last >= CANCEL_POLL_SECONDS:
+            # cancel requested from another server process
+            self.last = now
+            if self.runner.repo.cancel_requested(self.job_id):
+                raise JobCancelled()
+
+
+# -- job kinds ----------------------------------------------------------
+# fn(ctx, repo, location_id, params) -> result dict (stored as JSON)
+
+def _changed(location_id):
+    cache.invalidate(
+        "experiment_metadata", "experiment_traits", "observation_data",
+        location_id=location_id
+    )
+    wide_store.drop(location_id)
+
+
+@contextmanager
+def _rewriting(ctx, repo, location_id, action):
+    # The location's data is deleted in committed batches. If that stops
+    # part way (failure or cancel) the rest is cleared too, so the location
+    # ends up empty rather than half deleted. Either way the change log
+    # records the location as rewritten.
+    try:
+        yield
+    except BaseException as e:
+        repo.delete_location_data(location_id)
+        if isinstance(e, JobCancelled):
+            raise JobCancelled("Cancelled; this location's data was cleared") from None
+        raise
+    finally:
+        repo.log_location(location_id, action, by=ctx.created_by)
+        _changed(location_id)
+
+
+def _delete(ctx, repo, location_id, phase):
+    repo.delete_location_data(
+        location_id, progress=lambda n: ctx.progress(0.0, f"{phase}: {n} rows removed")
+    )
+
+
+def run_replace(ctx, repo, location_id, params):
+    # Readers see the old experiment until the swap, then the new one; on
+    # failure or cancel only the staging rows this job loaded are removed
+    path = params["path"]
+    try:
+        ctx.progress(0.0, "Starting")
+        for stale in repo.staging_locations(location_id):
+            repo.drop_staging_location(stale)  # left by a crashed replace
+        stage = repo.add_staging_location(location_id, ctx.job_id)
+        try:
+            with open(path, "rb") as fh:
+                stats = ingest_excel(
+                    repo, None, fh, stage,
+                    progress=lambda f, s: ctx.progress(f, f"{s['plots']} plots loaded")
+                )
+            ctx.progress(1.0, "Switching to the new experiment")
+            repo.swap_location_data(location_id, stage)
+        except BaseException:
+            repo.drop_staging_location(stage)
+            raise
+        repo.log_location(location_id, "upload", by=ctx.created_by)
+        _changed(location_id)
+        # stage now holds the old experiment; a failure here is retried by
+        # the next replace
+        try:
+            repo.drop_staging_location(stage)
+        except Exception:
+            traceback.print_exc()
+    finally:
+        os.remove(path)
+
+    return {
+        "plots": stats["plots"],
+        "traits": len(stats["traits"]),
+        "text_traits": stats["text_traits"],
+        "observations": stats["observations"],
+        "problems": stats["problems"][:500],
+        "problem_count": len(stats["problems"]),
+    }
+
+
+def run_delete(ctx, repo, location_id, params):
+    ctx.progress(0.0, "Starting")
+    with _rewriting(ctx, repo, location_id, "delete"):
+        _delete(ctx, repo, location_id, "Deleting")
+    return {}
+
+
+def run_reopen(ctx, repo, location_id, params):
+    ctx.progress(0.0, "Reopening")
+    repo.set_status(location_id, "Draft", from_status="Submitted", by=ctx.created_by)
+    cache.invalidate("experiment_metadata", location_id=location_id)
+    wide_store.set_status(location_id, "Draft", from_status="Submitted")
+    return {}
+
+
+def run_archive(ctx, repo, location_id, params):
+    ctx.progress(0.0, "Writing the archive file")
+    return archive.archive_season(
+        repo, location_id, params["year"], params["season"], params.get("by"),
+        progress=lambda f: ctx.progress(f, "Writing the archive file")
+    )
+
+
+def run_export(ctx, repo, location_id, params):
+    path = build_export(
+        location_id, params["status"], params["fmt"],
+        progress=lambda f, n: ctx.progress(f, f"{n} plots written"),
+        since=params.get("since")
+    )
+    return {"path": path}
+
+
+KINDS = {
+    "replace": run_replace,
+    "delete": run_delete,
+    "reopen": run_reopen,
+    "archive": run_archive,
+    "export": run_export,
+}
+
+
+# -- runner -------------------------------------------------------------
+
+class JobRunner:
+    def __init__(self, repo, workers=JOB_WORKERS):
+        self.repo = repo
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.lock = threading.Lock()
+        self.running = 0       # jobs claimed by this process
+        self.cancelled = set()
+        self.progress = {}     # job_id -> (fraction, message) while running
+        self.wake = threading.Event()
+        self.fail_orphans()
+        threading.Thread(target=self._dispatch, name="job-dispatch", daemon=True).start()
+
+    def fail_orphans(self):
+        # Jobs left queued/running by an earlier process on this host: its
+        # pid is gone, or is ours now. Live processes' jobs are never touched.
+        host, pid = socket.gethostname(), str(os.getpid())
+        for job in self.repo.active_jobs():
+            name, _, rest = (job["worker"] or "").partition(":")
+            job_pid = rest.partition(":")[0]
+            if name == host and job["worker"] != WORKER and (job_pid == pid or not _alive(job_pid)):
+                self.repo.fail_orphan(job["id"], job["worker"], "Server restarted before the job finished")
+
+    def submit(self, kind, location_id, params=None, created_by=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        job_id = self.repo.create_job(
+            kind, location_id, json.dumps(params or {}), created_by, WORKER
+        )
+        self.wake.set()
+        return job_id
+
+    def cancel(self, job_id):
+        # In-memory flag first: on SQLite the row update below has to wait
+        # until the running job has rolled back
+        with self.lock:
+            self.cancelled.add(job_id)
+        self.repo.cancel_job(job_id)
+
+    def jobs(self, location_id, limit=20):
+        # Recent jobs with live progress for the ones running here
+        jobs = self.repo.jobs(location_id, limit)
+        with self.lock:
+            for j in jobs:
+                if j["status"] == "running" and j["id"] in self.progress:
+                    j["progress"], j["message"] = self.progress[j["id"]]
+        return jobs
+
+    def _dispatch(self):
+        # Woken by submit and by finished jobs; the timeout picks up
+        # locations freed by other server processes
+        while True:
+            self.wake.wait(QUEUE_POLL_SECONDS)
+            self.wake.clear()
+            try:
+                self._start_queued()
+            except Exception:
+                traceback.print_exc()
+
+    def _start_queued(self):
+        # This process's queued jobs, oldest first per location, while a
+        # worker is free
+        tried = set()
+        for job in self.repo.queued_jobs(WORKER):
+            with self.lock:
+                if self.running >= self.workers:
+                    return
+            if job["location_id"] in tried:
+                continue
+            tried.add(job["location_id"])
+            if self.repo.start_job(job["id"], job["location_id"]):
+                with self.lock:
+                    self.running += 1
+                self.pool.submit(self._run, job["id"], job["location_id"])
+
+    def _run(self, job_id, location_id):
+        try:
+            job = self.repo.job(job_id)
+            ctx = JobContext(self, job_id, job["created_by"])
+            try:
+                with metrics.span(f"job.{job['kind']}"):
+                    result = KINDS[job["kind"]](ctx, self.repo, location_id, json.loads(job["params"]))
+            except JobCancelled as e:
+                self.repo.finish_job(job_id, "cancelled", str(e))
+            except Exception as e:
+                self.repo.finish_job(job_id, "failed", str(e)[:255], error=traceback.format_exc())
+            else:
+                self.repo.finish_job(job_id, "done", "Finished", result=json.dumps(result, default=str))
+        finally:
+            with self.lock:
+                self.cancelled.discard(job_id)
+                self.progress.pop(job_id, None)
+                self.running -= 1
+            self.wake.set()
+
+
+def _alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def save_upload(file):
+    # The upload only lives as long as the session; the job reads a copy
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.xlsx")
+    file.seek(0)
+    with open(path, "wb") as fh:
+        fh.write(file.read())
+    return path
+
+
+@st.cache_resource
+def get_runner():
+    return JobRunner(get_repo())
@@ -0,0 +1,10 @@
+-- One value per plot and trait: required by the bulk upsert save path.
+-- Keep the newest row for any (metadata_id, attribute_name) duplicates first.
+DELETE o1 FROM observation_data o1
+JOIN observation_data o2
+  ON o1.metadata_id = o2.metadata_id
+ AND o1.attribute_name = o2.attribute_name
+ AND o1.id < o2.id;
+
+ALTER TABLE observation_data
+    ADD UNIQUE KEY uq_obs_metadata_attr (metadata_id, attribute_name);
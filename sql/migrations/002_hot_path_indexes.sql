@@ -0,0 +1,15 @@
+-- Composite indexes for the filters app.py runs on every rerun.
+
+-- User panel metadata list, View Data, Reopen, Download
+ALTER TABLE experiment_metadata
+    ADD INDEX idx_meta_loc_status_active (location_id, entry_status, is_active),
+    ADD INDEX idx_meta_loc_active (location_id, is_active);
+
+-- Trait lists and the trait_name join
+ALTER TABLE experiment_traits
+    ADD INDEX idx_traits_loc_name (location_id, trait_name),
+    ADD INDEX idx_traits_loc_active (location_id, is_active);
+
+-- Per-location observation loads
+ALTER TABLE observation_data
+    ADD INDEX idx_obs_loc_meta_attr (location_id, metadata_id, attribute_name);
@@ -0,0 +1,23 @@
+-- Background jobs for heavy Admin operations (see jobs.py).
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    location_id INT NOT NULL,
+    status ENUM('queued','running','done','failed','cancelled') NOT NULL DEFAULT 'queued',
+    progress DOUBLE NOT NULL DEFAULT 0,
+    message VARCHAR(255) DEFAULT '',
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+    created_by VARCHAR(100),
+    worker VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+    INDEX idx_jobs_loc (location_id, id),
+    INDEX idx_jobs_status (status),
+    FOREIGN KEY (location_id) REFERENCES locations(id)
+        ON DELETE CASCADE
+);
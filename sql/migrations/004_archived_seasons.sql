@@ -0,0 +1,21 @@
+-- Season archival (see archive.py): completed seasons move out of the hot
+-- tables into Parquet files; this table records where each one went.
+
+-- Per-season lookups when listing and archiving seasons
+ALTER TABLE experiment_metadata
+    ADD INDEX idx_meta_loc_season (location_id, year, season);
+
+CREATE TABLE IF NOT EXISTS archived_seasons (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    location_id INT NOT NULL,
+    year INT NOT NULL,
+    season VARCHAR(50) NOT NULL,
+    plots INT NOT NULL,
+    observations INT NOT NULL,
+    path VARCHAR(500) NOT NULL,
+    archived_by VARCHAR(100),
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_archived_season (location_id, year, season),
+    FOREIGN KEY (location_id) REFERENCES locations(id)
+        ON DELETE CASCADE
+);
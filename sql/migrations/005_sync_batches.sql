@@ -0,0 +1,11 @@
+-- Offline field entry (see db/journal.py): every batch a device pushes is
+-- recorded with its result, so a batch replayed after a lost reply is
+-- answered from here instead of being applied twice.
+
+CREATE TABLE IF NOT EXISTS sync_batches (
+    batch_id VARCHAR(64) PRIMARY KEY,
+    device VARCHAR(100),
+    entries INT NOT NULL,
+    result TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,39 @@
+-- Observations reference their trait by id instead of repeating the trait
+-- name on every row, and text traits get a value column of their own.
+
+-- Observed names with no trait row (traits deleted by hand) get an
+-- inactive one, so every observation has something to point at
+INSERT INTO experiment_traits (exp_id,trait_name,data_type,unit,is_active,location_id)
+SELECT DISTINCT 'MIGRATED', o.attribute_name, 'number', '', 0, o.location_id
+FROM observation_data o
+LEFT JOIN experiment_traits t
+  ON t.location_id = o.location_id
+ AND t.trait_name = o.attribute_name
+WHERE t.id IS NULL;
+
+ALTER TABLE observation_data
+    ADD COLUMN trait_id INT NULL AFTER metadata_id,
+    ADD COLUMN text_value VARCHAR(255) NULL AFTER attribute_value;
+
+-- Duplicate trait names in a location map to the oldest row, as the
+-- application does
+UPDATE observation_data o
+JOIN (
+    SELECT location_id, trait_name, MIN(id) id
+    FROM experiment_traits
+    GROUP BY location_id, trait_name
+) t
+  ON t.location_id = o.location_id
+ AND t.trait_name = o.attribute_name
+SET o.trait_id = t.id;
+
+ALTER TABLE observation_data
+    DROP INDEX uq_obs_metadata_attr,
+    DROP INDEX idx_obs_loc_meta_attr,
+    DROP COLUMN attribute_name,
+    MODIFY trait_id INT NOT NULL,
+    ADD UNIQUE KEY uq_obs_metadata_trait (metadata_id, trait_id),
+    ADD INDEX idx_obs_loc_meta_trait (location_id, metadata_id, trait_id),
+    ADD INDEX idx_obs_trait (trait_id),
+    ADD FOREIGN KEY (trait_id) REFERENCES experiment_traits(id)
+        ON DELETE CASCADE;
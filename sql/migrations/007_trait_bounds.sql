@@ -0,0 +1,6 @@
+-- Optional plausible range per trait, checked on every save before
+-- anything is written (see validation.py). NULL means unbounded.
+
+ALTER TABLE experiment_traits
+    ADD COLUMN min_value DOUBLE NULL AFTER unit,
+    ADD COLUMN max_value DOUBLE NULL AFTER min_value;
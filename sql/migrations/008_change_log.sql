@@ -0,0 +1,26 @@
+-- Append-only log of every write to a location's data (see the change log
+-- section of db/repo.py), and how far each admin has downloaded it, for
+-- "changes since my last download" exports. No foreign keys: log rows
+-- outlive the plots and traits they describe.
+
+CREATE TABLE IF NOT EXISTS change_log (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    location_id INT NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    metadata_id INT NULL,
+    trait_id INT NULL,
+    attribute_value DOUBLE NULL,
+    text_value VARCHAR(255) NULL,
+    changed_by VARCHAR(100),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_change_loc_seq (location_id, seq)
+);
+
+CREATE TABLE IF NOT EXISTS export_checkpoints (
+    location_id INT NOT NULL,
+    entry_status VARCHAR(20) NOT NULL,
+    username VARCHAR(100) NOT NULL,
+    seq BIGINT NOT NULL,
+    downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (location_id, entry_status, username)
+);
@@ -0,0 +1,5 @@
+-- Logout revokes a user's session tokens: a token carries the epoch it was
+-- issued under (see auth.py) and logout moves it on.
+
+ALTER TABLE users
+    ADD COLUMN session_epoch INT NOT NULL DEFAULT 0;
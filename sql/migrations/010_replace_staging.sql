@@ -0,0 +1,6 @@
+-- A replace job loads the new upload into a hidden staging location and then
+-- swaps it with the live one (see jobs.run_replace). staging_for is the
+-- location a staging row belongs to; NULL for real locations.
+
+ALTER TABLE locations
+    ADD COLUMN staging_for INT NULL;
@@ -1,7 +1,8 @@
 -- Locations
 CREATE TABLE locations (
     id INT AUTO_INCREMENT PRIMARY KEY,
-    name VARCHAR(100) UNIQUE NOT NULL
+    name VARCHAR(100) UNIQUE NOT NULL,
+    staging_for INT NULL
 );
 
 -- Users
@@ -11,6 +12,7 @@ CREATE TABLE users (
     password_hash VARCHAR(255) NOT NULL,
     role ENUM('super_admin','admin','user') NOT NULL,
     location_id INT,
+    session_epoch INT NOT NULL DEFAULT 0,
     FOREIGN KEY (location_id) REFERENCES locations(id)
         ON DELETE SET NULL
 );
@@ -28,6 +30,9 @@ CREATE TABLE experiment_metadata (
     entry_status ENUM('Draft','Submitted') DEFAULT 'Draft',
     is_active TINYINT(1) DEFAULT 1,
     location_id INT NOT NULL,
+    INDEX idx_meta_loc_status_active (location_id, entry_status, is_active),
+    INDEX idx_meta_loc_active (location_id, is_active),
+    INDEX idx_meta_loc_season (location_id, year, season),
     FOREIGN KEY (location_id) REFERENCES locations(id)
         ON DELETE CASCADE
 );
@@ -39,8 +44,12 @@ CREATE TABLE experiment_traits (
     trait_name VARCHAR(100) NOT NULL,
     data_type VARCHAR(50) DEFAULT 'number',
     unit VARCHAR(50) DEFAULT '',
+    min_value DOUBLE NULL,
+    max_value DOUBLE NULL,
     is_active TINYINT(1) DEFAULT 1,
     location_id INT NOT NULL,
+    INDEX idx_traits_loc_name (location_id, trait_name),
+    INDEX idx_traits_loc_active (location_id, is_active),
     FOREIGN KEY (location_id) REFERENCES locations(id)
         ON DELETE CASCADE
 );
@@ -49,11 +58,108 @@ CREATE TABLE experiment_traits (
 CREATE TABLE observation_data (
     id INT AUTO_INCREMENT PRIMARY KEY,
     metadata_id INT NOT NULL,
-    attribute_name VARCHAR(100) NOT NULL,
+    trait_id INT NOT NULL,
     attribute_value DOUBLE,
+    text_value VARCHAR(255),
     location_id INT NOT NULL,
+    UNIQUE KEY uq_obs_metadata_trait (metadata_id, trait_id),
+    INDEX idx_obs_loc_meta_trait (location_id, metadata_id, trait_id),
+    INDEX idx_obs_trait (trait_id),
     FOREIGN KEY (metadata_id) REFERENCES experiment_metadata(id)
         ON DELETE CASCADE,
+    FOREIGN KEY (trait_id) REFERENCES experiment_traits(id)
+        ON DELETE CASCADE,
+    FOREIGN KEY (location_id) REFERENCES locations(id)
+        ON DELETE CASCADE
+);
+
+-- Background jobs for heavy Admin operations (see jobs.py)
+CREATE TABLE jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    location_id INT NOT NULL,
+    status ENUM('queued','running','done','failed','cancelled') NOT NULL DEFAULT 'queued',
+    progress DOUBLE NOT NULL DEFAULT 0,
+    message VARCHAR(255) DEFAULT '',
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+    created_by VARCHAR(100),
+    worker VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+    INDEX idx_jobs_loc (location_id, id),
+    INDEX idx_jobs_status (status),
+    FOREIGN KEY (location_id) REFERENCES locations(id)
+        ON DELETE CASCADE
+);
+
+-- Seasons archived to Parquet files (see archive.py)
+CREATE TABLE archived_seasons (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    location_id INT NOT NULL,
+    year INT NOT NULL,
+    season VARCHAR(50) NOT NULL,
+    plots INT NOT NULL,
+    observations INT NOT NULL,
+    path VARCHAR(500) NOT NULL,
+    archived_by VARCHAR(100),
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_archived_season (location_id, year, season),
     FOREIGN KEY (location_id) REFERENCES locations(id)
         ON DELETE CASCADE
 );
+
+-- Batches pushed by offline devices (see db/journal.py)
+CREATE TABLE sync_batches (
+    batch_id VARCHAR(64) PRIMARY KEY,
+    device VARCHAR(100),
+    entries INT NOT NULL,
+    result TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Append-only log of writes, and how far each admin has downloaded it
+-- (see db/repo.py). No foreign keys: log rows outlive their plots.
+CREATE TABLE change_log (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    location_id INT NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    metadata_id INT NULL,
+    trait_id INT NULL,
+    attribute_value DOUBLE NULL,
+    text_value VARCHAR(255) NULL,
+    changed_by VARCHAR(100),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_change_loc_seq (location_id, seq)
+);
+
+CREATE TABLE export_checkpoints (
+    location_id INT NOT NULL,
+    entry_status VARCHAR(20) NOT NULL,
+    username VARCHAR(100) NOT NULL,
+    seq BIGINT NOT NULL,
+    downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (location_id, entry_status, username)
+);
+
+-- Applied migrations (see db/migrate.py). Everything in sql/migrations
+-- up to the versions below is already part of this file.
+CREATE TABLE schema_migrations (
+    version VARCHAR(100) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (version) VALUES
+    ('001_observation_data_unique'),
+    ('002_hot_path_indexes'),
+    ('003_jobs'),
+    ('004_archived_seasons'),
+    ('005_sync_batches'),
+    ('006_observation_trait_ids'),
+    ('007_trait_bounds'),
+    ('008_change_log'),
+    ('009_session_epoch'),
+    ('010_replace_staging');
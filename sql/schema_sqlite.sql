@@ -0,0 +1,123 @@
+-- Embedded SQLite schema (db_backend = "sqlite"); mirrors sql/schema.sql
+-- including every migration in sql/migrations.
+
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) UNIQUE NOT NULL,
+    staging_for INTEGER NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(100) UNIQUE NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    role VARCHAR(20) NOT NULL CHECK (role IN ('super_admin','admin','user')),
+    location_id INTEGER REFERENCES locations(id) ON DELETE SET NULL,
+    session_epoch INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS experiment_metadata (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exp_id VARCHAR(100),
+    location VARCHAR(100),
+    year INTEGER,
+    season VARCHAR(50),
+    replication INTEGER,
+    block INTEGER,
+    treatment VARCHAR(100),
+    entry_status VARCHAR(20) DEFAULT 'Draft' CHECK (entry_status IN ('Draft','Submitted')),
+    is_active INTEGER DEFAULT 1,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_meta_loc_status_active ON experiment_metadata (location_id, entry_status, is_active);
+CREATE INDEX IF NOT EXISTS idx_meta_loc_active ON experiment_metadata (location_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_meta_loc_season ON experiment_metadata (location_id, year, season);
+
+CREATE TABLE IF NOT EXISTS experiment_traits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exp_id VARCHAR(100),
+    trait_name VARCHAR(100) NOT NULL,
+    data_type VARCHAR(50) DEFAULT 'number',
+    unit VARCHAR(50) DEFAULT '',
+    min_value DOUBLE,
+    max_value DOUBLE,
+    is_active INTEGER DEFAULT 1,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_traits_loc_name ON experiment_traits (location_id, trait_name);
+CREATE INDEX IF NOT EXISTS idx_traits_loc_active ON experiment_traits (location_id, is_active);
+
+CREATE TABLE IF NOT EXISTS observation_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    metadata_id INTEGER NOT NULL REFERENCES experiment_metadata(id) ON DELETE CASCADE,
+    trait_id INTEGER NOT NULL REFERENCES experiment_traits(id) ON DELETE CASCADE,
+    attribute_value DOUBLE,
+    text_value VARCHAR(255),
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    UNIQUE (metadata_id, trait_id)
+);
+CREATE INDEX IF NOT EXISTS idx_obs_loc_meta_trait ON observation_data (location_id, metadata_id, trait_id);
+CREATE INDEX IF NOT EXISTS idx_obs_trait ON observation_data (trait_id);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind VARCHAR(50) NOT NULL,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    progress DOUBLE NOT NULL DEFAULT 0,
+    message VARCHAR(255) DEFAULT '',
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_by VARCHAR(100),
+    worker VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_loc ON jobs (location_id, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+
+CREATE TABLE IF NOT EXISTS archived_seasons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    season VARCHAR(50) NOT NULL,
+    plots INTEGER NOT NULL,
+    observations INTEGER NOT NULL,
+    path VARCHAR(500) NOT NULL,
+    archived_by VARCHAR(100),
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (location_id, year, season)
+);
+
+CREATE TABLE IF NOT EXISTS sync_batches (
+    batch_id VARCHAR(64) PRIMARY KEY,
+    device VARCHAR(100),
+    entries INTEGER NOT NULL,
+    result TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    location_id INTEGER NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    metadata_id INTEGER,
+    trait_id INTEGER,
+    attribute_value DOUBLE,
+    text_value VARCHAR(255),
+    changed_by VARCHAR(100),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_change_loc_seq ON change_log (location_id, seq);
+
+CREATE TABLE IF NOT EXISTS export_checkpoints (
+    location_id INTEGER NOT NULL,
+    entry_status VARCHAR(20) NOT NULL,
+    username VARCHAR(100) NOT NULL,
+    seq INTEGER NOT NULL,
+    downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (location_id, entry_status, username)
+);
@@ -0,0 +1,40 @@
+-- SQLite version of sql/migrations/006_observation_trait_ids.sql, run by
+-- SQLiteRepository.bootstrap() on files whose observation_data still has
+-- attribute_name. SQLite cannot drop that column's unique key in place,
+-- so the table is rebuilt; the indexes come from schema_sqlite.sql.
+
+BEGIN;
+
+INSERT INTO experiment_traits (exp_id,trait_name,data_type,unit,is_active,location_id)
+SELECT DISTINCT 'MIGRATED', o.attribute_name, 'number', '', 0, o.location_id
+FROM observation_data o
+LEFT JOIN experiment_traits t
+  ON t.location_id = o.location_id
+ AND t.trait_name = o.attribute_name
+WHERE t.id IS NULL;
+
+CREATE TABLE observation_data_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    metadata_id INTEGER NOT NULL REFERENCES experiment_metadata(id) ON DELETE CASCADE,
+    trait_id INTEGER NOT NULL REFERENCES experiment_traits(id) ON DELETE CASCADE,
+    attribute_value DOUBLE,
+    text_value VARCHAR(255),
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    UNIQUE (metadata_id, trait_id)
+);
+
+INSERT INTO observation_data_new (id,metadata_id,trait_id,attribute_value,location_id)
+SELECT o.id, o.metadata_id, t.id, o.attribute_value, o.location_id
+FROM observation_data o
+JOIN (
+    SELECT location_id, trait_name, MIN(id) id
+    FROM experiment_traits
+    GROUP BY location_id, trait_name
+) t
+  ON t.location_id = o.location_id
+ AND t.trait_name = o.attribute_name;
+
+DROP TABLE observation_data;
+ALTER TABLE observation_data_new RENAME TO observation_data;
+
+COMMIT;
@@ -0,0 +1,4 @@
+-- SQLite version of sql/migrations/007_trait_bounds.sql
+
+ALTER TABLE experiment_traits ADD COLUMN min_value DOUBLE;
+ALTER TABLE experiment_traits ADD COLUMN max_value DOUBLE;
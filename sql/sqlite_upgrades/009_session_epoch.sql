@@ -0,0 +1,3 @@
+-- SQLite version of sql/migrations/009_session_epoch.sql
+
+ALTER TABLE users ADD COLUMN session_epoch INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,3 @@
+-- SQLite version of sql/migrations/010_replace_staging.sql
+
+ALTER TABLE locations ADD COLUMN staging_for INTEGER NULL;
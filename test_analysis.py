@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import f_sf, rcbd
+
+# Montgomery, Design and Analysis of Experiments, Example 4.1: vascular
+# graft yield, 4 extrusion pressures in 6 resin batches (blocks)
+GRAFT = {
+    8500: [90.3, 89.2, 98.2, 93.9, 87.4, 97.9],
+    8700: [92.5, 89.5, 90.6, 94.7, 87.0, 95.8],
+    8900: [85.5, 90.8, 89.6, 86.2, 88.0, 93.4],
+    9100: [82.5, 89.5, 85.6, 87.4, 78.9, 90.7],
+}
+
+
+def graft():
+    return pd.DataFrame([
+        {"treatment": t, "replication": b + 1, "yield": v}
+        for t, values in GRAFT.items() for b, v in enumerate(values)
+    ])
+
+
+def test_textbook_anova():
+    result = rcbd(graft(), ["yield"])
+    anova = result["anova"].loc["yield"]
+
+    assert anova["df"].tolist() == [5, 3, 15, 23]
+    assert anova.loc["Treatment", "ss"] == pytest.approx(178.17, abs=0.01)
+    assert anova.loc["Block", "ss"] == pytest.approx(192.25, abs=0.01)
+    assert anova.loc["Error", "ss"] == pytest.approx(109.89, abs=0.01)
+    assert anova.loc["Total", "ss"] == pytest.approx(480.31, abs=0.01)
+    assert anova.loc["Treatment", "f"] == pytest.approx(8.11, abs=0.01)
+    assert anova.loc["Treatment", "p"] == pytest.approx(0.0019, abs=1e-4)
+
+    # complete data: adjusted means are the plain treatment means
+    means = graft().groupby("treatment")["yield"].mean()
+    np.testing.assert_allclose(result["means"]["yield"], means)
+    assert result["summary"].loc["yield", "mse"] == pytest.approx(7.33, abs=0.01)
+
+
+def test_traits_analysed_together_match_one_at_a_time():
+    wide = graft().assign(other=lambda d: d["yield"] ** 0.5 + d["replication"])
+    together = rcbd(wide, ["yield", "other"])
+    alone = rcbd(wide, ["other"])
+    pd.testing.assert_frame_equal(together["anova"].loc[["other"]], alone["anova"])
+
+
+def test_missing_plot_matches_least_squares():
+    wide = graft()
+    wide.loc[5, "yield"] = np.nan
+    anova = rcbd(wide, ["yield"])["anova"].loc["yield"]
+
+    # sequential sums of squares from explicit model fits
+    data = wide.dropna()
+    y = data["yield"].to_numpy()
+    ones = np.ones((len(y), 1))
+    blocks = pd.get_dummies(data["replication"], drop_first=True).to_numpy(float)
+    treatments = pd.get_dummies(data["treatment"], drop_first=True).to_numpy(float)
+
+    def rss(x):
+        fit = np.linalg.lstsq(x, y, rcond=None)[0]
+        return ((y - x @ fit) ** 2).sum()
+
+    rss_blocks = rss(np.hstack([ones, blocks]))
+    rss_full = rss(np.hstack([ones, blocks, treatments]))
+    assert anova.loc["Error", "df"] == 14
+    assert anova.loc["Error", "ss"] == pytest.approx(rss_full)
+    assert anova.loc["Treatment", "ss"] == pytest.approx(rss_blocks - rss_full)
+
+
+def test_nothing_to_analyse():
+    for wide, traits in ((graft().iloc[:0], ["yield"]), (graft(), [])):
+        result = rcbd(wide, traits)
+        assert all(frame.empty for frame in result.values())
+        assert list(result["means"].columns) == traits
+
+
+def test_f_sf():
+    # F(3, 15) upper 5% and 1% points
+    assert f_sf(3.29, 3, 15) == pytest.approx(0.05, abs=5e-4)
+    assert f_sf(5.42, 3, 15) == pytest.approx(0.01, abs=1e-4)
+    assert np.isnan(f_sf(1.0, 0, 15))
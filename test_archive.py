@@ -0,0 +1,84 @@
+import pytest
+
+import archive
+
+pytestmark = pytest.mark.skipif(not archive.AVAILABLE, reason="needs pyarrow")
+
+ROWS = [
+    ("E1", "L", 2024, "Kharif", 1, 1, "T1"),
+    ("E1", "L", 2024, "Kharif", 2, 1, "T2"),
+    ("E1", "L", 2025, "Kharif", 1, 1, "T1"),
+]
+VALUES = {(0, "h"): 1.0, (1, "h"): 3.0, (0, "note"): "tall", (2, "h"): 10.0}
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def season(repo, location, add_plots):
+    ids = add_plots(location, ROWS, VALUES, types={"note": "text"})
+    repo.set_status(location, "Submitted")
+    return ids
+
+
+def test_archive_season(repo, location, season):
+    out = archive.archive_season(repo, location, 2024, "Kharif", "admin")
+    assert (out["plots"], out["observations"]) == (2, 3)
+
+    df = archive.read_season(out["path"])
+    assert df["id"].tolist() == season[:2]
+    assert df["h"].tolist() == [1.0, 3.0]
+    assert df["note"].iloc[0] == "tall" and df["note"].isna().iloc[1]
+    assert repo.season_ids(location, 2024, "Kharif") == []
+    assert repo.season_ids(location, 2025, "Kharif") == [season[2]]
+    assert repo.archived_seasons(location)[["year", "season", "plots"]].values.tolist() == [[2024, "Kharif", 2]]
+
+
+def test_refuses_drafts_and_empty_seasons(repo, location, add_plots):
+    add_plots(location, ROWS, VALUES, types={"note": "text"})
+    with pytest.raises(ValueError, match="still in Draft"):
+        archive.archive_season(repo, location, 2024, "Kharif")
+    with pytest.raises(ValueError, match="No plots"):
+        archive.archive_season(repo, location, 2023, "Kharif")
+
+
+def test_rerun_after_finishing_changes_nothing(repo, location, season):
+    first = archive.archive_season(repo, location, 2024, "Kharif")
+    head = repo.change_head(location)
+    assert archive.archive_season(repo, location, 2024, "Kharif") == first
+    assert repo.change_head(location) == head
+
+
+def test_rerun_finishes_an_interrupted_archive(repo, location, season, monkeypatch):
+    def crash(ids, conn=None):
+        raise RuntimeError("connection lost")
+
+    with monkeypatch.context() as m:
+        m.setattr(repo, "delete_plots", crash)
+        with pytest.raises(RuntimeError):
+            archive.archive_season(repo, location, 2024, "Kharif")
+    assert len(repo.season_ids(location, 2024, "Kharif")) == 2
+
+    out = archive.archive_season(repo, location, 2024, "Kharif")
+    assert out["plots"] == 2
+    assert repo.season_ids(location, 2024, "Kharif") == []
+
+
+def test_new_plots_in_an_archived_season(repo, location, season, add_plots):
+    archive.archive_season(repo, location, 2024, "Kharif")
+    add_plots(location, ROWS[:1], {(0, "h"): 2.0})
+    with pytest.raises(ValueError, match="new plots since"):
+        archive.archive_season(repo, location, 2024, "Kharif")
+
+
+def test_compare_hot_and_archived(repo, location, season):
+    archive.archive_season(repo, location, 2024, "Kharif")
+    out = archive.compare(repo, location, "h")
+    assert out[["year", "season", "n", "mean", "source"]].values.tolist() == [
+        [2024, "Kharif", 2, 2.0, "archive"],
+        [2025, "Kharif", 1, 10.0, "current"],
+    ]
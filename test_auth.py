@@ -0,0 +1,93 @@
+import uuid
+
+import pytest
+
+import auth
+from auth import LoginThrottled, end_sessions, user_from_token, verify_user
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashes(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(auth, "_failures", {})
+
+
+@pytest.fixture
+def user(repo, location):
+    name = f"u{uuid.uuid4().hex[:8]}"
+    repo.create_user(name, auth.hash_password("secret"), "user", location)
+    return name
+
+
+def test_verify_user(user, location):
+    session = verify_user(user, "secret", ip="10.0.0.1")
+    assert {k: session[k] for k in ("username", "role", "location_id")} == \
+        {"username": user, "role": "user", "location_id": location}
+    assert user_from_token(session["token"])["username"] == user
+
+    assert verify_user(user, "wrong") is None
+    assert verify_user("nobody " + user, "secret") is None
+
+
+def test_old_hash_upgraded(repo, user, monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    assert verify_user(user, "secret")
+    assert auth.bcrypt_rounds(repo.user_by_name(user)["password_hash"]) == 5
+    assert verify_user(user, "secret")
+
+
+def test_throttled_after_failures(user, monkeypatch):
+    monkeypatch.setattr(auth, "LOGIN_MAX_FAILURES", 3)
+    for _ in range(3):
+        assert verify_user(user, "wrong") is None
+    # locked out even with the right password, until the window passes
+    with pytest.raises(LoginThrottled):
+        verify_user(user.upper(), "secret")
+
+    monkeypatch.setattr(auth, "LOGIN_WINDOW_SECONDS", 0)
+    assert verify_user(user, "secret")
+
+
+def test_throttled_per_address(user, monkeypatch):
+    monkeypatch.setattr(auth, "LOGIN_MAX_FAILURES_PER_IP", 2)
+    verify_user("a " + user, "x", ip="10.0.0.9")
+    verify_user("b " + user, "x", ip="10.0.0.9")
+    with pytest.raises(LoginThrottled):
+        verify_user(user, "secret", ip="10.0.0.9")
+    assert verify_user(user, "secret", ip="10.0.0.10")
+
+
+def test_success_clears_failures(user, monkeypatch):
+    monkeypatch.setattr(auth, "LOGIN_MAX_FAILURES", 2)
+    verify_user(user, "wrong")
+    assert verify_user(user, "secret")
+    verify_user(user, "wrong")
+    assert verify_user(user, "secret")
+
+
+def test_token_expires(user, monkeypatch):
+    monkeypatch.setattr(auth, "SESSION_TTL_SECONDS", -1)
+    token = verify_user(user, "secret")["token"]
+    assert user_from_token(token) is None
+
+
+def test_token_tampered(user):
+    token = verify_user(user, "secret")["token"]
+    body, sig = token.split(".")
+    assert user_from_token(f"{body}x.{sig}") is None
+    assert user_from_token("garbage") is None
+
+
+def test_logout_revokes_every_session(user):
+    first = verify_user(user, "secret")
+    second = verify_user(user, "secret")
+    end_sessions(first)
+    assert user_from_token(first["token"]) is None
+    assert user_from_token(second["token"]) is None
+    assert user_from_token(verify_user(user, "secret")["token"])
+
+
+def test_password_change_revokes(repo, user):
+    token = verify_user(user, "secret")["token"]
+    repo.set_password_hash(repo.user_by_name(user)["id"], auth.hash_password("other"))
+    assert user_from_token(token) is None
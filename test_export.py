@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from export import build_export, iter_changes, iter_wide
+
+
+def make(location, add_plots, plots=7, traits=("h", "w", "note")):
+    rows = [("E1", "L", 2024, "Kharif", p % 3 + 1, 1, f"T{p}") for p in range(plots)]
+    values = {}
+    for p in range(plots):
+        for i, t in enumerate(traits):
+            if (p + i) % 4:  # some cells missing, so plots span different row counts
+                values[(p, t)] = f"n{p}" if t == "note" else float(p * 10 + i)
+    return add_plots(location, rows, values, types={"note": "text"}), values
+
+
+def test_plots_split_across_chunks_come_out_whole(location, add_plots):
+    traits = ["h", "w", "note"]
+    ids, values = make(location, add_plots)
+    whole = pd.concat(iter_wide(location, "Draft", traits), ignore_index=True)
+
+    for chunk_rows in (1, 2, 3, 5, 100):
+        out = pd.concat(iter_wide(location, "Draft", traits, chunk_rows=chunk_rows), ignore_index=True)
+        pd.testing.assert_frame_equal(out, whole)
+
+    assert whole["treatment"].tolist() == [f"T{p}" for p in range(len(ids))]
+    for (p, t), v in values.items():
+        assert whole.at[p, t] == v
+    assert whole["h"].dtype == "float64" and whole["note"].dtype == "string"
+
+
+def test_status_filter(repo, location, add_plots):
+    make(location, add_plots)
+    assert list(iter_wide(location, "Submitted", ["h"])) == []
+    repo.set_status(location, "Submitted")
+    assert sum(len(c) for c in iter_wide(location, "Submitted", ["h"], chunk_rows=2)) == 7
+
+
+# -- changes since a checkpoint -------------------------------------------
+
+def test_changed_plots(repo, location, add_plots):
+    ids = add_plots(location, [("E1", "L", 2024, "Kharif", 1, 1, f"T{p}") for p in range(3)],
+                    {(p, "h"): 1.0 for p in range(3)})
+    start = repo.change_head(location)
+    repo.log_cells(location, {(ids[0], "h"): 2.0})
+    middle = repo.change_head(location)
+    repo.log_cells(location, {(ids[2], "h"): None})
+    head = repo.change_head(location)
+
+    assert repo.changed_plots(location, start, head) == ([ids[0], ids[2]], False)
+    assert repo.changed_plots(location, middle, head) == ([ids[2]], False)
+    assert repo.changed_plots(location, head, head) == ([], False)
+
+    repo.set_status(location, "Submitted")  # logged per plot, not as a rewrite
+    assert repo.changed_plots(location, head, repo.change_head(location)) == (ids, False)
+    repo.log_location(location, "upload")
+    assert repo.changed_plots(location, head, repo.change_head(location))[1]
+
+
+def test_iter_changes_marks_removed_rows(repo, location, add_plots):
+    rows = [("E1", "L", 2024, "Kharif", 1, 1, f"T{p}") for p in range(3)]
+    ids = add_plots(location, rows, {(0, "h"): 1.0, (1, "h"): 2.0, (2, "h"): 3.0, (0, "note"): "a"},
+                    types={"note": "text"})
+    repo.delete_observations([(ids[1], "h")], location)   # plot left without values
+    with repo.begin() as c:
+        c.execute(text("UPDATE experiment_metadata SET entry_status='Submitted' WHERE id=:id"), {"id": ids[2]})
+
+    out = pd.concat(iter_changes(location, "Draft", ["h", "note"], ids), ignore_index=True)
+    assert out["change"].tolist() == ["upsert", "removed", "removed"]
+    assert out.at[0, "h"] == 1.0 and out.at[0, "note"] == "a"
+    assert out["treatment"].tolist() == ["T0", "T1", "T2"]
+
+
+def test_changes_export_refused_after_a_rewrite(repo, location, add_plots):
+    add_plots(location, [("E1", "L", 2024, "Kharif", 1, 1, "T1")], {(0, "h"): 1.0})
+    since = repo.change_head(location)
+    repo.log_location(location, "upload")
+    with pytest.raises(ValueError, match="download everything"):
+        build_export(location, "Draft", "csv", since=since)
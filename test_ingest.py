@@ -0,0 +1,68 @@
+import io
+
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import text
+
+import ingest
+from ingest import ingest_excel, read_header
+
+HEADER = ["exp_id", "location", "year", "season", "replication", "block", "treatment"]
+
+
+def workbook(rows, header=HEADER + ["ht", "note"]):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(header)
+    for r in rows:
+        ws.append(r)
+    out = io.BytesIO()
+    wb.save(out)
+    out.seek(0)
+    return out
+
+
+def plot(rep, ht, note="ok", treatment="T1"):
+    return ["E1", "L", 2024, "Kharif", rep, 1, treatment, ht, note]
+
+
+def loaded(repo, location):
+    with repo.begin() as c:
+        return c.execute(text("""
+            SELECT m.replication,t.trait_name,o.attribute_value,o.text_value
+            FROM observation_data o
+            JOIN experiment_metadata m ON m.id=o.metadata_id
+            JOIN experiment_traits t ON t.id=o.trait_id
+            WHERE o.location_id=:loc ORDER BY m.id,t.id
+        """), {"loc": location}).all()
+
+
+def test_loads_plots_traits_and_values(repo, location):
+    stats = ingest_excel(repo, None, workbook([plot(1, 5.5, "wilted"), plot(2, None, None)]), location)
+    assert (stats["plots"], stats["observations"], stats["problems"]) == (2, 2, [])
+    assert stats["traits"] == ["ht", "note"] and stats["text_traits"] == ["note"]
+    assert loaded(repo, location) == [(1, "ht", 5.5, None), (1, "note", None, "wilted")]
+
+
+def test_problems_carry_the_sheet_row(repo, location, monkeypatch):
+    # rows 2 and 3 fine, 4 blank, 5 has a word in a number column; chunks
+    # of two so the bad row sits in a later chunk
+    monkeypatch.setattr(ingest, "COMMIT_ROWS", 2)
+    rows = [plot(1, 1.0), plot(2, 2.0), [None] * 9, plot(3, "tall"), plot("x", 4.0)]
+    stats = ingest_excel(repo, None, workbook(rows), location)
+    assert stats["plots"] == 4
+    assert stats["problems"] == [(5, "ht", "tall"), (6, "replication", "x")]
+
+
+def test_repeated_trait_header_becomes_its_own_column(repo, location):
+    file = workbook([["E1", "L", 2024, "Kharif", 1, 1, "T1", 1.0, 2.0]], header=HEADER + ["ht", "ht"])
+    assert read_header(file)[0][7:] == ["ht", "ht.1"]
+    stats = ingest_excel(repo, None, file, location)
+    assert stats["traits"] == ["ht", "ht.1"]
+    assert loaded(repo, location) == [(1, "ht", 1.0, None), (1, "ht.1", 2.0, None)]
+
+
+def test_header_only_sheet_is_refused(repo, location):
+    with pytest.raises(ValueError, match="no plot rows"):
+        ingest_excel(repo, None, workbook([]), location)
+    assert loaded(repo, location) == []
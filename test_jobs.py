@@ -0,0 +1,178 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+import jobs
+from bench.synth import trial_frame, write_workbook
+from db import cache
+from ingest import ingest_excel
+from jobs import get_runner, save_upload
+
+
+def wait_for(runner, job_id, *statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.repo.job(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} is {job['status']}, not {statuses}")
+
+
+@pytest.fixture
+def held(monkeypatch):
+    # A "hold" job runs until its release event is set, reporting progress
+    # (and so noticing cancels) while it waits
+    releases, started = {}, []
+
+    def hold(ctx, repo, location_id, params):
+        started.append(ctx.job_id)
+        release = releases.setdefault(ctx.job_id, threading.Event())
+        while not release.wait(0.02):
+            ctx.progress(0.5, "holding")
+        return {"location": location_id}
+
+    monkeypatch.setitem(jobs.KINDS, "hold", hold)
+    yield releases, started
+    for e in releases.values():
+        e.set()
+
+
+def release(releases, job_id):
+    releases.setdefault(job_id, threading.Event()).set()
+
+
+def test_claim_is_taken_once(repo, location):
+    job_id = repo.create_job("hold", location, "{}", "t", "elsewhere:1:x")
+    assert repo.start_job(job_id, location)
+    assert not repo.start_job(job_id, location)
+    repo.finish_job(job_id, "done")
+
+
+def test_one_running_job_per_location(repo, location):
+    repo.add_location(f"other than {location}")
+    cache.invalidate("locations")
+    elsewhere = int(repo.locations().set_index("name").at[f"other than {location}", "id"])
+    first = repo.create_job("hold", location, "{}", "t", "elsewhere:1:x")
+    second = repo.create_job("hold", location, "{}", "t", "elsewhere:1:x")
+    other = repo.create_job("hold", elsewhere, "{}", "t", "elsewhere:1:x")
+    assert repo.start_job(first, location)
+    assert not repo.start_job(second, location)
+    assert repo.start_job(other, elsewhere)
+
+    repo.finish_job(first, "done")
+    assert repo.start_job(second, location)
+    for j in (second, other):
+        repo.finish_job(j, "done")
+
+
+def test_runner_serializes_a_location(location, held):
+    releases, started = held
+    runner = get_runner()
+    first = runner.submit("hold", location)
+    second = runner.submit("hold", location)
+    wait_for(runner, first, "running")
+    time.sleep(0.3)
+    assert runner.repo.job(second)["status"] == "queued"
+
+    release(releases, first)
+    wait_for(runner, first, "done")
+    wait_for(runner, second, "running")
+    release(releases, second)
+    assert wait_for(runner, second, "done")["result"] == f'{{"location": {location}}}'
+    assert started == [first, second]
+
+
+def test_cancel_queued_never_runs(location, held):
+    releases, started = held
+    runner = get_runner()
+    first = runner.submit("hold", location)
+    wait_for(runner, first, "running")
+    queued = runner.submit("hold", location)
+    runner.cancel(queued)
+    assert runner.repo.job(queued)["status"] == "cancelled"
+
+    release(releases, first)
+    wait_for(runner, first, "done")
+    time.sleep(0.3)
+    assert queued not in started
+
+
+def test_cancel_running(location, held):
+    runner = get_runner()
+    job_id = runner.submit("hold", location)
+    wait_for(runner, job_id, "running")
+    runner.cancel(job_id)
+    job = wait_for(runner, job_id, "cancelled")
+    assert job["message"] == "Cancelled; nothing was changed"
+
+
+def test_cancelled_delete_still_clears(repo, location, add_plots, monkeypatch):
+    add_plots(location, [("E1", "L", 2024, "Kharif", 1, 1, "T1")], {(0, "h"): 1.0})
+
+    def cancelled(*args, **kwargs):
+        raise jobs.JobCancelled()
+
+    monkeypatch.setattr(jobs, "_delete", cancelled)
+    runner = get_runner()
+    job = wait_for(runner, runner.submit("delete", location), "cancelled")
+    assert job["message"] == "Cancelled; this location's data was cleared"
+    assert repo.season_ids(location, 2024, "Kharif") == []
+
+
+# -- replace --------------------------------------------------------------
+
+def upload(df):
+    buf = io.BytesIO()
+    write_workbook(df, buf)
+    return save_upload(buf)
+
+
+def plot_count(repo, location):
+    with repo.begin() as c:
+        return c.execute(
+            text("SELECT COUNT(*) FROM experiment_metadata WHERE location_id=:loc"), {"loc": location}
+        ).scalar()
+
+
+def test_replace_swaps_in_the_new_experiment(repo, location, add_plots):
+    add_plots(location, [("E1", "L", 2024, "Kharif", 1, 1, "T1")], {(0, "old"): 1.0})
+    runner = get_runner()
+    job = wait_for(runner, runner.submit("replace", location, {"path": upload(trial_frame(12, traits=2))}), "done")
+
+    assert json.loads(job["result"])["plots"] == 12
+    assert plot_count(repo, location) == 12
+    assert repo.active_traits(location) == ["trait_00", "trait_01"]
+    assert repo.staging_locations(location) == []
+
+
+@pytest.mark.parametrize("outcome", ["failed", "cancelled"])
+def test_replace_keeps_the_old_experiment(repo, location, add_plots, monkeypatch, outcome):
+    add_plots(location, [("E1", "L", 2024, "Kharif", 1, 1, "T1")], {(0, "old"): 1.0})
+    seen = []
+
+    def stopped(repo, *args, **kwargs):
+        ingest_excel(repo, *args, **kwargs)
+        seen.append(plot_count(repo, location))  # readers still see the old plot
+        raise jobs.JobCancelled() if outcome == "cancelled" else RuntimeError("broken")
+
+    monkeypatch.setattr(jobs, "ingest_excel", stopped)
+    runner = get_runner()
+    wait_for(runner, runner.submit("replace", location, {"path": upload(trial_frame(12))}), outcome)
+
+    assert seen == [1] and plot_count(repo, location) == 1
+    assert repo.active_traits(location) == ["old"]
+    assert repo.staging_locations(location) == []
+
+
+def test_replace_with_an_empty_sheet_fails(repo, location, add_plots):
+    add_plots(location, [("E1", "L", 2024, "Kharif", 1, 1, "T1")], {(0, "old"): 1.0})
+    runner = get_runner()
+    job = wait_for(runner, runner.submit("replace", location, {"path": upload(trial_frame(12).head(0))}), "failed")
+    assert job["message"] == "The sheet has no plot rows below the header"
+    assert plot_count(repo, location) == 1
+    assert repo.staging_locations(location) == []
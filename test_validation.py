@@ -0,0 +1,44 @@
+import validation
+from db import cache
+
+
+def setup(repo, location, add_plots, plots=30):
+    rows = [("E1", "L", 2024, "Kharif", p % 3 + 1, 1, f"T{p}") for p in range(plots)]
+    values = {(p, "h"): 10.0 + (p % 5) * 0.5 for p in range(plots)}
+    values.update({(p, "note"): "ok" for p in range(plots)})
+    ids = add_plots(location, rows, values, types={"note": "text"})
+    traits = repo.traits(location)
+    h = int(traits.loc[traits["trait_name"] == "h", "id"].iloc[0])
+    repo.set_trait_bounds([(h, "cm", 0.0, 50.0)])
+    cache.invalidate("experiment_traits", location_id=location)
+    return ids, validation.bounds(repo.traits(location))
+
+
+def test_clean_values_pass(repo, location, add_plots):
+    ids, limits = setup(repo, location, add_plots)
+    problems = validation.check(location, {(ids[0], "h"): 11.0, (ids[1], "note"): "x"}, limits)
+    assert problems.empty
+    assert list(problems.columns) == validation.COLUMNS
+
+
+def test_all_problems_in_one_table(repo, location, add_plots):
+    ids, limits = setup(repo, location, add_plots)
+    values = {
+        (ids[0], "h"): 60.0,            # above the maximum
+        (ids[1], "h"): float("nan"),    # not a number
+        (ids[2], "h"): 30.0,            # within bounds, far from the rest
+        (ids[3], "h"): 0.0,             # no zeros here
+        (ids[4], "h"): None,            # blank: not checked
+        (ids[5], "note"): "typo",       # text: not checked
+    }
+    problems = validation.check(location, values, limits)
+    found = {(r.metadata_id, r.severity) for r in problems.itertuples()}
+    assert found == {(ids[0], "error"), (ids[1], "error"), (ids[2], "warning"), (ids[3], "warning")}
+    assert problems["severity"].tolist() == ["error", "error", "warning", "warning"]
+    assert "50 cm" in problems.loc[problems["metadata_id"] == ids[0], "problem"].iloc[0]
+
+
+def test_few_values_only_check_bounds(repo, location, add_plots):
+    ids, limits = setup(repo, location, add_plots, plots=5)
+    problems = validation.check(location, {(ids[0], "h"): 30.0, (ids[1], "h"): -1.0}, limits)
+    assert problems[["metadata_id", "severity"]].values.tolist() == [[ids[1], "error"]]
@@ -0,0 +1,130 @@
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from db import metrics
+from db import wide as wide_store
+
+# Checks on the cells a Save is about to write, run over all of them at once
+# before anything is written, so every problem comes back in one table:
+#   error    not a finite number, or outside the trait's min_value/max_value
+#   warning  outlier against the location's values of that trait: robust
+#            z-score (median/MAD) above Z_LIMIT, or outside the IQR_FENCE x IQR
+#            fences where the MAD is 0; only once the trait has MIN_VALUES
+#   warning  0 for a trait with no zeros at this location (a blank cell means
+#            "not measured" and is not saved; 0 is a measurement)
+# Errors block the save, warnings need the user to confirm. Text traits are
+# not checked.
+Z_LIMIT = 3.5
+IQR_FENCE = 3.0
+MIN_VALUES = 20
+# The distribution is a reference, not the data being edited: reuse it for a
+# few minutes instead of rebuilding it after every save
+STATS_TTL_SECONDS = 300
+MAX_LOCATIONS = 16
+COLUMNS = ["metadata_id", "trait", "value", "severity", "problem"]
+
+_lock = threading.Lock()
+_stats = OrderedDict()
+
+
+def bounds(traits_df):
+    # repo.traits() rows -> unit/min_value/max_value per number trait; a name
+    # listed twice uses its oldest row, as the write paths do
+    number = traits_df[traits_df["data_type"] != "text"].sort_values("id")
+    limits = number.drop_duplicates("trait_name").set_index("trait_name")
+    return limits[["unit", "min_value", "max_value"]].astype(
+        {"min_value": float, "max_value": float}
+    )
+
+
+def distribution(location_id):
+    # Per active number trait: count, median, MAD, quartiles and whether any
+    # value is 0, over every active plot of the location
+    now = time.monotonic()
+    with _lock:
+        hit = _stats.get(location_id)
+        if hit and now - hit[0] < STATS_TTL_SECONDS:
+            return hit[1]
+
+    with metrics.span("validate.stats"):
+        wide, traits = wide_store.get_wide(location_id, active_only=True)
+        traits = [t for t in traits if pd.api.types.is_float_dtype(wide[t])]
+        y = wide[traits].to_numpy(dtype=float).reshape(len(wide), len(traits))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)    # all-NaN traits
+            median = np.nanmedian(y, axis=0)
+            mad = np.nanmedian(np.abs(y - median), axis=0)
+            q1, q3 = np.nanpercentile(y, [25, 75], axis=0)
+        stats = pd.DataFrame({
+            "n": (~np.isnan(y)).sum(axis=0),
+            "median": median,
+            "mad": mad,
+            "q1": q1,
+            "q3": q3,
+            "zeros": (y == 0).any(axis=0),
+        }, index=pd.Index(traits, name="trait"))
+
+    with _lock:
+        _stats[location_id] = (now, stats)
+        _stats.move_to_end(location_id)
+        while len(_stats) > MAX_LOCATIONS:
+            _stats.popitem(last=False)
+    return stats
+
+
+def _num(values, unit=None):
+    text = pd.Series(values).map("{:.4g}".format)
+    if unit is None:
+        return text
+    return text + (" " + unit).where(unit != "", "")
+
+
+def check(location_id, values, limits):
+    # values: {(metadata_id, trait): value} about to be written; limits:
+    # bounds(). Returns one row per problem (COLUMNS), errors first.
+    cells = pd.DataFrame(
+        [(mid, t, v) for (mid, t), v in values.items() if v is not None and t in limits.index],
+        columns=["metadata_id", "trait", "value"]
+    )
+    if cells.empty:
+        return pd.DataFrame(columns=COLUMNS)
+
+    with metrics.span("validate.check"):
+        x = cells["value"].to_numpy(dtype=float)
+        lim = limits.reindex(cells["trait"]).reset_index(drop=True)
+        ref = distribution(location_id).reindex(cells["trait"]).reset_index(drop=True)
+        unit = lim["unit"].fillna("").astype(str)
+        lo, hi = lim["min_value"].to_numpy(), lim["max_value"].to_numpy()
+        median, mad = ref["median"].to_numpy(), ref["mad"].to_numpy()
+        q1, q3 = ref["q1"].to_numpy(), ref["q3"].to_numpy()
+
+        finite = np.isfinite(x)
+        enough = finite & (ref["n"].fillna(0).to_numpy() >= MIN_VALUES)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.abs(0.6745 * (x - median) / mad)
+            iqr = q3 - q1
+            fenced = (x < q1 - IQR_FENCE * iqr) | (x > q3 + IQR_FENCE * iqr)
+        bounded = (x < lo) | (x > hi)
+        outlier = enough & ~bounded & np.where(mad > 0, z > Z_LIMIT, (iqr > 0) & fenced)
+        zero = enough & (x == 0) & ~ref["zeros"].fillna(True).astype(bool).to_numpy()
+
+        found = [
+            ("error", ~finite, pd.Series("not a number", index=cells.index)),
+            ("error", x < lo, "below the minimum of " + _num(lo, unit)),
+            ("error", x > hi, "above the maximum of " + _num(hi, unit)),
+            ("warning", outlier & ~zero,
+             "far outside the usual " + _num(q1) + "–" + _num(q3, unit) + " at this location"),
+            ("warning", zero, pd.Series(
+                "0, but this trait has no zeros here; leave blank if not measured", index=cells.index
+            )),
+        ]
+        problems = pd.concat([
+            cells[mask].assign(severity=severity, problem=message[mask])
+            for severity, mask, message in found
+        ])
+    return problems.sort_values(["severity", "metadata_id"], kind="stable").reset_index(drop=True)[COLUMNS]